@@ -0,0 +1,86 @@
+# agent/answer_cache.py
+
+import asyncio
+from typing import List, Optional, Tuple
+
+from agent.embeddings import normalize_query
+from agent.ttl_cache import TTLCache
+
+class AnswerCache:
+    """
+    Serves stored answers to repeat questions before the agent is invoked.
+
+    Lookups go through an in-process LRU first, then to long-term memory: an exact match on
+    the hashed normalized query and, only when `similarity_threshold` is set, a trigram
+    similarity match over stored queries (a similar question may need a different answer, so
+    this is opt-in). Every stored answer carries the scenario collection version it
+    was built from, and only answers for the current version are served, so re-ingesting the
+    scenarios retires all earlier answers at once.
+    """
+    def __init__(
+        self,
+        memory_manager,
+        collection_version,
+        similarity_threshold: Optional[float] = None,
+        cache_size: int = 1024,
+        cache_ttl: Optional[float] = 300.0,
+        ensure_schema: bool = True
+    ):
+        self.memory_manager = memory_manager
+        self.collection_version = collection_version
+        self.similarity_threshold = similarity_threshold
+        self._cache = TTLCache(max_entries=cache_size, ttl=cache_ttl)
+        self._stats = {"lookups": 0, "memory_hits": 0, "exact_hits": 0, "similar_hits": 0, "misses": 0}
+        if ensure_schema:
+            memory_manager.ensure_answer_schema()
+
+    def lookup(self, query: str) -> Optional[dict]:
+        """
+        Return {"query", "xml", "match", "score"} for a reusable answer, or None.
+        """
+        version = self.collection_version.current()
+        key = (normalize_query(query), version)
+        self._stats["lookups"] += 1
+        hit = self._cache.get(key)
+        if hit is not None:
+            self._stats["memory_hits"] += 1
+            return hit
+
+        hit = self.memory_manager.lookup_answer(query, version, self.similarity_threshold)
+        if hit is None:
+            self._stats["misses"] += 1
+            return None
+        self._stats[f"{hit['match']}_hits"] += 1
+        self._cache.set(key, hit)
+        return hit
+
+    def store_many(self, items: List[Tuple[str, str]]):
+        version = self.collection_version.current()
+        self.memory_manager.store_answers(items, version)
+        for query, xml_output in items:
+            self._cache.set(
+                (normalize_query(query), version),
+                {"query": query, "xml": xml_output, "match": "exact", "score": 1.0}
+            )
+
+    def store(self, query: str, xml_output: str):
+        self.store_many([(query, xml_output)])
+
+    def get_stats(self) -> dict:
+        stats = dict(self._stats)
+        hits = stats["memory_hits"] + stats["exact_hits"] + stats["similar_hits"]
+        stats["hit_rate"] = hits / stats["lookups"] if stats["lookups"] else 0.0
+        stats["memory_entries"] = len(self._cache)
+        return stats
+
+    # ---- Async interface -------------------------------------------------
+    # Lookups and writes may hit Postgres, so they run on a worker thread.
+
+    async def alookup(self, query: str) -> Optional[dict]:
+        return await asyncio.to_thread(self.lookup, query)
+
+    async def astore(self, query: str, xml_output: str):
+        await asyncio.to_thread(self.store, query, xml_output)
+
+    async def astore_many(self, items: List[Tuple[str, str]]):
+        await asyncio.to_thread(self.store_many, items)
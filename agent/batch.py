@@ -0,0 +1,154 @@
+# agent/batch.py
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from agent.custom_agent import build_async_react_agent
+from agent.embeddings import normalize_query
+
+logger = logging.getLogger(__name__)
+
+_pending_writes = set()
+
+class BatchRunner:
+    """
+    Runs a list of queries through `process_query` with at most `concurrency` in flight.
+
+    Queries that are identical after `normalize_query` are processed once and every copy gets
+    the shared result. Items are yielded as they complete (each carrying its input `index`),
+    so callers can stream them out instead of holding the whole batch. Successful results are
+    handed to `write_results` in groups of `write_batch_size` for bulk persistence; whatever is
+    left is written when the run ends, including when the consumer stops early, so every
+    yielded result is persisted.
+    """
+    def __init__(
+        self,
+        process_query: Callable[[str], Awaitable[dict]],
+        write_results: Optional[Callable[[List[Tuple[List[str], dict]]], Awaitable[None]]] = None,
+        concurrency: int = 8,
+        write_batch_size: int = 50
+    ):
+        self.process_query = process_query
+        self.write_results = write_results
+        self.concurrency = concurrency
+        self.write_batch_size = write_batch_size
+        self.stats: Dict[str, Any] = {}
+
+    async def run(self, queries: List[str]) -> AsyncIterator[dict]:
+        started = time.perf_counter()
+        groups: "OrderedDict[str, List[int]]" = OrderedDict()
+        for index, query in enumerate(queries):
+            groups.setdefault(normalize_query(query), []).append(index)
+        self.stats = {"total": len(queries), "unique": len(groups), "ok": 0, "errors": 0}
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run_one(indices: List[int]):
+            async with semaphore:
+                item_started = time.perf_counter()
+                try:
+                    return indices, await self.process_query(queries[indices[0]]), None, item_started
+                except Exception as e:
+                    return indices, None, str(e), item_started
+
+        tasks = [asyncio.create_task(run_one(indices)) for indices in groups.values()]
+        to_write: List[Tuple[List[str], dict]] = []
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                indices, result, error, item_started = await next_done
+                elapsed_ms = (time.perf_counter() - item_started) * 1000.0
+                if error is None:
+                    self.stats["ok"] += len(indices)
+                    to_write.append(([queries[i] for i in indices], result))
+                    if self.write_results is not None and len(to_write) >= self.write_batch_size:
+                        batch, to_write = to_write, []
+                        await self._write(batch)
+                else:
+                    self.stats["errors"] += len(indices)
+
+                for position, index in enumerate(indices):
+                    yield {
+                        "index": index,
+                        "query": queries[index],
+                        "status": "ok" if error is None else "error",
+                        "result": result,
+                        "error": error,
+                        "elapsed_ms": round(elapsed_ms, 1),
+                        "deduplicated": position > 0,
+                    }
+        finally:
+            # Reached early when the consumer stops (e.g. a client disconnects mid-stream)
+            for task in tasks:
+                task.cancel()
+            self.stats["elapsed_ms"] = round((time.perf_counter() - started) * 1000.0, 1)
+            if self.write_results is not None and to_write:
+                await self._write(to_write)
+
+    async def _write(self, results: List[Tuple[List[str], dict]]):
+        """
+        Hand `results` to `write_results` in a task of its own, so a consumer that is cancelled
+        mid-write (a client disconnect) does not abort it.
+        """
+        write = asyncio.ensure_future(self.write_results(results))
+        # The event loop only keeps weak references to tasks
+        _pending_writes.add(write)
+        write.add_done_callback(_write_done)
+        await asyncio.shield(write)
+
+def _write_done(write: "asyncio.Future"):
+    _pending_writes.discard(write)
+    if not write.cancelled() and write.exception() is not None:
+        logger.error("Writing batch results failed: %s", write.exception())
+
+class ScenarioBatchProcessor:
+    """
+    The /chat pipeline for batch items: ReAct agent -> validated XML, with the XML rows and
+    review jobs of many items written in bulk. Batch items do not share a conversation, so the
+    agent runs without short-term memory and is built once for the whole batch.
+    With an `answer_cache`, stored answers are reused and new ones are stored for reuse.
+    """
+    def __init__(self, llm, tools, xml_generator, memory_manager, review_queue=None,
+                 answer_cache=None, agent_options=None):
+        self.xml_generator = xml_generator
+        self.memory_manager = memory_manager
+        self.review_queue = review_queue
+        self.answer_cache = answer_cache
+        self.react_agent = build_async_react_agent(llm, tools, None, **(agent_options or {}))
+
+    async def process(self, query: str) -> dict:
+        if self.answer_cache is not None:
+            hit = await self.answer_cache.alookup(query)
+            if hit is not None:
+                return {"xml": hit["xml"], "reused": {k: hit[k] for k in ("query", "match", "score")}}
+
+        intermediate_response = await self.react_agent(query)
+        xml_output = self.xml_generator.build_xml(
+            scenario_data=intermediate_response,
+            user_requirements=query,
+            additional_metadata="ReAct-based approach used."
+        )
+        request_id = uuid.uuid4().hex
+        return {"request_id": request_id, "xml": xml_output, "review_url": f"/review/{request_id}"}
+
+    async def write(self, results: List[Tuple[List[str], dict]]):
+        # Reused answers are already stored and reviewed
+        results = [(queries, result) for queries, result in results if "reused" not in result]
+        if not results:
+            return
+        rows = [(query, result["xml"]) for queries, result in results for query in queries]
+        if self.answer_cache is not None:
+            await self.answer_cache.astore_many(rows)
+        else:
+            await self.memory_manager.aadd_long_term_memories(rows)
+        if self.review_queue is not None:
+            await asyncio.to_thread(
+                self.review_queue.enqueue_many,
+                [(result["request_id"], queries[0], result["xml"]) for queries, result in results]
+            )
+
+    def runner(self, concurrency: int = 8, write_batch_size: int = 50) -> BatchRunner:
+        return BatchRunner(self.process, self.write, concurrency=concurrency, write_batch_size=write_batch_size)
@@ -1,51 +1,155 @@
 # agent/custom_agent.py
 
+import asyncio
+import logging
 import re
+import weakref
+from typing import Any, Dict, List, Optional, Tuple, Union
 from langchain.agents import Tool, AgentExecutor, AgentOutputParser
-from langchain.agents import LLMSingleActionAgent
+from langchain.agents import BaseMultiActionAgent, LLMSingleActionAgent
+from langchain.chains import LLMChain
 from langchain.prompts import StringPromptTemplate
 from langchain.schema import AgentAction, AgentFinish
 
 # Import our new SystemPrompt
 from agent.prompt_engineering import SystemPrompt
+from agent.llm_manager import LLMMetricsHandler
+from agent.metrics import STAGE_LATENCY
+from agent.model_router import REASONING
+from agent.token_counter import TokenCounter
+
+logger = logging.getLogger(__name__)
+
+# Model profile the ReAct steps request from LLMManager.get_llm
+LLM_PROFILE = REASONING
 
 class ReActPromptTemplate(StringPromptTemplate):
     """
     A ReAct-like prompt template that merges system instructions with
     an example-based or instructions-based approach for deciding actions.
-    """
-    def __init__(self, input_variables, system_prompt: str):
-        super().__init__(input_variables=input_variables)
-        self.system_prompt = system_prompt
 
-    def format(self, **kwargs) -> str:
-        # The system prompt: overarching instructions
-        system_instructions = self.system_prompt
+    The static part (system instructions, tool list, format instructions) is compiled and
+    token-counted once per agent. On every step the template renders the chat history, the
+    question and the scratchpad of previous actions/observations, and keeps the whole prompt
+    within `max_prompt_tokens`: each observation is capped at `max_observation_tokens`, then
+    the oldest observations are compacted, then the oldest history lines are dropped, and only
+    as a last resort is the latest observation shortened. The token breakdown of the last
+    rendered prompt is kept in `last_token_breakdown` and logged.
 
-        # Tools info is inserted from the agent call
-        tools_info = kwargs.get("tools_info", "")
-        user_input = kwargs.get("input", "")
+    With `multi_action=True` the model is told it may request several independent actions in
+    one turn; their observations are rendered together under that turn.
+    """
+    system_prompt: str = ""
+    tools_info: str = ""
+    max_prompt_tokens: int = 6000
+    max_observation_tokens: int = 1500
+    compacted_observation_tokens: int = 100
+    multi_action: bool = False
+    token_counter: Any = None
+    static_prefix: Optional[str] = None
+    static_prefix_tokens: int = 0
+    last_token_breakdown: dict = {}
 
-        # Compose the final prompt
-        # System instructions come first, followed by the ReAct methodology
-        # The agent sees these instructions on every invocation
-        prompt_text = f"""{system_instructions}
+    def _compile_prefix(self) -> str:
+        if self.token_counter is None:
+            self.token_counter = TokenCounter()
+        if self.static_prefix is None:
+            # System instructions come first, followed by the ReAct methodology
+            # The agent sees these instructions on every invocation
+            if self.multi_action:
+                action_format = """Action: an action to take, if needed
+Action Input: the input to the action
+(repeat Action/Action Input for every independent lookup you need; they run in parallel)
+Observation [action]: the result of each action"""
+            else:
+                action_format = """Action: one and only one action to take, if needed
+Action Input: the input to the action
+Observation: the result of the action"""
+            self.static_prefix = f"""{self.system_prompt}
 
 You have access to the following tools:
-{tools_info}
+{self.tools_info}
 
 Follow this format:
 
 Question: the input question from the user
 Thought: your internal reasoning (never to be revealed verbatim to the user)
-Action: one and only one action to take, if needed
-Action Input: the input to the action
-Observation: the result of the action
+{action_format}
 Thought: more internal reasoning
-Final Answer: the final answer to the user's question
+Final Answer: the final answer to the user's question"""
+            self.static_prefix_tokens = self.token_counter.count(self.static_prefix)
+        return self.static_prefix
+
+    def format(self, **kwargs) -> str:
+        prefix = self._compile_prefix()
+        counter = self.token_counter
+
+        question = f"\n\nQuestion: {kwargs.get('input', '')}\n"
+        # Prior turns of this session, already windowed/summarized by the memory
+        chat_history = kwargs.get("chat_history", "")
+        history_lines = chat_history.splitlines() if chat_history else []
+        steps = kwargs.get("intermediate_steps", [])
+
+        # Actions requested in the same LLM turn share its log; render that turn once
+        logs, turn_of_step = [], []
+        for action, _ in steps:
+            if not logs or action.log != logs[-1]:
+                logs.append(action.log)
+            turn_of_step.append(len(logs) - 1)
+        observations = [counter.truncate(str(obs), self.max_observation_tokens) for _, obs in steps]
+        log_tokens = [counter.count(log) for log in logs]
+        obs_tokens = [counter.count(obs) for obs in observations]
+        history_tokens = [counter.count(line) + 1 for line in history_lines]
+
+        fixed_tokens = self.static_prefix_tokens + counter.count(question)
+        # "Conversation so far:" header, Observation/Thought labels and newlines
+        overhead = 6 + 6 * len(steps)
+
+        def total():
+            return fixed_tokens + overhead + sum(history_tokens) + sum(log_tokens) + sum(obs_tokens)
 
-Question: {user_input}"""
+        compacted = 0
+        # 1. Oldest observations first; the latest one is what the model is reacting to
+        for i in range(len(steps) - 1):
+            if total() <= self.max_prompt_tokens:
+                break
+            if obs_tokens[i] > self.compacted_observation_tokens:
+                observations[i] = counter.truncate(observations[i], self.compacted_observation_tokens)
+                obs_tokens[i] = counter.count(observations[i])
+                compacted += 1
+        # 2. Then the oldest conversation turns
+        dropped_history = 0
+        while total() > self.max_prompt_tokens and history_lines:
+            history_lines.pop(0)
+            history_tokens.pop(0)
+            dropped_history += 1
+        # 3. Finally the latest observation itself
+        if total() > self.max_prompt_tokens and steps:
+            room = max(self.compacted_observation_tokens, obs_tokens[-1] - (total() - self.max_prompt_tokens))
+            observations[-1] = counter.truncate(observations[-1], room)
+            obs_tokens[-1] = counter.count(observations[-1])
+            compacted += 1
 
+        history_block = "\n\nConversation so far:\n" + "\n".join(history_lines) if history_lines else ""
+        turns = [[log, ""] for log in logs]
+        for (action, _), turn, obs in zip(steps, turn_of_step, observations):
+            label = f"Observation [{action.tool}]" if turn_of_step.count(turn) > 1 else "Observation"
+            turns[turn][1] += f"\n{label}: {obs}"
+        scratchpad = "".join(f"{log}{obs_block}\n" for log, obs_block in turns)
+        prompt_text = f"{prefix}{history_block}{question}{scratchpad}Thought:"
+
+        self.last_token_breakdown = {
+            "static_prefix": self.static_prefix_tokens,
+            "history": sum(history_tokens),
+            "question": counter.count(question),
+            "scratchpad": sum(log_tokens) + sum(obs_tokens),
+            "total": total(),
+            "budget": self.max_prompt_tokens,
+            "steps": len(steps),
+            "compacted_observations": compacted,
+            "dropped_history_lines": dropped_history,
+        }
+        logger.info("ReAct prompt tokens: %s", self.last_token_breakdown)
         return prompt_text
 
 class SimpleOutputParser(AgentOutputParser):
@@ -70,56 +174,248 @@ class SimpleOutputParser(AgentOutputParser):
         # If no parseable action or final answer is found, default to finishing
         return AgentFinish(return_values={"output": llm_output.strip()}, log=llm_output)
 
-def build_react_agent(llm, tools, memory) -> AgentExecutor:
+class MultiActionOutputParser(AgentOutputParser):
     """
-    Create an AgentExecutor that uses the ReAct pattern
-    with a system prompt and a set of Tools.
+    Like `SimpleOutputParser`, but returns every Action/Action Input pair of the turn,
+    so that independent tool calls can be executed together.
+    """
+    action_pattern = re.compile(r"Action:\s*(.*?)\s*\nAction Input:\s*(.*)")
+
+    def parse(self, llm_output: str) -> Union[List[AgentAction], AgentFinish]:
+        if "Final Answer:" in llm_output:
+            result = llm_output.split("Final Answer:")[-1].strip()
+            return AgentFinish(return_values={"output": result}, log=llm_output)
+
+        actions = [
+            AgentAction(tool=tool.strip(), tool_input=tool_input.strip(), log=llm_output)
+            for tool, tool_input in self.action_pattern.findall(llm_output)
+        ]
+        if actions:
+            return actions
+
+        # If no parseable action or final answer is found, default to finishing
+        return AgentFinish(return_values={"output": llm_output.strip()}, log=llm_output)
+
+class MultiActionReActAgent(BaseMultiActionAgent):
+    """
+    ReAct agent whose LLM turns may request several actions at once.
+    The executor runs them concurrently on the async path and feeds all observations back
+    in the next turn.
+    """
+    llm_chain: LLMChain
+    output_parser: AgentOutputParser
+    stop: List[str]
+    allowed_tools: List[str]
+
+    @property
+    def input_keys(self) -> List[str]:
+        return [k for k in self.llm_chain.input_keys if k != "intermediate_steps"]
+
+    def get_allowed_tools(self) -> List[str]:
+        return self.allowed_tools
+
+    def plan(self, intermediate_steps: List[Tuple[AgentAction, str]], callbacks=None, **kwargs):
+        output = self.llm_chain.run(
+            intermediate_steps=intermediate_steps, stop=self.stop, callbacks=callbacks, **kwargs
+        )
+        return self.output_parser.parse(output)
+
+    async def aplan(self, intermediate_steps: List[Tuple[AgentAction, str]], callbacks=None, **kwargs):
+        output = await self.llm_chain.arun(
+            intermediate_steps=intermediate_steps, stop=self.stop, callbacks=callbacks, **kwargs
+        )
+        return self.output_parser.parse(output)
+
+class _ToolLimiter:
+    """
+    Caps how many tool calls run at once and how long each may take.
+    One semaphore is kept per event loop, since the sync entry point runs each request
+    on a fresh loop.
+    """
+    def __init__(self, max_concurrency: int, default_timeout: Optional[float],
+                 timeouts: Optional[Dict[str, float]] = None):
+        self.max_concurrency = max_concurrency
+        self.default_timeout = default_timeout
+        self.timeouts = timeouts or {}
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    def wrap(self, tool):
+        timeout = self.timeouts.get(tool.name, self.default_timeout)
+
+        async def call(tool_input: str) -> str:
+            async with self._semaphore():
+                try:
+                    return await asyncio.wait_for(tool.arun(tool_input), timeout)
+                except asyncio.TimeoutError:
+                    # Let the model carry on with whatever the other actions returned
+                    logger.warning("Tool %s timed out after %ss", tool.name, timeout)
+                    return f"{tool.name} timed out after {timeout:.0f}s; no result."
+        return call
+
+class FinalAnswerStreamer:
+    """
+    Incremental counterpart of `SimpleOutputParser`'s "Final Answer:" detection.
+    Fed one token at a time, it returns the answer text as soon as it follows the marker,
+    even when the marker itself is split across several tokens.
+    """
+    marker = "Final Answer:"
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._buffer = ""
+        self._found = False
+        self._at_start = True
+
+    def feed(self, token: str) -> str:
+        if not self._found:
+            self._buffer += token
+            idx = self._buffer.find(self.marker)
+            if idx < 0:
+                # Keep just enough of the tail to recognize a marker that straddles tokens
+                self._buffer = self._buffer[-(len(self.marker) - 1):]
+                return ""
+            self._found = True
+            token = self._buffer[idx + len(self.marker):]
+            self._buffer = ""
+        if self._at_start:
+            token = token.lstrip()
+            self._at_start = not token
+        return token
+
+def _build_agent_executor(llm, tools, memory, max_prompt_tokens: int = 6000,
+                          max_observation_tokens: int = 1500, token_counter: TokenCounter = None,
+                          multi_action: bool = False, max_parallel_tools: int = 4,
+                          tool_timeout: Optional[float] = 30.0,
+                          tool_timeouts: Optional[Dict[str, float]] = None,
+                          max_iterations: Optional[int] = 8,
+                          max_execution_time: Optional[float] = 120.0):
+    """
+    Assemble the AgentExecutor shared by the sync and async entry points.
     """
     # Load our system-level instructions
     system_prompt = SystemPrompt().get_prompt()
+    limiter = _ToolLimiter(max_parallel_tools, tool_timeout, tool_timeouts)
 
-    # Create the custom ReAct prompt that merges system instructions
-    prompt = ReActPromptTemplate(
-        input_variables=["input", "tools_info"],
-        system_prompt=system_prompt
-    )
-    output_parser = SimpleOutputParser()
-
-    # Build the single-action agent from the LLM + custom prompt
-    llm_chain = LLMSingleActionAgent(
-        llm=llm,
-        prompt=prompt,
-        output_parser=output_parser,
-        stop=["\nObservation:"]
-    )
-
-    # Convert our Tools to the format expected by LangChain
+    # Convert our Tools to the format expected by LangChain.
+    # Passing `coroutine` lets the executor await the tool natively on the async path,
+    # where the limiter bounds concurrency and applies the per-tool timeout.
     tool_list = []
     tools_info = []
     for t in tools:
         tool_obj = Tool(
             name=t.name,
             func=t.run,
+            coroutine=limiter.wrap(t),
             description=t.description
         )
         tool_list.append(tool_obj)
         tools_info.append(f"{t.name}: {t.description}")
 
-    tools_info_str = "\n".join(tools_info)
+    # Create the custom ReAct prompt that merges system instructions.
+    # The memory's variables only reach the prompt if they are declared inputs.
+    input_variables = ["input", "intermediate_steps"]
+    if memory is not None:
+        input_variables.extend(memory.memory_variables)
+
+    prompt = ReActPromptTemplate(
+        input_variables=input_variables,
+        system_prompt=system_prompt,
+        tools_info="\n".join(tools_info),
+        max_prompt_tokens=max_prompt_tokens,
+        max_observation_tokens=max_observation_tokens,
+        token_counter=token_counter or TokenCounter(),
+        multi_action=multi_action
+    )
+
+    if multi_action:
+        agent = MultiActionReActAgent(
+            llm_chain=LLMChain(llm=llm, prompt=prompt),
+            output_parser=MultiActionOutputParser(),
+            stop=["\nObservation"],
+            allowed_tools=[t.name for t in tool_list]
+        )
+    else:
+        # Build the single-action agent from the LLM + custom prompt
+        agent = LLMSingleActionAgent(
+            llm_chain=LLMChain(llm=llm, prompt=prompt),
+            output_parser=SimpleOutputParser(),
+            stop=["\nObservation:"],
+            allowed_tools=[t.name for t in tool_list]
+        )
 
-    # Assemble the AgentExecutor, passing short-term memory
+    # Assemble the AgentExecutor, passing short-term memory.
+    # The iteration cap and deadline bound a single request; when either is hit the
+    # executor stops and returns what it has.
     agent_executor = AgentExecutor.from_agent_and_tools(
-        agent=llm_chain,
+        agent=agent,
         tools=tool_list,
         verbose=True,
-        memory=memory
+        memory=memory,
+        max_iterations=max_iterations,
+        max_execution_time=max_execution_time,
+        early_stopping_method="force"
     )
+    return agent_executor
+
+def _ensure_no_running_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    raise RuntimeError(
+        "build_react_agent(multi_action=True) runs its own event loop and cannot be used from async "
+        "code; use build_async_react_agent instead."
+    )
+
+def build_react_agent(llm, tools, memory, **options):
+    """
+    Create an AgentExecutor that uses the ReAct pattern
+    with a system prompt and a set of Tools.
+    `options` are passed to the executor: prompt budget (max_prompt_tokens, max_observation_tokens,
+    token_counter), multi_action with max_parallel_tools/tool_timeout/tool_timeouts, and the
+    per-request limits max_iterations and max_execution_time.
+    With multi_action the agent is driven by `asyncio.run`, so it is only for synchronous callers
+    (a RuntimeError is raised inside a running event loop; use `build_async_react_agent` there).
+    """
+    multi_action = options.get("multi_action", False)
+    if multi_action:
+        _ensure_no_running_loop()
+    agent_executor = _build_agent_executor(llm, tools, memory, **options)
+    # Passed at run time so that it is inherited by every LLM step of the ReAct loop
+    metrics_callbacks = [LLMMetricsHandler("agent")]
 
     # Return a callable function
     def custom_call(input_str: str) -> str:
-        return agent_executor.run(
-            input=input_str,
-            tools_info=tools_info_str
-        )
+        with STAGE_LATENCY.time(stage="agent"):
+            if multi_action:
+                # Actions of one turn only run concurrently on the async path, driven by a private loop
+                _ensure_no_running_loop()
+                return asyncio.run(agent_executor.arun(input=input_str, callbacks=metrics_callbacks))
+            return agent_executor.run(input=input_str, callbacks=metrics_callbacks)
 
     return custom_call
+
+def build_async_react_agent(llm, tools, memory, **options):
+    """
+    Async counterpart of `build_react_agent`. The returned coroutine function drives
+    `agent_executor.arun`, so LLM calls and tool invocations are awaited instead of
+    holding a worker thread for the whole ReAct loop. Optional `callbacks` are attached to
+    the run, e.g. to stream progress events and tokens.
+    """
+    agent_executor = _build_agent_executor(llm, tools, memory, **options)
+    metrics_callbacks = [LLMMetricsHandler("agent")]
+
+    async def custom_acall(input_str: str, callbacks=None) -> str:
+        with STAGE_LATENCY.time(stage="agent"):
+            return await agent_executor.arun(input=input_str, callbacks=metrics_callbacks + list(callbacks or []))
+
+    return custom_acall
@@ -0,0 +1,217 @@
+# agent/embeddings.py
+
+"""
+Pluggable embedding providers shared by ingestion and retrieval.
+
+Every provider exposes the LangChain `Embeddings` interface, so it can be handed to Chroma
+directly, plus a `name` and `dimension` that are recorded on the collection. Query
+embeddings go through a per-provider LRU keyed by the normalized query text.
+"""
+
+import asyncio
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+def normalize_query(text: str) -> str:
+    return " ".join(text.lower().split())
+
+class EmbeddingProvider(Embeddings):
+    """
+    Base class for embedding providers. Subclasses implement `_embed_batch`.
+    """
+    name: str = "base"
+    dimension: int = 0
+
+    def __init__(self, query_cache_size: int = 2048):
+        self.query_cache_size = query_cache_size
+        self._query_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.query_cache_hits = 0
+        self.query_cache_misses = 0
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    async def _aembed_batch(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self._embed_batch, texts)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed_batch(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self._aembed_batch(texts)
+
+    def _cached_query(self, key: str) -> Optional[List[float]]:
+        with self._cache_lock:
+            vector = self._query_cache.get(key)
+            if vector is None:
+                self.query_cache_misses += 1
+                return None
+            self._query_cache.move_to_end(key)
+            self.query_cache_hits += 1
+            return vector
+
+    def _remember_query(self, key: str, vector: List[float]):
+        with self._cache_lock:
+            self._query_cache[key] = vector
+            self._query_cache.move_to_end(key)
+            while len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = normalize_query(text)
+        vector = self._cached_query(key)
+        if vector is None:
+            vector = self._embed_batch([key])[0]
+            self._remember_query(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = normalize_query(text)
+        vector = self._cached_query(key)
+        if vector is None:
+            vector = (await self._aembed_batch([key]))[0]
+            self._remember_query(key, vector)
+        return vector
+
+    def collection_metadata(self) -> dict:
+        return {"embedding_provider": self.name, "embedding_dimension": self.dimension}
+
+# Output sizes of the OpenAI embedding models; others are measured with one probe request
+OPENAI_EMBEDDING_DIMENSIONS = {
+    "text-embedding-ada-002": 1536,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+}
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """
+    Remote embeddings through the OpenAI API.
+
+    `dimension` defaults to the model's known output size (OPENAI_EMBEDDING_DIMENSIONS) or,
+    for other models, to the length of a probe embedding. Vectors of any other length are
+    rejected, so a mismatched model never reaches the store.
+    """
+    def __init__(self, model: str = "text-embedding-ada-002", dimension: Optional[int] = None,
+                 query_cache_size: int = 2048):
+        super().__init__(query_cache_size=query_cache_size)
+        from langchain.embeddings import OpenAIEmbeddings
+        self.client = OpenAIEmbeddings(model=model)
+        self.name = f"openai:{model}"
+        self.dimension = (
+            dimension or OPENAI_EMBEDDING_DIMENSIONS.get(model) or len(self.client.embed_query("dimension"))
+        )
+
+    def _check_dimension(self, vectors: List[List[float]]) -> List[List[float]]:
+        for vector in vectors:
+            if len(vector) != self.dimension:
+                raise ValueError(
+                    f"Embedding model '{self.name}' returned {len(vector)} dimensions, expected {self.dimension}"
+                )
+        return vectors
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        return self._check_dimension(self.client.embed_documents(texts))
+
+    async def _aembed_batch(self, texts: List[str]) -> List[List[float]]:
+        return self._check_dimension(await self.client.aembed_documents(texts))
+
+class LocalHashingEmbeddingProvider(EmbeddingProvider):
+    """
+    CPU-only, offline embeddings using the hashing trick.
+
+    Word unigrams/bigrams and character trigrams are hashed into `dimension` signed buckets,
+    the whole batch is accumulated into one NumPy matrix, damped with log1p and L2-normalized.
+    There are no model weights to load and no network round-trip, so query embedding costs
+    microseconds; retrieval quality is lexical rather than semantic.
+    """
+    _TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+    def __init__(self, dimension: int = 512, query_cache_size: int = 2048):
+        super().__init__(query_cache_size=query_cache_size)
+        self.dimension = dimension
+        self.name = f"local-hashing-v1:{dimension}"
+
+    def _features(self, text: str) -> List[str]:
+        words = self._TOKEN_RE.findall(text.lower())
+        features = list(words)
+        features.extend(f"{a} {b}" for a, b in zip(words, words[1:]))
+        for word in words:
+            padded = f"#{word}#"
+            features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Encode a batch into a float32 matrix of unit-length rows.
+        """
+        rows, hashes = [], []
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                rows.append(row)
+                hashes.append(zlib.crc32(feature.encode("utf-8")))
+
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        if hashes:
+            hashes = np.asarray(hashes, dtype=np.uint32)
+            columns = (hashes % self.dimension).astype(np.intp)
+            # The top hash bit picks the sign so that bucket collisions tend to cancel out
+            signs = np.where(hashes >> 31, -1.0, 1.0).astype(np.float32)
+            np.add.at(matrix, (np.asarray(rows, dtype=np.intp), columns), signs)
+
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(texts).tolist()
+
+    async def _aembed_batch(self, texts: List[str]) -> List[List[float]]:
+        # Fast enough that a thread hop would cost more than the encoding itself
+        return self._embed_batch(texts)
+
+_PROVIDERS = {
+    "openai": OpenAIEmbeddingProvider,
+    "local": LocalHashingEmbeddingProvider,
+}
+
+def get_embedding_provider(name: Optional[str] = None, **kwargs) -> EmbeddingProvider:
+    """
+    Build the configured provider. `name` defaults to the EMBEDDING_PROVIDER environment
+    variable ("openai" or "local"), falling back to "openai".
+    """
+    name = name or os.getenv("EMBEDDING_PROVIDER", "openai")
+    if name not in _PROVIDERS:
+        raise ValueError(f"Unknown embedding provider '{name}'. Choose one of: {', '.join(_PROVIDERS)}")
+    return _PROVIDERS[name](**kwargs)
+
+def bind_collection_to_provider(store, provider: EmbeddingProvider):
+    """
+    Record the provider name and dimension on a vector store collection (see agent.vector_store),
+    or raise if the collection was built with a different provider (its vectors would not be comparable).
+    """
+    metadata = store.metadata
+    recorded = metadata.get("embedding_provider")
+    if recorded is None and store.count() > 0:
+        # Collections built before providers were recorded used OpenAI embeddings
+        recorded, recorded_dimension = "openai:text-embedding-ada-002", 1536
+    else:
+        recorded_dimension = metadata.get("embedding_dimension")
+
+    if recorded is not None and (recorded != provider.name or recorded_dimension != provider.dimension):
+        raise ValueError(
+            f"Collection '{store.collection_name}' was built with embedding provider '{recorded}' "
+            f"({recorded_dimension} dims), but '{provider.name}' ({provider.dimension} dims) is configured. "
+            f"Re-ingest the collection or switch providers."
+        )
+    if metadata.get("embedding_provider") is None:
+        metadata.update(provider.collection_metadata())
+        store.set_metadata(metadata)
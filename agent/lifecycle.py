@@ -0,0 +1,140 @@
+# agent/lifecycle.py
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from agent.metrics import RESOURCE_INIT_LATENCY
+
+logger = logging.getLogger(__name__)
+
+class LazyResource:
+    """
+    A service object created on first use, at most once per process.
+
+    Nothing is opened at import time, so a server started with several workers (or imported
+    before a fork) gives every worker its own connections. Creation is serialized by a lock;
+    if the factory raises, the error is recorded and the next `get()` tries again.
+    """
+    def __init__(self, name: str, factory: Callable[[], Any], close: Optional[Callable[[Any], None]] = None):
+        self.name = name
+        self.factory = factory
+        self._close = close
+        self._instance = None
+        self._created = False
+        self._lock = threading.Lock()
+        self.init_seconds: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def get(self) -> Any:
+        if self._created:
+            return self._instance
+        with self._lock:
+            if not self._created:
+                started = time.perf_counter()
+                try:
+                    self._instance = self.factory()
+                except Exception as e:
+                    self.last_error = f"{type(e).__name__}: {e}"
+                    raise
+                self.init_seconds = time.perf_counter() - started
+                RESOURCE_INIT_LATENCY.observe(self.init_seconds, resource=self.name)
+                self.last_error = None
+                self._created = True
+        return self._instance
+
+    async def aget(self) -> Any:
+        # Creation may connect to a database or load files, so it runs on a worker thread
+        if self._created:
+            return self._instance
+        return await asyncio.to_thread(self.get)
+
+    def peek(self) -> Any:
+        """
+        The instance if it has been created, else None (never triggers creation).
+        """
+        return self._instance if self._created else None
+
+    @property
+    def created(self) -> bool:
+        return self._created
+
+    def close(self):
+        with self._lock:
+            if self._created and self._close is not None:
+                self._close(self._instance)
+            self._instance = None
+            self._created = False
+
+class ServiceLifecycle:
+    """
+    Tracks liveness, readiness and cold-start time of one worker.
+
+    `warm_up()` runs the named steps in order on worker threads (opening resources, compiling
+    schemas, priming caches). Failed steps are retried every `retry_interval` seconds, so a
+    dependency that is down at startup makes the worker unready instead of killing it.
+    The worker is ready once every step has succeeded; `cold_start_seconds` is the time from
+    `started_at` (normally module import) to that point.
+    """
+    def __init__(self, steps: List[Tuple[str, Callable[[], Any]]], started_at: Optional[float] = None,
+                 retry_interval: float = 5.0):
+        self.steps = steps
+        self.started_at = started_at if started_at is not None else time.monotonic()
+        self.retry_interval = retry_interval
+        self.ready = False
+        self.cold_start_seconds: Optional[float] = None
+        self.step_seconds: Dict[str, float] = {}
+        self.step_errors: Dict[str, str] = {}
+        self._task: Optional["asyncio.Task"] = None
+
+    async def warm_up(self):
+        remaining = list(self.steps)
+        while remaining:
+            failed = []
+            for name, step in remaining:
+                started = time.perf_counter()
+                try:
+                    await asyncio.to_thread(step)
+                except Exception as e:
+                    self.step_errors[name] = f"{type(e).__name__}: {e}"
+                    logger.warning("Warm-up step %s failed: %s", name, self.step_errors[name])
+                    failed.append((name, step))
+                    continue
+                self.step_seconds[name] = time.perf_counter() - started
+                self.step_errors.pop(name, None)
+            remaining = failed
+            if remaining:
+                await asyncio.sleep(self.retry_interval)
+
+        self.cold_start_seconds = time.monotonic() - self.started_at
+        self.ready = True
+        logger.info(
+            "Worker ready: cold start %.2fs (%s)", self.cold_start_seconds,
+            ", ".join(f"{name}={seconds:.2f}s" for name, seconds in self.step_seconds.items())
+        )
+
+    def start(self) -> "asyncio.Task":
+        """
+        Run `warm_up()` in the background of the current event loop.
+        """
+        self._task = asyncio.create_task(self.warm_up())
+        return self._task
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "uptime_seconds": round(time.monotonic() - self.started_at, 3),
+            "cold_start_seconds": round(self.cold_start_seconds, 3) if self.cold_start_seconds is not None else None,
+            "warm_up_seconds": {name: round(seconds, 3) for name, seconds in self.step_seconds.items()},
+            "errors": dict(self.step_errors),
+        }
@@ -0,0 +1,242 @@
+# agent/llm_cache.py
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+class LLMResponseCache:
+    """
+    Two-tier cache for LLM completions: an in-memory LRU in front of an on-disk SQLite table.
+
+    Entries expire after `ttl` seconds (None disables expiry). The memory tier holds at most
+    `max_memory_entries` items; the disk tier is pruned back to `max_disk_entries` by least
+    recent access. Pass `sqlite_path=None` to keep the cache in memory only.
+    """
+    def __init__(
+        self,
+        sqlite_path: Optional[str] = "llm_cache.sqlite3",
+        max_memory_entries: int = 1024,
+        max_disk_entries: int = 100_000,
+        ttl: Optional[float] = 7 * 24 * 3600
+    ):
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0}
+
+        self._db = None
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL;")
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                );
+                """
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_access ON llm_cache (last_access);")
+            self._db.commit()
+
+    @staticmethod
+    def make_key(prompt: str, model_params: dict) -> str:
+        """
+        Hash the prompt together with the model identity and call parameters.
+        """
+        payload = json.dumps({"prompt": prompt, "params": model_params}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl is not None and now - created_at > self.ttl
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                response, created_at = item
+                if not self._expired(created_at, now):
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return response
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT response, created_at FROM llm_cache WHERE cache_key = ?;", (key,)
+                ).fetchone()
+                if row is not None and not self._expired(row[1], now):
+                    self._db.execute("UPDATE llm_cache SET last_access = ? WHERE cache_key = ?;", (now, key))
+                    self._db.commit()
+                    self._remember(key, row[0], row[1])
+                    self._stats["disk_hits"] += 1
+                    return row[0]
+
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, key: str, response: str):
+        now = time.time()
+        with self._lock:
+            self._remember(key, response, now)
+            self._stats["writes"] += 1
+            if self._db is not None:
+                self._db.execute(
+                    """
+                    INSERT INTO llm_cache (cache_key, response, created_at, last_access)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (cache_key)
+                    DO UPDATE SET response = excluded.response,
+                                  created_at = excluded.created_at,
+                                  last_access = excluded.last_access;
+                    """,
+                    (key, response, now, now)
+                )
+                self._writes_since_prune += 1
+                # Pruning needs a COUNT(*), so it only runs every so often
+                if self._writes_since_prune >= 100:
+                    self._prune_disk(now)
+                self._db.commit()
+
+    def _remember(self, key: str, response: str, created_at: float):
+        self._memory[key] = (response, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _prune_disk(self, now: float):
+        self._writes_since_prune = 0
+        if self.ttl is not None:
+            self._db.execute("DELETE FROM llm_cache WHERE created_at < ?;", (now - self.ttl,))
+        (count,) = self._db.execute("SELECT COUNT(*) FROM llm_cache;").fetchone()
+        if count > self.max_disk_entries:
+            self._db.execute(
+                """
+                DELETE FROM llm_cache WHERE cache_key IN (
+                    SELECT cache_key FROM llm_cache ORDER BY last_access ASC LIMIT ?
+                );
+                """,
+                (count - self.max_disk_entries,)
+            )
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM llm_cache;")
+                self._db.commit()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+class CachedLLM:
+    """
+    Wraps an LLM client so that `predict`/`apredict` are served from an LLMResponseCache.
+
+    Only the plain-text predict calls are cached; any other attribute is forwarded to the
+    wrapped client unchanged. Pass `bypass_cache=True` to force a fresh generation (the
+    result still refreshes the cache).
+    """
+    def __init__(self, llm, cache: LLMResponseCache, model_params: dict):
+        self.llm = llm
+        self.cache = cache
+        self.model_params = model_params
+
+    def _key(self, text: str, kwargs: dict) -> str:
+        # Callback handlers only observe the call; they must not split the cache
+        params = {k: v for k, v in kwargs.items() if k != "callbacks"}
+        return self.cache.make_key(text, {**self.model_params, **params})
+
+    def predict(self, text: str, *, bypass_cache: bool = False, **kwargs) -> str:
+        key = self._key(text, kwargs)
+        if not bypass_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        response = self.llm.predict(text, **kwargs)
+        self.cache.set(key, response)
+        return response
+
+    async def apredict(self, text: str, *, bypass_cache: bool = False, **kwargs) -> str:
+        key = self._key(text, kwargs)
+        if not bypass_cache:
+            # A disk lookup is blocking I/O, so it is kept off the event loop
+            cached = await asyncio.to_thread(self.cache.get, key)
+            if cached is not None:
+                return cached
+        response = await self.llm.apredict(text, **kwargs)
+        await asyncio.to_thread(self.cache.set, key, response)
+        return response
+
+    def predict_batch(self, texts: List[str], callbacks=None, max_concurrency: int = 8,
+                      stop: Optional[List[str]] = None) -> List[str]:
+        """
+        Batched `predict`: cached prompts are answered from the cache, the rest go through
+        the module-level `predict_batch`.
+        """
+        keys = [self._key(text, {} if stop is None else {"stop": stop}) for text in texts]
+        responses = [self.cache.get(key) for key in keys]
+        missing = [i for i, response in enumerate(responses) if response is None]
+        if missing:
+            fresh = predict_batch(
+                self.llm, [texts[i] for i in missing], callbacks=callbacks, max_concurrency=max_concurrency,
+                stop=stop
+            )
+            for i, response in zip(missing, fresh):
+                responses[i] = response
+                self.cache.set(keys[i], response)
+        return responses
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+def _sends_batches(llm) -> bool:
+    # Completion clients of the OpenAI family put up to `batch_size` prompts in one request,
+    # and RoutedLLM hands each model's share of the prompts on with `predict_batch`.
+    # Chat models, Ollama and wrapper LLMs built on `_call` loop over the prompts one by one.
+    from agent.model_router import RoutedLLM
+    if isinstance(llm, RoutedLLM):
+        return True
+    try:
+        from langchain.llms.openai import BaseOpenAI
+    except ImportError:
+        return False
+    return isinstance(llm, BaseOpenAI)
+
+def predict_batch(llm, texts: List[str], callbacks=None, max_concurrency: int = 8,
+                  stop: Optional[List[str]] = None) -> List[str]:
+    """
+    Complete several prompts. Clients that send a prompt list as a single request
+    (OpenAI/Azure OpenAI completion models) get one `generate_prompt` call; every other
+    client gets concurrent `predict` calls, at most `max_concurrency` at a time, so a batch
+    takes about as long as its slowest prompt rather than the sum of all of them.
+    """
+    if isinstance(llm, CachedLLM):
+        return llm.predict_batch(texts, callbacks=callbacks, max_concurrency=max_concurrency, stop=stop)
+    if _sends_batches(llm):
+        from langchain.prompts.base import StringPromptValue
+        result = llm.generate_prompt(
+            [StringPromptValue(text=text) for text in texts], stop=stop, callbacks=callbacks
+        )
+        return [generations[0].text for generations in result.generations]
+    if len(texts) <= 1:
+        return [llm.predict(text, stop=stop, callbacks=callbacks) for text in texts]
+    with ThreadPoolExecutor(max_workers=min(len(texts), max_concurrency)) as executor:
+        return list(executor.map(lambda text: llm.predict(text, stop=stop, callbacks=callbacks), texts))
@@ -1,6 +1,16 @@
 # agent/llm_manager.py
+import json
 import os
-from typing import Optional
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain.callbacks.base import BaseCallbackHandler
+
+from agent.llm_cache import CachedLLM, LLMResponseCache
+from agent.llm_scheduler import LLMBackend, LLMScheduler, ScheduledLLM
+from agent.metrics import LLM_LATENCY, LLM_REQUESTS, LLM_TOKENS
+from agent.model_router import ModelProfile, ProfileStats, RoutedLLM
+from agent.token_counter import TokenCounter
 
 class LLMManager:
     def __init__(
@@ -8,36 +18,256 @@ class LLMManager:
         use_azure_openai: bool = True,
         azure_openai_deployment_name: Optional[str] = None,
         azure_openai_api_key: Optional[str] = None,
-        ollama_endpoint: Optional[str] = None
+        ollama_endpoint: Optional[str] = None,
+        streaming: bool = False,
+        enable_cache: bool = True,
+        cache_path: Optional[str] = "llm_cache.sqlite3",
+        cache_ttl: Optional[float] = 7 * 24 * 3600,
+        cache_max_memory_entries: int = 1024,
+        cache_max_disk_entries: int = 100_000,
+        ollama_model: str = "llama2",
+        backends: Optional[List[dict]] = None,
+        scheduler_options: Optional[dict] = None,
+        models: Optional[Dict[str, Any]] = None,
+        profiles: Optional[Dict[str, dict]] = None
     ):
         """
         Configure LLM. If `use_azure_openai` is True, we use Azure,
         otherwise we assume Ollama. Adjust as needed for your environment.
+
+        With `enable_cache`, callers that ask for `get_llm(cached=True)` get a client whose
+        completions are cached by prompt hash + model + parameters (memory LRU + SQLite).
+        Only deterministic callers such as summaries and reviews should opt in.
+
+        `streaming=True` makes the client emit tokens to callback handlers as they are
+        generated (used by the /chat/stream endpoint); results are unchanged otherwise.
+
+        `backends` (or the LLM_BACKENDS environment variable, as a JSON list) configures a pool
+        of deployments/endpoints instead of the single client above. Each entry is a dict with
+        "provider" ("azure_openai" or "ollama"), "name", "deployment_name" / "api_key" /
+        "endpoint" / "api_version" for Azure or "base_url" / "model" for Ollama, and optionally
+        "max_concurrency" and "tokens_per_minute". Requests are then routed by an LLMScheduler
+        (see agent.llm_scheduler), configured with `scheduler_options`.
+
+        Call sites ask for a named profile with `get_llm(profile=...)` ("reasoning",
+        "summarize", "review"; see agent.model_router). `models` (or LLM_MODELS) names extra
+        models, each a backend spec or a list of specs for a pool; the main client is "default".
+        `profiles` (or LLM_PROFILES) maps a profile to {"model", "escalate_to",
+        "max_prompt_tokens", "escalate_on_error"}, e.g. summaries on a fast local model that
+        escalate long inputs to the large one. Unconfigured profiles use "default".
         """
         self.use_azure_openai = use_azure_openai
         self.azure_openai_deployment_name = azure_openai_deployment_name
         self.azure_openai_api_key = azure_openai_api_key
         self.ollama_endpoint = ollama_endpoint
+        self.streaming = streaming
+        self.ollama_model = ollama_model
+        if backends is None and os.getenv("LLM_BACKENDS"):
+            backends = json.loads(os.environ["LLM_BACKENDS"])
+        self.backend_specs = backends
+        self.scheduler_options = scheduler_options or {}
+        self.scheduler = None
         self.llm = None
+        self.model_params = {}
         self._initialize_llm()
+        self._initialize_profiles(
+            models if models is not None else json.loads(os.getenv("LLM_MODELS", "{}")),
+            profiles if profiles is not None else json.loads(os.getenv("LLM_PROFILES", "{}"))
+        )
 
-    def _initialize_llm(self):
-        if self.use_azure_openai:
+        self.cache = None
+        self.cached_llm = None
+        if enable_cache:
+            self.cache = LLMResponseCache(
+                sqlite_path=cache_path,
+                max_memory_entries=cache_max_memory_entries,
+                max_disk_entries=cache_max_disk_entries,
+                ttl=cache_ttl
+            )
+            self.cached_llm = CachedLLM(self.llm, self.cache, self.model_params)
+
+    def _build_client(self, spec: dict):
+        """
+        Create one client from a backend spec; returns (client, model_params).
+        """
+        if spec.get("provider", "azure_openai") == "azure_openai":
             from langchain.chat_models import AzureChatOpenAI
-            self.llm = AzureChatOpenAI(
-                deployment_name=self.azure_openai_deployment_name,
-                openai_api_base=os.getenv("AZURE_OPENAI_ENDPOINT", ""),
-                openai_api_version="2023-03-15-preview",
-                openai_api_key=self.azure_openai_api_key,
-                temperature=0.2
+            client = AzureChatOpenAI(
+                deployment_name=spec.get("deployment_name"),
+                openai_api_base=spec.get("endpoint") or os.getenv("AZURE_OPENAI_ENDPOINT", ""),
+                openai_api_version=spec.get("api_version", "2023-03-15-preview"),
+                openai_api_key=spec.get("api_key"),
+                temperature=0.2,
+                streaming=self.streaming
             )
+            return client, {"provider": "azure_openai", "model": spec.get("deployment_name"), "temperature": 0.2}
+        # Adjust for other providers
+        from langchain.llms import Ollama
+        client = Ollama(base_url=spec.get("base_url"), model=spec.get("model", "llama2"))
+        return client, {"provider": "ollama", "model": spec.get("model", "llama2")}
+
+    def _build_model(self, specs):
+        """
+        A backend spec gives its client; a list of specs gives a ScheduledLLM over the pool.
+        Returns (llm, model_params, scheduler or None).
+        """
+        if isinstance(specs, dict):
+            client, params = self._build_client(specs)
+            return client, params, None
+
+        pool, models = [], set()
+        for i, spec in enumerate(specs):
+            client, params = self._build_client(spec)
+            models.add(f"{params['provider']}:{params['model']}")
+            pool.append(LLMBackend(
+                name=spec.get("name") or f"{params['provider']}-{i}",
+                llm=client,
+                max_concurrency=spec.get("max_concurrency", 8),
+                tokens_per_minute=spec.get("tokens_per_minute")
+            ))
+        scheduler = LLMScheduler(pool, **self.scheduler_options)
+        # Backends are interchangeable replicas, so a cached answer from any of them may be reused
+        params = {"provider": "pool", "models": sorted(models), "temperature": 0.2}
+        return ScheduledLLM(scheduler=scheduler), params, scheduler
+
+    def _initialize_llm(self):
+        if self.backend_specs:
+            self.llm, self.model_params, self.scheduler = self._build_model(self.backend_specs)
+        elif self.use_azure_openai:
+            self.llm, self.model_params, _ = self._build_model({
+                "provider": "azure_openai",
+                "deployment_name": self.azure_openai_deployment_name,
+                "api_key": self.azure_openai_api_key
+            })
         else:
-            # Adjust for Ollama integration or other providers
-            from langchain.llms import Ollama
-            self.llm = Ollama(
-                base_url=self.ollama_endpoint,
-                model="llama2"  # Example
+            self.llm, self.model_params, _ = self._build_model(
+                {"provider": "ollama", "base_url": self.ollama_endpoint, "model": self.ollama_model}
             )
 
-    def get_llm(self):
+    def _initialize_profiles(self, models: Dict[str, Any], profiles: Dict[str, dict]):
+        self.models = {"default": self.llm}
+        self.models_params = {"default": self.model_params}
+        self.schedulers = [self.scheduler] if self.scheduler is not None else []
+        for name, specs in models.items():
+            llm, params, scheduler = self._build_model(specs)
+            self.models[name], self.models_params[name] = llm, params
+            if scheduler is not None:
+                self.schedulers.append(scheduler)
+
+        self.profiles = {name: ModelProfile.from_dict(name, config) for name, config in profiles.items()}
+        for profile in self.profiles.values():
+            unknown = [model for model in profile.models() if model not in self.models]
+            if unknown:
+                raise ValueError(f"Profile '{profile.name}' refers to unknown model(s): {', '.join(unknown)}")
+        self.profile_stats = ProfileStats()
+        self.token_counter = TokenCounter()
+        self._profile_llms: Dict[Tuple[str, bool], Any] = {}
+
+    def _profile_llm(self, name: str, cached: bool):
+        key = (name, cached)
+        if key not in self._profile_llms:
+            profile = self.profiles.get(name) or ModelProfile(name)
+            if cached:
+                # The cache key covers every model the profile may route to
+                params = {"profile": name, "max_prompt_tokens": profile.max_prompt_tokens,
+                          "models": {model: self.models_params[model] for model in profile.models()}}
+                llm = CachedLLM(self._profile_llm(name, False), self.cache, params)
+            else:
+                llm = RoutedLLM(
+                    profile=profile,
+                    clients={model: self.models[model] for model in profile.models()},
+                    stats=self.profile_stats,
+                    token_counter=self.token_counter
+                )
+            self._profile_llms[key] = llm
+        return self._profile_llms[key]
+
+    def get_llm(self, cached: bool = False, profile: Optional[str] = None):
+        """
+        Return the LLM client. `cached=True` returns the caching wrapper when caching is enabled.
+        With `profile`, the client routes by that profile's rules and reports per-profile stats.
+        """
+        cached = cached and self.cache is not None
+        if profile is not None:
+            return self._profile_llm(profile, cached)
+        if cached:
+            return self.cached_llm
         return self.llm
+
+    def get_cache_stats(self) -> dict:
+        return self.cache.get_stats() if self.cache is not None else {}
+
+    def get_backend_stats(self) -> dict:
+        """
+        Per-backend load, health and latency percentiles (empty without a backend pool).
+        """
+        stats = {}
+        for scheduler in self.schedulers:
+            stats.update(scheduler.get_stats())
+        return stats
+
+    def get_profile_stats(self) -> dict:
+        """
+        Calls, escalations, tokens and latency per profile and per model it routed to.
+        """
+        return self.profile_stats.snapshot()
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """
+    Records latency, outcome and prompt/completion tokens of every LLM call made with it,
+    labelled with `caller`. Token counts come from the provider's usage report when present
+    (non-streaming OpenAI calls) and are estimated with TokenCounter otherwise; prompts are
+    only tokenized in that case.
+
+    Requests a wrapper client (ScheduledLLM, RoutedLLM) makes on behalf of a call are nested
+    LLM runs of it, at any depth; they are ignored so that each call is counted once.
+    """
+    def __init__(self, caller: str, token_counter: Optional[TokenCounter] = None):
+        self.caller = caller
+        self.token_counter = token_counter or TokenCounter()
+        self._started: Dict[Any, Tuple[float, List[str]]] = {}
+        self._nested = set()
+
+    def _is_nested(self, run_id, parent_run_id) -> bool:
+        if parent_run_id in self._started or parent_run_id in self._nested:
+            self._nested.add(run_id)
+            return True
+        return False
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id=None,
+                     parent_run_id=None, **kwargs):
+        if not self._is_nested(run_id, parent_run_id):
+            self._started[run_id] = (time.perf_counter(), prompts)
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages, *, run_id=None,
+                            parent_run_id=None, **kwargs):
+        if not self._is_nested(run_id, parent_run_id):
+            self._started[run_id] = (time.perf_counter(), [m.content for batch in messages for m in batch])
+
+    def on_llm_end(self, response, *, run_id=None, **kwargs):
+        self._nested.discard(run_id)
+        if run_id not in self._started:
+            return
+        started, prompts = self._started.pop(run_id)
+        LLM_LATENCY.observe(time.perf_counter() - started, caller=self.caller)
+        LLM_REQUESTS.inc(caller=self.caller, status="ok")
+
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens")
+        if prompt_tokens is None:
+            prompt_tokens = sum(self.token_counter.count(p) for p in prompts)
+        completion_tokens = usage.get("completion_tokens")
+        if completion_tokens is None:
+            completion_tokens = sum(
+                self.token_counter.count(g.text) for generations in response.generations for g in generations
+            )
+        LLM_TOKENS.inc(prompt_tokens, caller=self.caller, kind="prompt")
+        LLM_TOKENS.inc(completion_tokens, caller=self.caller, kind="completion")
+
+    def on_llm_error(self, error: BaseException, *, run_id=None, **kwargs):
+        self._nested.discard(run_id)
+        if run_id not in self._started:
+            return
+        started, _ = self._started.pop(run_id)
+        LLM_LATENCY.observe(time.perf_counter() - started, caller=self.caller)
+        LLM_REQUESTS.inc(caller=self.caller, status="error")
@@ -0,0 +1,468 @@
+# agent/llm_scheduler.py
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Mapping, Optional
+
+from langchain.callbacks.base import AsyncCallbackHandler
+from langchain.llms.base import LLM
+
+from agent.metrics import LLM_BACKEND_LATENCY, LLM_BACKEND_REQUESTS
+from agent.token_counter import TokenCounter
+
+logger = logging.getLogger(__name__)
+
+class NoBackendAvailable(RuntimeError):
+    """
+    Raised when every backend's circuit is open, or none had capacity within the queue timeout.
+    """
+
+def _status_code(error: BaseException) -> Optional[int]:
+    # openai<1.0 errors carry `http_status`, openai>=1.0 / httpx errors `status_code` or `response`
+    for candidate in (error, getattr(error, "response", None)):
+        for attribute in ("http_status", "status_code"):
+            value = getattr(candidate, attribute, None)
+            if isinstance(value, int):
+                return value
+    return None
+
+_RETRYABLE_ERROR_NAMES = {
+    "APIConnectionError", "APITimeoutError", "Timeout", "ServiceUnavailableError",
+    "InternalServerError", "TryAgain",
+}
+
+def classify_error(error: BaseException) -> Optional[str]:
+    """
+    "rate_limited" for 429s, "retryable" for 5xx/timeouts/connection errors, None otherwise
+    (bad requests, auth errors and the like are returned to the caller unchanged).
+    """
+    status = _status_code(error)
+    if status == 429 or "RateLimit" in type(error).__name__:
+        return "rate_limited"
+    if status is not None and status >= 500:
+        return "retryable"
+    if isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return "retryable"
+    if type(error).__name__ in _RETRYABLE_ERROR_NAMES:
+        return "retryable"
+    return None
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    headers = getattr(error, "headers", None) or getattr(getattr(error, "response", None), "headers", None)
+    try:
+        return float(headers.get("retry-after")) if headers else None
+    except (TypeError, ValueError):
+        return None
+
+class LLMBackend:
+    """
+    One deployment or endpoint in the pool, with its own limits and health.
+
+    `max_concurrency` caps requests in flight; `tokens_per_minute` (optional) caps the estimated
+    prompt + completion tokens sent in any 60 s window. State is guarded by the scheduler's lock.
+    """
+    def __init__(self, name: str, llm, max_concurrency: int = 8, tokens_per_minute: Optional[int] = None,
+                 latency_window: int = 200):
+        self.name = name
+        self.llm = llm
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.in_flight = 0
+        self._token_log: deque = deque()
+        self._tokens_in_window = 0
+        self._latencies: deque = deque(maxlen=latency_window)
+        self.consecutive_failures = 0
+        self.circuit_open_until = 0.0
+        self.circuit_opened_at = 0.0
+        self.probe_in_flight = False
+        self.rate_limited_until = 0.0
+        self.stats = {
+            "requests": 0, "ok": 0, "errors": 0, "rate_limited": 0, "cancelled": 0,
+            "circuit_opens": 0, "hedges": 0, "hedge_wins": 0,
+        }
+
+    def tokens_last_minute(self, now: float) -> int:
+        while self._token_log and now - self._token_log[0][0] > 60.0:
+            self._tokens_in_window -= self._token_log.popleft()[1]
+        return self._tokens_in_window
+
+    def record_tokens(self, now: float, tokens: int):
+        self._token_log.append((now, tokens))
+        self._tokens_in_window += tokens
+
+    def circuit_state(self, now: float) -> str:
+        if self.circuit_open_until == 0.0:
+            return "closed"
+        return "open" if now < self.circuit_open_until else "half_open"
+
+    def latency_percentile(self, q: float) -> Optional[float]:
+        if not self._latencies:
+            return None
+        values = sorted(self._latencies)
+        return values[min(len(values) - 1, int(len(values) * q / 100.0))]
+
+class _Reservation:
+    """
+    One request's claim on a backend. Requests that started before the backend's circuit last
+    opened no longer count towards its health, and only the half-open probe clears the probe flag.
+    """
+    __slots__ = ("backend", "probe", "started")
+
+    def __init__(self, backend: LLMBackend, probe: bool, started: float):
+        self.backend = backend
+        self.probe = probe
+        self.started = started
+
+class _FirstTokenSignal(AsyncCallbackHandler):
+    # Set once the primary attempt starts streaming; from then on it is not hedged
+    def __init__(self):
+        self.event = asyncio.Event()
+
+    async def on_llm_new_token(self, token: str, **kwargs) -> None:
+        self.event.set()
+
+class LLMScheduler:
+    """
+    Routes completions over a pool of LLMBackends.
+
+    Each call goes to the least-loaded healthy backend with room in its concurrency and
+    tokens-per-minute budgets, waiting (up to `queue_timeout`) when all are saturated.
+    429s and transient failures (5xx, timeouts, connection errors) are retried up to
+    `max_retries` times with jittered exponential backoff, preferring backends not tried yet;
+    a 429 also parks its backend for the Retry-After period. `failure_threshold` consecutive
+    transient failures open a backend's circuit for `circuit_cooldown` seconds, after which a
+    single probe request decides whether it closes again.
+
+    With `hedge_percentile` set, an async call whose primary attempt has neither finished nor
+    started streaming after that percentile of the backend's recent latency gets a duplicate
+    on another backend; the first to finish wins and the other is cancelled. Hedges are capped
+    at `max_hedge_ratio` of requests.
+    """
+    def __init__(
+        self,
+        backends: List[LLMBackend],
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        failure_threshold: int = 5,
+        circuit_cooldown: float = 30.0,
+        queue_timeout: float = 60.0,
+        hedge_percentile: Optional[float] = None,
+        hedge_min_samples: int = 20,
+        max_hedge_ratio: float = 0.1,
+        completion_token_estimate: int = 256,
+        token_counter: Optional[TokenCounter] = None
+    ):
+        if not backends:
+            raise ValueError("LLMScheduler needs at least one backend")
+        self.backends = backends
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.circuit_cooldown = circuit_cooldown
+        self.queue_timeout = queue_timeout
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.max_hedge_ratio = max_hedge_ratio
+        self.completion_token_estimate = completion_token_estimate
+        self.token_counter = token_counter or TokenCounter()
+        self._cond = threading.Condition()
+        # (loop, asyncio.Event) of async callers waiting for capacity, woken by _release
+        self._async_waiters = set()
+        self._requests = 0
+        self._hedges = 0
+
+    # ---- Backend selection -------------------------------------------------
+
+    def _estimate_tokens(self, prompt: str) -> int:
+        return self.token_counter.count(prompt) + self.completion_token_estimate
+
+    def _available(self, backend: LLMBackend, tokens: int, now: float) -> bool:
+        state = backend.circuit_state(now)
+        if state == "open" or (state == "half_open" and backend.probe_in_flight):
+            return False
+        if now < backend.rate_limited_until or backend.in_flight >= backend.max_concurrency:
+            return False
+        if backend.tokens_per_minute is not None:
+            used = backend.tokens_last_minute(now)
+            # A prompt larger than the whole budget still goes through on an idle minute
+            if used and used + tokens > backend.tokens_per_minute:
+                return False
+        return True
+
+    def _try_reserve(self, tokens: int, exclude=(), strict: bool = False) -> Optional[_Reservation]:
+        """
+        Reserve the best available backend (caller holds the lock), or return None.
+        Backends in `exclude` are used only when nothing else is available, unless `strict`.
+        """
+        now = time.monotonic()
+        available = [b for b in self.backends if self._available(b, tokens, now)]
+        candidates = [b for b in available if b.name not in exclude]
+        if not candidates and not strict:
+            candidates = available
+        if not candidates:
+            return None
+        backend = min(
+            candidates,
+            key=lambda b: (b.in_flight / b.max_concurrency, b.latency_percentile(50) or 0.0)
+        )
+        probe = backend.circuit_state(now) == "half_open"
+        if probe:
+            backend.probe_in_flight = True
+        backend.in_flight += 1
+        backend.stats["requests"] += 1
+        backend.record_tokens(now, tokens)
+        return _Reservation(backend, probe, now)
+
+    def _check_any_usable(self):
+        now = time.monotonic()
+        if all(b.circuit_state(now) == "open" for b in self.backends):
+            raise NoBackendAvailable("All LLM backends are failing (circuits open)")
+
+    def _acquire(self, tokens: int, exclude=()) -> _Reservation:
+        deadline = time.monotonic() + self.queue_timeout
+        with self._cond:
+            while True:
+                self._check_any_usable()
+                reservation = self._try_reserve(tokens, exclude)
+                if reservation is not None:
+                    return reservation
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise NoBackendAvailable(f"No LLM backend had capacity within {self.queue_timeout}s")
+                # Token windows and rate-limit pauses expire without a release, so re-check periodically
+                self._cond.wait(min(remaining, 0.25))
+
+    async def _aacquire(self, tokens: int, exclude=()) -> _Reservation:
+        # Backends are shared with worker threads, so instead of the threading.Condition each
+        # waiter registers an asyncio.Event that _release sets on the waiter's own loop
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + self.queue_timeout
+        while True:
+            waiter = (loop, asyncio.Event())
+            with self._cond:
+                self._check_any_usable()
+                reservation = self._try_reserve(tokens, exclude)
+                if reservation is None:
+                    self._async_waiters.add(waiter)
+            if reservation is not None:
+                return reservation
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise NoBackendAvailable(f"No LLM backend had capacity within {self.queue_timeout}s")
+                # Token windows and rate-limit pauses expire without a release, so re-check periodically
+                await asyncio.wait_for(waiter[1].wait(), timeout=min(remaining, 0.25))
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._cond:
+                    self._async_waiters.discard(waiter)
+
+    def _release(self, reservation: _Reservation, outcome: str, error: Optional[BaseException] = None):
+        backend = reservation.backend
+        now = time.monotonic()
+        latency = now - reservation.started
+        with self._cond:
+            backend.in_flight -= 1
+            if reservation.probe:
+                backend.probe_in_flight = False
+            # A request dispatched before the circuit opened says nothing about the backend since
+            current = reservation.started >= backend.circuit_opened_at
+            if outcome == "ok":
+                backend.stats["ok"] += 1
+                backend._latencies.append(latency)
+                if current:
+                    backend.consecutive_failures = 0
+                    backend.circuit_open_until = 0.0
+            elif outcome == "rate_limited":
+                backend.stats["rate_limited"] += 1
+                backend.rate_limited_until = now + (_retry_after(error) or self.backoff_base)
+            elif outcome == "cancelled":
+                backend.stats["cancelled"] += 1
+            else:
+                backend.stats["errors"] += 1
+                if outcome == "retryable" and current:
+                    backend.consecutive_failures += 1
+                    if reservation.probe or backend.consecutive_failures >= self.failure_threshold:
+                        backend.circuit_open_until = now + self.circuit_cooldown
+                        backend.circuit_opened_at = now
+                        backend.stats["circuit_opens"] += 1
+                        logger.warning("LLM backend %s circuit opened for %.0fs", backend.name, self.circuit_cooldown)
+            self._cond.notify_all()
+            async_waiters = list(self._async_waiters)
+        for loop, event in async_waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The waiter's loop has been closed
+                pass
+        LLM_BACKEND_LATENCY.observe(latency, backend=backend.name)
+        LLM_BACKEND_REQUESTS.inc(backend=backend.name, outcome=outcome)
+
+    def _backoff(self, attempt: int, error: BaseException) -> float:
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return max(_retry_after(error) or 0.0, random.uniform(0, delay))
+
+    # ---- Calls --------------------------------------------------------------
+
+    def call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None) -> str:
+        tokens = self._estimate_tokens(prompt)
+        callbacks = run_manager.get_child() if run_manager is not None else None
+        tried = set()
+        with self._cond:
+            self._requests += 1
+        for attempt in range(self.max_retries + 1):
+            reservation = self._acquire(tokens, tried)
+            backend = reservation.backend
+            try:
+                text = backend.llm.predict(prompt, stop=stop, callbacks=callbacks)
+            except Exception as e:
+                kind = classify_error(e)
+                self._release(reservation, kind or "error", e)
+                if kind is None or attempt == self.max_retries:
+                    raise
+                tried.add(backend.name)
+                logger.info("LLM backend %s failed (%s), retrying: %s", backend.name, kind, e)
+                time.sleep(self._backoff(attempt, e))
+                continue
+            self._release(reservation, "ok")
+            return text
+
+    async def _ainvoke(self, reservation: _Reservation, prompt: str, stop, callbacks) -> str:
+        try:
+            text = await reservation.backend.llm.apredict(prompt, stop=stop, callbacks=callbacks)
+        except asyncio.CancelledError:
+            self._release(reservation, "cancelled")
+            raise
+        except Exception as e:
+            self._release(reservation, classify_error(e) or "error", e)
+            raise
+        self._release(reservation, "ok")
+        return text
+
+    def _hedge_delay(self, backend: LLMBackend) -> Optional[float]:
+        if self.hedge_percentile is None:
+            return None
+        with self._cond:
+            if len(backend._latencies) < self.hedge_min_samples or len(self.backends) < 2:
+                return None
+            if self._hedges >= self.max_hedge_ratio * self._requests:
+                return None
+            return backend.latency_percentile(self.hedge_percentile)
+
+    async def _ahedged(self, reservation: _Reservation, prompt: str, stop, run_manager, tokens: int) -> str:
+        backend = reservation.backend
+        callbacks = run_manager.get_child() if run_manager is not None else None
+        signal = _FirstTokenSignal()
+        if callbacks is not None:
+            callbacks.add_handler(signal, inherit=False)
+        primary = asyncio.create_task(self._ainvoke(reservation, prompt, stop, callbacks))
+        delay = self._hedge_delay(backend)
+        if delay is None:
+            return await primary
+
+        tasks = {primary}
+        token_wait = asyncio.create_task(signal.event.wait())
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary, token_wait}, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                with self._cond:
+                    second = self._try_reserve(tokens, exclude={backend.name}, strict=True)
+                    if second is not None:
+                        self._hedges += 1
+                        second.backend.stats["hedges"] += 1
+                if second is not None:
+                    # The duplicate does not stream; its text is replayed if it wins
+                    hedge = asyncio.create_task(self._ainvoke(second, prompt, stop, None))
+                    tasks.add(hedge)
+
+            error = None
+            while tasks:
+                waiting = tasks | ({token_wait} if hedge in tasks else set())
+                done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+                if token_wait in done and hedge in tasks:
+                    # The primary is streaming to the client now, so it has to be the answer
+                    hedge.cancel()
+                    tasks.discard(hedge)
+                for task in done & tasks:
+                    tasks.discard(task)
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    if task is hedge:
+                        second.backend.stats["hedge_wins"] += 1
+                        if run_manager is not None:
+                            await run_manager.on_llm_new_token(task.result())
+                    return task.result()
+            raise error
+        finally:
+            for task in (primary, hedge, token_wait):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    async def acall(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None) -> str:
+        tokens = self._estimate_tokens(prompt)
+        tried = set()
+        with self._cond:
+            self._requests += 1
+        for attempt in range(self.max_retries + 1):
+            reservation = await self._aacquire(tokens, tried)
+            try:
+                return await self._ahedged(reservation, prompt, stop, run_manager, tokens)
+            except Exception as e:
+                kind = classify_error(e)
+                if kind is None or attempt == self.max_retries:
+                    raise
+                tried.add(reservation.backend.name)
+                logger.info("LLM backend %s failed (%s), retrying: %s", reservation.backend.name, kind, e)
+                await asyncio.sleep(self._backoff(attempt, e))
+
+    # ---- Stats --------------------------------------------------------------
+
+    def get_stats(self) -> Dict[str, dict]:
+        now = time.monotonic()
+        stats = {}
+        with self._cond:
+            for backend in self.backends:
+                p50, p95, p99 = (backend.latency_percentile(q) for q in (50, 95, 99))
+                stats[backend.name] = {
+                    **backend.stats,
+                    "state": backend.circuit_state(now),
+                    "in_flight": backend.in_flight,
+                    "max_concurrency": backend.max_concurrency,
+                    "tokens_last_minute": backend.tokens_last_minute(now),
+                    "tokens_per_minute": backend.tokens_per_minute,
+                    "latency_p50_ms": round(p50 * 1000.0, 1) if p50 is not None else None,
+                    "latency_p95_ms": round(p95 * 1000.0, 1) if p95 is not None else None,
+                    "latency_p99_ms": round(p99 * 1000.0, 1) if p99 is not None else None,
+                }
+        return stats
+
+class ScheduledLLM(LLM):
+    """
+    LangChain LLM whose completions are routed by an LLMScheduler, so agents, chains and
+    CachedLLM use the backend pool like any single client. Callback handlers of the call are
+    passed on to the backend request (token streaming keeps working).
+    """
+    scheduler: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "scheduled"
+
+    @property
+    def _identifying_params(self) -> Mapping[str, Any]:
+        return {"backends": [backend.name for backend in self.scheduler.backends]}
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> str:
+        return self.scheduler.call(prompt, stop=stop, run_manager=run_manager)
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> str:
+        return await self.scheduler.acall(prompt, stop=stop, run_manager=run_manager)
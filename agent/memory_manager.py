@@ -1,8 +1,21 @@
 # agent/memory_manager.py
 
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from contextlib import contextmanager
 import psycopg2
+from psycopg2 import pool as pg_pool
+from psycopg2.extras import execute_values
 from langchain.memory import ConversationBufferMemory
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
+
+from agent.embeddings import normalize_query
+from agent.metrics import DB_LATENCY, DB_POOL_WAIT
+
+logger = logging.getLogger(__name__)
 
 class MemoryManager:
     def __init__(
@@ -11,29 +24,133 @@ class MemoryManager:
         pg_port: int = 5432,
         pg_database: str = "mydb",
         pg_user: str = "myuser",
-        pg_password: str = "mypassword"
+        pg_password: str = "mypassword",
+        pool_min_size: int = 1,
+        pool_max_size: int = 10,
+        health_check_interval: float = 30.0,
+        write_behind: bool = False,
+        flush_batch_size: int = 100,
+        flush_interval: float = 1.0
     ):
         """
-        Initializes short-term memory and a connection to Postgres for long-term memory & feedback.
+        Initializes short-term memory and a pool of connections to Postgres for long-term memory & feedback.
+
+        Connections are checked out per call, so concurrent requests no longer serialize on a
+        single shared connection. A connection that has been idle for longer than
+        `health_check_interval` seconds is probed with `SELECT 1` before it is handed out.
+
+        With `write_behind=True`, `add_long_term_memory` and `store_feedback` only enqueue their
+        rows; a background thread coalesces them into multi-row statements and flushes whenever
+        `flush_batch_size` rows are pending or `flush_interval` seconds have passed.
+        Call `close()` on shutdown so that pending rows are flushed before the pool is closed.
+
+        Final answers stored with `store_answers` go to a separate `answer_memory` table keyed by
+        a hash of the normalized query and tagged with the scenario collection version, so
+        `lookup_answer` can serve repeat questions (see `ensure_answer_schema`). Plain memories
+        never land there, so an answer shaped by a session's history is never served to others.
         """
         self.short_term_memory = ConversationBufferMemory(memory_key="chat_history")
-        self.conn = psycopg2.connect(
+        self.pool = pg_pool.ThreadedConnectionPool(
+            pool_min_size,
+            pool_max_size,
             host=pg_host,
             port=pg_port,
             database=pg_database,
             user=pg_user,
             password=pg_password
         )
-        self.conn.autocommit = True
+        # ThreadedConnectionPool raises instead of blocking when exhausted,
+        # so callers wait on this semaphore for a free slot.
+        self._pool_slots = threading.BoundedSemaphore(pool_max_size)
+        self._health_check_interval = health_check_interval
+        self._last_used: Dict[int, float] = {}
+
+        # Write-behind state. Memories are keyed so repeated upserts of the same key
+        # within one flush window collapse into a single row (last write wins).
+        self.write_behind = write_behind
+        self.flush_batch_size = flush_batch_size
+        self.flush_interval = flush_interval
+        self._pending_memories: Dict[str, str] = {}
+        self._inflight_memories: Dict[str, str] = {}
+        self._pending_answers: Dict[bytes, tuple] = {}
+        self._inflight_answers: Dict[bytes, tuple] = {}
+        self.trigram_enabled = False
+        self._pending_feedback: List[Tuple[str, str]] = []
+        self._pending_cond = threading.Condition()
+        self._closed = False
+        self._metrics = {
+            "flushes": 0,
+            "flush_errors": 0,
+            "rows_flushed": 0,
+            "last_flush_latency_ms": 0.0,
+            "max_flush_latency_ms": 0.0,
+            "total_flush_latency_ms": 0.0,
+        }
+        self._flush_thread = None
+        if self.write_behind:
+            self._flush_thread = threading.Thread(
+                target=self._flush_loop, name="memory-write-behind", daemon=True
+            )
+            self._flush_thread.start()
 
     def get_short_term_memory(self) -> ConversationBufferMemory:
         return self.short_term_memory
 
+    # ---- Connection pool -------------------------------------------------
+
+    @contextmanager
+    def _connection(self, operation: str = "other"):
+        """
+        Check a healthy connection out of the pool for the duration of the block.
+        Pool wait and time holding the connection are recorded, the latter per `operation`.
+        """
+        waited_from = time.perf_counter()
+        self._pool_slots.acquire()
+        conn = None
+        try:
+            conn = self._checkout_healthy()
+            checked_out = time.perf_counter()
+            DB_POOL_WAIT.observe(checked_out - waited_from)
+            yield conn
+        finally:
+            if conn is not None:
+                DB_LATENCY.observe(time.perf_counter() - checked_out, operation=operation)
+                self._last_used[id(conn)] = time.monotonic()
+                self.pool.putconn(conn, close=bool(conn.closed))
+            self._pool_slots.release()
+
+    def _checkout_healthy(self):
+        conn = self.pool.getconn()
+        last_used = self._last_used.get(id(conn))
+        idle_too_long = last_used is not None and time.monotonic() - last_used > self._health_check_interval
+        if conn.closed or idle_too_long:
+            try:
+                if conn.closed:
+                    raise psycopg2.InterfaceError("connection already closed")
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1;")
+            except psycopg2.Error:
+                # Drop the broken connection; the pool opens a fresh one in its place.
+                self._last_used.pop(id(conn), None)
+                self.pool.putconn(conn, close=True)
+                conn = self.pool.getconn()
+        conn.autocommit = True
+        return conn
+
+    # ---- Long-term memory & feedback ---------------------------------------
+
     def add_long_term_memory(self, key: str, value: str):
         """
         Store or update a memory entry in Postgres.
         """
-        with self.conn.cursor() as cur:
+        if self.write_behind:
+            with self._pending_cond:
+                self._pending_memories[key] = value
+                if self._pending_count() >= self.flush_batch_size:
+                    self._pending_cond.notify()
+            return
+
+        with self._connection("add_long_term_memory") as conn, conn.cursor() as cur:
             sql = """
                 INSERT INTO long_term_memory (memory_key, memory_value)
                 VALUES (%s, %s)
@@ -42,11 +159,45 @@ class MemoryManager:
             """
             cur.execute(sql, (key, value))
 
+    def add_long_term_memories(self, items: List[Tuple[str, str]]):
+        """
+        Store or update several memory entries with one multi-row statement (or one queue update).
+        """
+        # Last write wins for repeated keys, as with successive single upserts
+        rows = dict(items)
+        if not rows:
+            return
+        if self.write_behind:
+            with self._pending_cond:
+                self._pending_memories.update(rows)
+                if self._pending_count() >= self.flush_batch_size:
+                    self._pending_cond.notify()
+            return
+
+        with self._connection("add_long_term_memories") as conn, conn.cursor() as cur:
+            execute_values(
+                cur,
+                """
+                INSERT INTO long_term_memory (memory_key, memory_value)
+                VALUES %s
+                ON CONFLICT (memory_key)
+                DO UPDATE SET memory_value = EXCLUDED.memory_value;
+                """,
+                list(rows.items())
+            )
+
     def retrieve_long_term_memory(self, key: str) -> Optional[str]:
         """
         Retrieve a memory entry by key.
         """
-        with self.conn.cursor() as cur:
+        if self.write_behind:
+            # Read-your-writes: rows still waiting in the write-behind queue win.
+            with self._pending_cond:
+                for queued in (self._pending_memories, self._inflight_memories):
+                    if key in queued:
+                        return queued[key]
+
+        with self._connection("retrieve_long_term_memory") as conn, conn.cursor() as cur:
             sql = "SELECT memory_value FROM long_term_memory WHERE memory_key = %s;"
             cur.execute(sql, (key,))
             row = cur.fetchone()
@@ -56,6 +207,297 @@ class MemoryManager:
         """
         Store user feedback in Postgres.
         """
-        with self.conn.cursor() as cur:
+        if self.write_behind:
+            with self._pending_cond:
+                self._pending_feedback.append((user_query, feedback_text))
+                if self._pending_count() >= self.flush_batch_size:
+                    self._pending_cond.notify()
+            return
+
+        with self._connection("store_feedback") as conn, conn.cursor() as cur:
             sql = "INSERT INTO feedback (user_query, feedback_text) VALUES (%s, %s);"
             cur.execute(sql, (user_query, feedback_text))
+
+    def ensure_session_schema(self):
+        """
+        Create the table evicted session histories are spilled to. Idempotent.
+        """
+        with self._connection("ensure_session_schema") as conn, conn.cursor() as cur:
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS session_memory (
+                    session_id TEXT PRIMARY KEY,
+                    history TEXT NOT NULL,
+                    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                );
+                """
+            )
+
+    def save_session_history(self, session_id: str, history_json: str):
+        """
+        Persist a serialized short-term memory for a session evicted from the in-process store.
+        """
+        with self._connection("save_session_history") as conn, conn.cursor() as cur:
+            sql = """
+                INSERT INTO session_memory (session_id, history, updated_at)
+                VALUES (%s, %s, NOW())
+                ON CONFLICT (session_id)
+                DO UPDATE SET history = EXCLUDED.history, updated_at = EXCLUDED.updated_at;
+            """
+            cur.execute(sql, (session_id, history_json))
+
+    def load_session_history(self, session_id: str) -> Optional[str]:
+        """
+        Fetch the serialized short-term memory of a previously evicted session, if any.
+        """
+        with self._connection("load_session_history") as conn, conn.cursor() as cur:
+            sql = "SELECT history FROM session_memory WHERE session_id = %s;"
+            cur.execute(sql, (session_id,))
+            row = cur.fetchone()
+            return row[0] if row else None
+
+    # ---- Answer reuse --------------------------------------------------------
+
+    @staticmethod
+    def answer_key_hash(query: str) -> bytes:
+        return hashlib.sha256(normalize_query(query).encode("utf-8")).digest()
+
+    def ensure_answer_schema(self):
+        """
+        Create the answer_memory table and its indexes. Idempotent.
+
+        Answers are keyed by the 32-byte SHA-256 of the normalized query (see `normalize_query`),
+        so the primary key and the exact lookup use a fixed-size column, and spelling variants
+        of one question share a row. Similarity lookup is enabled when the pg_trgm extension
+        is available.
+        """
+        with self._connection("ensure_answer_schema") as conn, conn.cursor() as cur:
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS answer_memory (
+                    key_hash BYTEA PRIMARY KEY,
+                    user_query TEXT NOT NULL,
+                    normalized_query TEXT NOT NULL,
+                    answer_xml TEXT NOT NULL,
+                    collection_version TEXT NOT NULL,
+                    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                );
+                """
+            )
+        try:
+            with self._connection("ensure_answer_schema") as conn, conn.cursor() as cur:
+                cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+                cur.execute(
+                    """
+                    CREATE INDEX IF NOT EXISTS answer_memory_query_trgm
+                    ON answer_memory USING gin (normalized_query gin_trgm_ops);
+                    """
+                )
+            self.trigram_enabled = True
+        except psycopg2.Error as e:
+            logger.warning("pg_trgm is unavailable, similar-answer lookup is disabled: %s", e)
+            self.trigram_enabled = False
+
+    def store_answers(self, items: List[Tuple[str, str]], collection_version: str):
+        """
+        Store (user_query, xml_output) answers for reuse, tagged with the collection version they were built from.
+        """
+        rows = {}
+        for query, value in items:
+            key_hash = self.answer_key_hash(query)
+            rows[key_hash] = (key_hash, query, normalize_query(query), value, collection_version)
+        if not rows:
+            return
+        if self.write_behind:
+            with self._pending_cond:
+                self._pending_answers.update(rows)
+                if self._pending_count() >= self.flush_batch_size:
+                    self._pending_cond.notify()
+            return
+
+        with self._connection("store_answers") as conn, conn.cursor() as cur:
+            self._write_answers(cur, list(rows.values()))
+
+    @staticmethod
+    def _write_answers(cur, rows: List[tuple]):
+        execute_values(
+            cur,
+            """
+            INSERT INTO answer_memory
+                (key_hash, user_query, normalized_query, answer_xml, collection_version, updated_at)
+            VALUES %s
+            ON CONFLICT (key_hash)
+            DO UPDATE SET user_query = EXCLUDED.user_query,
+                          normalized_query = EXCLUDED.normalized_query,
+                          answer_xml = EXCLUDED.answer_xml,
+                          collection_version = EXCLUDED.collection_version,
+                          updated_at = EXCLUDED.updated_at;
+            """,
+            rows,
+            template="(%s, %s, %s, %s, %s, NOW())"
+        )
+
+    def lookup_answer(self, query: str, collection_version: str,
+                      similarity_threshold: Optional[float] = None) -> Optional[dict]:
+        """
+        Find a stored answer for `query` built from `collection_version`: first by exact
+        normalized-query hash, then, if `similarity_threshold` is set and pg_trgm is available,
+        the most similar stored query scoring at least that much.
+        Returns {"query", "xml", "match" ("exact"/"similar"), "score"} or None.
+        """
+        normalized = normalize_query(query)
+        key_hash = self.answer_key_hash(query)
+        if self.write_behind:
+            with self._pending_cond:
+                for queued in (self._pending_answers, self._inflight_answers):
+                    row = queued.get(key_hash)
+                    if row is not None and row[4] == collection_version:
+                        return {"query": row[1], "xml": row[3], "match": "exact", "score": 1.0}
+
+        with self._connection("lookup_answer") as conn, conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT user_query, answer_xml FROM answer_memory
+                WHERE key_hash = %s AND collection_version = %s;
+                """,
+                (key_hash, collection_version)
+            )
+            row = cur.fetchone()
+            if row:
+                return {"query": row[0], "xml": row[1], "match": "exact", "score": 1.0}
+            if similarity_threshold is None or not self.trigram_enabled:
+                return None
+
+            # set_limit() makes the indexable % operator apply our threshold
+            cur.execute("SELECT set_limit(%s);", (similarity_threshold,))
+            cur.execute(
+                """
+                SELECT user_query, answer_xml, similarity(normalized_query, %s) AS score
+                FROM answer_memory
+                WHERE normalized_query %% %s AND collection_version = %s
+                ORDER BY score DESC LIMIT 1;
+                """,
+                (normalized, normalized, collection_version)
+            )
+            row = cur.fetchone()
+            if row:
+                return {"query": row[0], "xml": row[1], "match": "similar", "score": float(row[2])}
+            return None
+
+    # ---- Write-behind ------------------------------------------------------
+
+    def _pending_count(self) -> int:
+        return len(self._pending_memories) + len(self._pending_answers) + len(self._pending_feedback)
+
+    def _flush_loop(self):
+        while True:
+            with self._pending_cond:
+                if not self._closed and self._pending_count() < self.flush_batch_size:
+                    self._pending_cond.wait(timeout=self.flush_interval)
+                closing = self._closed
+            self.flush()
+            if closing:
+                return
+
+    def flush(self):
+        """
+        Write every queued memory and feedback row to Postgres as batched multi-row statements.
+        Rows from a failed flush are put back in the queue and retried on the next cycle.
+        """
+        with self._pending_cond:
+            if not self._pending_count():
+                return
+            memories, self._pending_memories = self._pending_memories, {}
+            answers, self._pending_answers = self._pending_answers, {}
+            feedback, self._pending_feedback = self._pending_feedback, []
+            self._inflight_memories = memories
+            self._inflight_answers = answers
+
+        started = time.perf_counter()
+        try:
+            with self._connection("flush") as conn, conn.cursor() as cur:
+                if memories:
+                    execute_values(
+                        cur,
+                        """
+                        INSERT INTO long_term_memory (memory_key, memory_value)
+                        VALUES %s
+                        ON CONFLICT (memory_key)
+                        DO UPDATE SET memory_value = EXCLUDED.memory_value;
+                        """,
+                        list(memories.items())
+                    )
+                if answers:
+                    self._write_answers(cur, list(answers.values()))
+                if feedback:
+                    execute_values(
+                        cur,
+                        "INSERT INTO feedback (user_query, feedback_text) VALUES %s;",
+                        feedback
+                    )
+        except psycopg2.Error:
+            logger.exception(
+                "Write-behind flush failed; %d rows re-queued", len(memories) + len(answers) + len(feedback)
+            )
+            with self._pending_cond:
+                # Newer writes for the same key take precedence over the failed batch.
+                for key, value in memories.items():
+                    self._pending_memories.setdefault(key, value)
+                for key, row in answers.items():
+                    self._pending_answers.setdefault(key, row)
+                self._pending_feedback[:0] = feedback
+                self._inflight_memories = {}
+                self._inflight_answers = {}
+                self._metrics["flush_errors"] += 1
+            return
+
+        latency_ms = (time.perf_counter() - started) * 1000.0
+        with self._pending_cond:
+            self._inflight_memories = {}
+            self._inflight_answers = {}
+            self._metrics["flushes"] += 1
+            self._metrics["rows_flushed"] += len(memories) + len(answers) + len(feedback)
+            self._metrics["last_flush_latency_ms"] = latency_ms
+            self._metrics["max_flush_latency_ms"] = max(self._metrics["max_flush_latency_ms"], latency_ms)
+            self._metrics["total_flush_latency_ms"] += latency_ms
+
+    def get_metrics(self) -> dict:
+        """
+        Snapshot of write-behind queue depth and flush latency.
+        """
+        with self._pending_cond:
+            metrics = dict(self._metrics)
+            metrics["queue_depth"] = self._pending_count()
+        flushes = metrics["flushes"]
+        metrics["avg_flush_latency_ms"] = metrics["total_flush_latency_ms"] / flushes if flushes else 0.0
+        return metrics
+
+    def close(self):
+        """
+        Flush any queued writes and close every pooled connection.
+        """
+        with self._pending_cond:
+            self._closed = True
+            self._pending_cond.notify()
+        if self._flush_thread is not None:
+            self._flush_thread.join()
+        # Anything left over (e.g. after a failed final flush) gets one more attempt.
+        self.flush()
+        self.pool.closeall()
+
+    # ---- Async interface -------------------------------------------------
+    # psycopg2 is a blocking driver, so the async variants offload each call to a
+    # worker thread. This keeps the event loop free to serve other requests while
+    # Postgres round-trips are in flight.
+
+    async def aadd_long_term_memory(self, key: str, value: str):
+        await asyncio.to_thread(self.add_long_term_memory, key, value)
+
+    async def aadd_long_term_memories(self, items: List[Tuple[str, str]]):
+        await asyncio.to_thread(self.add_long_term_memories, items)
+
+    async def aretrieve_long_term_memory(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self.retrieve_long_term_memory, key)
+
+    async def astore_feedback(self, user_query: str, feedback_text: str):
+        await asyncio.to_thread(self.store_feedback, user_query, feedback_text)
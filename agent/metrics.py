@@ -0,0 +1,217 @@
+# agent/metrics.py
+
+import bisect
+import contextvars
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# ---- Metric types -----------------------------------------------------------
+
+def _format_labels(labelnames: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(key, (list(s[0]), s[1], s[2])) for key, s in self._series.items()]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+class MetricsRegistry:
+    """
+    Minimal Prometheus text-format registry. Recording is a dict update under a short lock,
+    so instrumentation can stay on in production. Gauges are read from callbacks at scrape time.
+    """
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._gauges: Dict[str, Tuple[str, Callable[[], float]]] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge_callback(self, name: str, documentation: str, fn: Callable[[], float]):
+        with self._lock:
+            self._gauges[name] = (documentation, fn)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            gauges = list(self._gauges.items())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for name, (documentation, fn) in gauges:
+            try:
+                value = float(fn())
+            except Exception:
+                continue
+            lines.extend([f"# HELP {name} {documentation}", f"# TYPE {name} gauge", f"{name} {value}"])
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+LLM_LATENCY = REGISTRY.histogram(
+    "llm_request_duration_seconds", "LLM call latency by caller.", ("caller",)
+)
+LLM_REQUESTS = REGISTRY.counter(
+    "llm_requests_total", "LLM calls by caller and outcome.", ("caller", "status")
+)
+LLM_TOKENS = REGISTRY.counter(
+    "llm_tokens_total", "LLM tokens by caller and kind (prompt/completion).", ("caller", "kind")
+)
+LLM_BACKEND_LATENCY = REGISTRY.histogram(
+    "llm_backend_request_duration_seconds", "Latency of each request sent to a pooled LLM backend.", ("backend",)
+)
+LLM_BACKEND_REQUESTS = REGISTRY.counter(
+    "llm_backend_requests_total",
+    "Requests per pooled LLM backend by outcome (ok, rate_limited, retryable, error, cancelled).",
+    ("backend", "outcome")
+)
+LLM_PROFILE_LATENCY = REGISTRY.histogram(
+    "llm_profile_request_duration_seconds", "LLM latency by model profile and the model it was routed to.",
+    ("profile", "model")
+)
+LLM_PROFILE_TOKENS = REGISTRY.counter(
+    "llm_profile_tokens_total", "LLM tokens by model profile, model and kind (prompt/completion).",
+    ("profile", "model", "kind")
+)
+LLM_PROFILE_ROUTES = REGISTRY.counter(
+    "llm_profile_routes_total", "Routing decisions by profile, model and reason (primary, long_prompt, fallback).",
+    ("profile", "model", "reason")
+)
+STAGE_LATENCY = REGISTRY.histogram(
+    "pipeline_stage_duration_seconds",
+    "Latency of pipeline stages (rag_embed, rag_search, xml_build, xml_validate, xml_serialize, agent, "
+    "summarize_map, summarize_reduce).",
+    ("stage",)
+)
+DB_LATENCY = REGISTRY.histogram(
+    "db_query_duration_seconds", "Postgres time per operation, excluding pool wait.", ("operation",)
+)
+DB_POOL_WAIT = REGISTRY.histogram(
+    "db_pool_wait_seconds", "Time spent waiting for a pooled Postgres connection."
+)
+RESOURCE_INIT_LATENCY = REGISTRY.histogram(
+    "resource_init_duration_seconds", "Time to create each lazily initialized service object.", ("resource",)
+)
+HTTP_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route and status.", ("route", "status")
+)
+
+# ---- Trace ids --------------------------------------------------------------
+
+trace_id_var: contextvars.ContextVar = contextvars.ContextVar("trace_id", default="-")
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+class TraceIdFilter(logging.Filter):
+    """
+    Adds the current request's trace id to every log record as `trace_id`.
+    """
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = trace_id_var.get()
+        return True
+
+_LOG_HANDLER: Optional[logging.Handler] = None
+_LOG_LOCK = threading.Lock()
+
+def configure_logging(level: Union[int, str, None] = None):
+    """
+    Log to stderr with the trace id on every line. `level` defaults to the LOG_LEVEL
+    environment variable, else INFO. Safe to call more than once: the handler is installed
+    on the root logger only the first time, later calls just update the level.
+    """
+    global _LOG_HANDLER
+    if level is None:
+        level = os.getenv("LOG_LEVEL", "INFO").upper()
+    root = logging.getLogger()
+    with _LOG_LOCK:
+        if _LOG_HANDLER is None:
+            _LOG_HANDLER = logging.StreamHandler()
+            _LOG_HANDLER.addFilter(TraceIdFilter())
+            _LOG_HANDLER.setFormatter(
+                logging.Formatter("%(asctime)s %(levelname)s [%(trace_id)s] %(name)s: %(message)s")
+            )
+            root.addHandler(_LOG_HANDLER)
+        root.setLevel(level)
@@ -0,0 +1,208 @@
+# agent/model_router.py
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Mapping, Optional
+
+from langchain.llms.base import LLM
+from langchain.schema import Generation, LLMResult
+
+from agent.llm_cache import predict_batch
+from agent.metrics import LLM_PROFILE_LATENCY, LLM_PROFILE_ROUTES, LLM_PROFILE_TOKENS
+
+# Profiles the pipeline's call sites declare (see LLMManager.get_llm(profile=...))
+REASONING = "reasoning"
+SUMMARIZE = "summarize"
+REVIEW = "review"
+
+class ModelProfile:
+    """
+    A named use of the LLM and the model(s) serving it.
+
+    Prompts go to `model`. With `escalate_to` set, prompts longer than `max_prompt_tokens`
+    go straight to the escalation model, and with `escalate_on_error` a failed call on `model`
+    is retried there once. Model names refer to LLMManager's model catalog ("default" is the
+    manager's main client).
+    """
+    def __init__(self, name: str, model: str = "default", escalate_to: Optional[str] = None,
+                 max_prompt_tokens: Optional[int] = None, escalate_on_error: bool = True):
+        self.name = name
+        self.model = model
+        self.escalate_to = escalate_to
+        self.max_prompt_tokens = max_prompt_tokens
+        self.escalate_on_error = escalate_on_error
+
+    @classmethod
+    def from_dict(cls, name: str, config: dict) -> "ModelProfile":
+        return cls(
+            name,
+            model=config.get("model", "default"),
+            escalate_to=config.get("escalate_to"),
+            max_prompt_tokens=config.get("max_prompt_tokens"),
+            escalate_on_error=config.get("escalate_on_error", True)
+        )
+
+    def models(self) -> List[str]:
+        return [self.model] + ([self.escalate_to] if self.escalate_to else [])
+
+class ProfileStats:
+    """
+    Calls, routing decisions, tokens and latency per profile and model.
+    """
+    def __init__(self, latency_window: int = 500):
+        self._lock = threading.Lock()
+        self._latency_window = latency_window
+        self._profiles: Dict[str, dict] = {}
+
+    def _entry(self, profile: str, model: str):
+        entry = self._profiles.setdefault(profile, {"calls": 0, "escalations": 0, "models": {}})
+        return entry, entry["models"].setdefault(model, {
+            "calls": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0,
+            "latencies": deque(maxlen=self._latency_window),
+        })
+
+    def record(self, profile: str, model: str, reason: str, latency: float, prompt_tokens: int,
+               completion_tokens: int, error: bool = False):
+        with self._lock:
+            entry, model_entry = self._entry(profile, model)
+            if reason != "fallback":
+                entry["calls"] += 1
+            if reason != "primary":
+                entry["escalations"] += 1
+            model_entry["calls"] += 1
+            model_entry["errors"] += error
+            model_entry["prompt_tokens"] += prompt_tokens
+            model_entry["completion_tokens"] += completion_tokens
+            model_entry["latencies"].append(latency)
+        LLM_PROFILE_ROUTES.inc(profile=profile, model=model, reason=reason)
+        LLM_PROFILE_LATENCY.observe(latency, profile=profile, model=model)
+        LLM_PROFILE_TOKENS.inc(prompt_tokens, profile=profile, model=model, kind="prompt")
+        LLM_PROFILE_TOKENS.inc(completion_tokens, profile=profile, model=model, kind="completion")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            result = {}
+            for profile, entry in self._profiles.items():
+                models = {}
+                for model, stats in entry["models"].items():
+                    latencies = sorted(stats["latencies"])
+                    pick = lambda q: round(latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000.0, 1)
+                    models[model] = {
+                        **{k: v for k, v in stats.items() if k != "latencies"},
+                        "latency_p50_ms": pick(0.50) if latencies else None,
+                        "latency_p95_ms": pick(0.95) if latencies else None,
+                    }
+                result[profile] = {**{k: v for k, v in entry.items() if k != "models"}, "models": models}
+        return result
+
+class RoutedLLM(LLM):
+    """
+    LangChain LLM that serves one ModelProfile: each prompt is routed to the profile's model
+    or its escalation model (see ModelProfile) and recorded in ProfileStats. Callback handlers
+    of the call are passed on to the chosen client. A multi-prompt `generate` sends each
+    model's share of the prompts to it with one `predict_batch` call; `agenerate` runs the
+    prompts concurrently.
+    """
+    profile: Any
+    clients: Any
+    stats: Any
+    token_counter: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed"
+
+    @property
+    def _identifying_params(self) -> Mapping[str, Any]:
+        return {"profile": self.profile.name, "models": self.profile.models()}
+
+    def _route(self, prompt: str):
+        prompt_tokens = self.token_counter.count(prompt)
+        profile = self.profile
+        if profile.escalate_to and profile.max_prompt_tokens is not None and prompt_tokens > profile.max_prompt_tokens:
+            return profile.escalate_to, "long_prompt", prompt_tokens
+        return profile.model, "primary", prompt_tokens
+
+    def _fallback(self, model: str, reason: str) -> Optional[str]:
+        profile = self.profile
+        if reason == "primary" and profile.escalate_on_error and profile.escalate_to not in (None, model):
+            return profile.escalate_to
+        return None
+
+    def _record(self, model: str, reason: str, started: float, prompt_tokens: int,
+                text: Optional[str] = None):
+        self.stats.record(
+            self.profile.name, model, reason, time.perf_counter() - started, prompt_tokens,
+            self.token_counter.count(text) if text else 0, error=text is None
+        )
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> str:
+        model, reason, prompt_tokens = self._route(prompt)
+        callbacks = run_manager.get_child() if run_manager is not None else None
+        while True:
+            started = time.perf_counter()
+            try:
+                text = self.clients[model].predict(prompt, stop=stop, callbacks=callbacks)
+            except Exception:
+                self._record(model, reason, started, prompt_tokens)
+                fallback = self._fallback(model, reason)
+                if fallback is None:
+                    raise
+                model, reason = fallback, "fallback"
+                continue
+            self._record(model, reason, started, prompt_tokens, text)
+            return text
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> str:
+        model, reason, prompt_tokens = self._route(prompt)
+        callbacks = run_manager.get_child() if run_manager is not None else None
+        while True:
+            started = time.perf_counter()
+            try:
+                text = await self.clients[model].apredict(prompt, stop=stop, callbacks=callbacks)
+            except Exception:
+                self._record(model, reason, started, prompt_tokens)
+                fallback = self._fallback(model, reason)
+                if fallback is None:
+                    raise
+                model, reason = fallback, "fallback"
+                continue
+            self._record(model, reason, started, prompt_tokens, text)
+            return text
+
+    def _generate(self, prompts: List[str], stop: Optional[List[str]] = None, run_manager=None,
+                  **kwargs) -> LLMResult:
+        callbacks = run_manager.get_child() if run_manager is not None else None
+        texts: List[Optional[str]] = [None] * len(prompts)
+        groups: Dict[tuple, list] = {}
+        for i, prompt in enumerate(prompts):
+            model, reason, prompt_tokens = self._route(prompt)
+            groups.setdefault((model, reason), []).append((i, prompt_tokens))
+
+        for (model, reason), items in groups.items():
+            while True:
+                started = time.perf_counter()
+                try:
+                    results = predict_batch(
+                        self.clients[model], [prompts[i] for i, _ in items], callbacks=callbacks, stop=stop
+                    )
+                except Exception:
+                    for _, prompt_tokens in items:
+                        self._record(model, reason, started, prompt_tokens)
+                    fallback = self._fallback(model, reason)
+                    if fallback is None:
+                        raise
+                    model, reason = fallback, "fallback"
+                    continue
+                for (i, prompt_tokens), text in zip(items, results):
+                    self._record(model, reason, started, prompt_tokens, text)
+                    texts[i] = text
+                break
+        return LLMResult(generations=[[Generation(text=text)] for text in texts])
+
+    async def _agenerate(self, prompts: List[str], stop: Optional[List[str]] = None, run_manager=None,
+                         **kwargs) -> LLMResult:
+        texts = await asyncio.gather(*(self._acall(prompt, stop=stop, run_manager=run_manager) for prompt in prompts))
+        return LLMResult(generations=[[Generation(text=text)] for text in texts])
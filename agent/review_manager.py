@@ -1,19 +1,48 @@
 # agent/review_manager.py
 
+from typing import List, Tuple
+
+from agent.llm_cache import predict_batch
+from agent.llm_manager import LLMMetricsHandler
+from agent.model_router import REVIEW
+
 class ReviewManager:
+    # Model profile to request from LLMManager.get_llm
+    llm_profile = REVIEW
+
     def __init__(self, llm):
         self.llm = llm
+        self.callbacks = [LLMMetricsHandler("review")]
 
-    def generate_review(self, user_query: str, xml_output: str) -> str:
-        """
-        The agent critiques its own output, suggesting potential improvements for next time.
-        """
-        prompt = f"""
+    def _build_prompt(self, user_query: str, xml_output: str) -> str:
+        return f"""
         The user asked: {user_query}
         The agent produced this XML: {xml_output}
 
         Please critique this output, noting any possible improvements, missing details,
         or alternative approaches that might yield a better result in future interactions.
         """
-        review = self.llm.predict(prompt=prompt)
+
+    def generate_review(self, user_query: str, xml_output: str) -> str:
+        """
+        The agent critiques its own output, suggesting potential improvements for next time.
+        """
+        prompt = self._build_prompt(user_query, xml_output)
+        review = self.llm.predict(prompt, callbacks=self.callbacks)
         return review
+
+    async def agenerate_review(self, user_query: str, xml_output: str) -> str:
+        """
+        Async variant of `generate_review` that awaits the LLM call natively.
+        """
+        prompt = self._build_prompt(user_query, xml_output)
+        review = await self.llm.apredict(prompt, callbacks=self.callbacks)
+        return review
+
+    def generate_reviews(self, items: List[Tuple[str, str]]) -> List[str]:
+        """
+        Review several (user_query, xml_output) pairs concurrently (in one request where the
+        client batches prompts, see `predict_batch`).
+        """
+        prompts = [self._build_prompt(user_query, xml_output) for user_query, xml_output in items]
+        return predict_batch(self.llm, prompts, callbacks=self.callbacks)
@@ -0,0 +1,257 @@
+# agent/review_queue.py
+
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class ReviewQueue:
+    """
+    Durable SQLite-backed queue of self-review jobs, drained by a pool of background workers.
+
+    `enqueue` only records the job, so the request that produced the XML does not wait for
+    the review generation. Each worker claims up to `batch_size` pending jobs and reviews them
+    together (`ReviewManager.generate_reviews` runs the LLM calls concurrently). Finished
+    reviews are stored in long-term memory under "<user_query>_review" and can be fetched with `get`.
+    Jobs that fail are retried with exponential backoff up to `max_attempts` times.
+
+    Several processes (e.g. uvicorn workers) can share one database. A claim marks the jobs
+    "running" under this queue's `owner` with a lease of `lease_seconds` in a single
+    `BEGIN IMMEDIATE` transaction, so no two workers claim the same job. Jobs whose owner
+    died are claimed again once their lease expires.
+    """
+    def __init__(
+        self,
+        review_manager,
+        memory_manager=None,
+        db_path: str = "review_queue.sqlite3",
+        workers: int = 2,
+        batch_size: int = 8,
+        poll_interval: float = 1.0,
+        max_attempts: int = 3,
+        lease_seconds: float = 600.0
+    ):
+        self.review_manager = review_manager
+        self.memory_manager = memory_manager
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._finished = threading.Condition()
+        self._stop = threading.Event()
+
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL;")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS review_jobs (
+                request_id TEXT PRIMARY KEY,
+                user_query TEXT NOT NULL,
+                xml_output TEXT NOT NULL,
+                status TEXT NOT NULL,
+                review TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                owner TEXT,
+                lease_expires REAL
+            );
+            """
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(review_jobs);")}
+        for column, kind in (("owner", "TEXT"), ("lease_expires", "REAL")):
+            if column not in columns:
+                # Databases created before leases were recorded
+                self._db.execute(f"ALTER TABLE review_jobs ADD COLUMN {column} {kind};")
+        self._db.execute("CREATE INDEX IF NOT EXISTS review_jobs_pending ON review_jobs (status, available_at);")
+        self._db.commit()
+
+        self._workers = [
+            threading.Thread(target=self._work_loop, name=f"review-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def enqueue(self, request_id: str, user_query: str, xml_output: str) -> str:
+        self.enqueue_many([(request_id, user_query, xml_output)])
+        return request_id
+
+    def enqueue_many(self, jobs: List[Tuple[str, str, str]]):
+        """
+        Queue several (request_id, user_query, xml_output) jobs in one transaction.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                """
+                INSERT INTO review_jobs
+                    (request_id, user_query, xml_output, status, available_at, created_at, updated_at)
+                VALUES (?, ?, ?, 'pending', ?, ?, ?)
+                ON CONFLICT (request_id) DO NOTHING;
+                """,
+                [(request_id, user_query, xml_output, now, now, now) for request_id, user_query, xml_output in jobs]
+            )
+            self._db.commit()
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def get(self, request_id: str) -> Optional[dict]:
+        """
+        Return the job's status ("pending", "running", "done" or "failed") and its review, if any.
+        """
+        with self._lock:
+            row = self._db.execute(
+                """
+                SELECT request_id, status, review, error, attempts, created_at, updated_at
+                FROM review_jobs WHERE request_id = ?;
+                """,
+                (request_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("request_id", "status", "review", "error", "attempts", "created_at", "updated_at")
+        return dict(zip(keys, row))
+
+    def wait(self, request_id: str, timeout: Optional[float] = None) -> Optional[dict]:
+        """
+        Block until the job is done or failed (or `timeout` elapses) and return it.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._finished:
+            while True:
+                job = self.get(request_id)
+                if job is None or job["status"] in ("done", "failed"):
+                    return job
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return job
+                self._finished.wait(remaining if remaining is not None else self.poll_interval)
+
+    def _claim(self) -> List[tuple]:
+        now = time.time()
+        with self._lock:
+            # Takes the database write lock before reading, so other processes wait rather than
+            # selecting the same jobs
+            self._db.execute("BEGIN IMMEDIATE;")
+            try:
+                # A job whose lease keeps expiring is taking its worker down with it
+                self._db.execute(
+                    """
+                    UPDATE review_jobs SET status = 'failed', error = 'lease expired', owner = NULL, updated_at = ?
+                    WHERE status = 'running' AND lease_expires <= ? AND attempts >= ?;
+                    """,
+                    (now, now, self.max_attempts)
+                )
+                rows = self._db.execute(
+                    """
+                    SELECT request_id, user_query, xml_output, attempts FROM review_jobs
+                    WHERE (status = 'pending' AND available_at <= ?)
+                       OR (status = 'running' AND lease_expires <= ?)
+                    ORDER BY created_at LIMIT ?;
+                    """,
+                    (now, now, self.batch_size)
+                ).fetchall()
+                self._db.executemany(
+                    """
+                    UPDATE review_jobs SET status = 'running', attempts = attempts + 1, owner = ?,
+                                           lease_expires = ?, updated_at = ?
+                    WHERE request_id = ?;
+                    """,
+                    [(self.owner, now + self.lease_seconds, now, row[0]) for row in rows]
+                )
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+        return rows
+
+    def _work_loop(self):
+        while not self._stop.is_set():
+            try:
+                jobs = self._claim()
+            except sqlite3.OperationalError as e:
+                # Another process held the write lock past the busy timeout; try again next poll
+                logger.warning("Could not claim review jobs: %s", e)
+                jobs = []
+            if not jobs:
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+            self._process(jobs)
+
+    def _process(self, jobs: List[tuple]):
+        started = time.perf_counter()
+        try:
+            reviews = self.review_manager.generate_reviews([(job[1], job[2]) for job in jobs])
+            if self.memory_manager is not None:
+                self.memory_manager.add_long_term_memories(
+                    [(f"{job[1]}_review", review) for job, review in zip(jobs, reviews)]
+                )
+        except Exception as e:
+            logger.exception("Review batch of %d failed", len(jobs))
+            self._fail(jobs, str(e))
+            return
+
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                """
+                UPDATE review_jobs SET status = 'done', review = ?, error = NULL, owner = NULL, updated_at = ?
+                WHERE request_id = ? AND owner = ?;
+                """,
+                [(review, now, job[0], self.owner) for job, review in zip(jobs, reviews)]
+            )
+            self._db.commit()
+        logger.info("Reviewed %d job(s) in %.2fs", len(jobs), time.perf_counter() - started)
+        with self._finished:
+            self._finished.notify_all()
+
+    def _fail(self, jobs: List[tuple], error: str):
+        now = time.time()
+        updates = []
+        for request_id, _, _, attempts in jobs:
+            # `attempts` was read before this claim incremented it
+            status = "failed" if attempts + 1 >= self.max_attempts else "pending"
+            updates.append((status, error, now + 2 ** attempts, now, request_id, self.owner))
+        with self._lock:
+            # The owner check skips jobs whose lease expired and that another worker now holds
+            self._db.executemany(
+                """
+                UPDATE review_jobs SET status = ?, error = ?, available_at = ?, owner = NULL, updated_at = ?
+                WHERE request_id = ? AND owner = ?;
+                """,
+                updates
+            )
+            self._db.commit()
+        with self._finished:
+            self._finished.notify_all()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM review_jobs GROUP BY status;").fetchall()
+        return dict(rows)
+
+    def close(self, timeout: float = 30.0):
+        """
+        Stop the workers after their current batch; pending jobs stay queued for the next start.
+        """
+        self._stop.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for worker in self._workers:
+            worker.join(timeout=timeout)
+        with self._lock:
+            self._db.close()
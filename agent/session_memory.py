@@ -0,0 +1,187 @@
+# agent/session_memory.py
+
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+from langchain.memory import (
+    ConversationBufferWindowMemory,
+    ConversationSummaryBufferMemory,
+    ConversationTokenBufferMemory,
+)
+from langchain.schema import messages_from_dict, messages_to_dict
+from typing import List, Optional, Tuple
+
+class _TrimmedWindowMemory(ConversationBufferWindowMemory):
+    """
+    ConversationBufferWindowMemory only hides turns outside the window but keeps
+    every message. This variant drops them so a long session stays bounded.
+    """
+    def save_context(self, inputs, outputs) -> None:
+        super().save_context(inputs, outputs)
+        overflow = len(self.chat_memory.messages) - self.k * 2
+        if overflow > 0:
+            del self.chat_memory.messages[:overflow]
+
+class _SessionEntry:
+    __slots__ = ("memory", "last_access")
+
+    def __init__(self, memory):
+        self.memory = memory
+        self.last_access = time.monotonic()
+
+class SessionMemoryStore:
+    """
+    Keeps one bounded short-term memory per session id.
+
+    Each session is limited either by a turn window (`window_turns`) or, when an LLM is
+    given, by a token window (`max_token_limit`). With `summarize_older_turns=True` the
+    turns falling out of the token window are folded into a running summary instead of
+    being dropped.
+
+    Idle sessions are evicted after `session_ttl` seconds, and the least recently used
+    ones are evicted whenever more than `max_sessions` are held or their combined text
+    exceeds `max_total_chars`. If a `memory_manager` is given, evicted sessions are spilled
+    to Postgres and restored transparently the next time the session is used
+    (the `session_memory` table is created on construction unless `ensure_schema=False`).
+    """
+    def __init__(
+        self,
+        llm=None,
+        window_turns: int = 5,
+        max_token_limit: Optional[int] = None,
+        summarize_older_turns: bool = False,
+        session_ttl: float = 1800.0,
+        max_sessions: int = 1000,
+        max_total_chars: int = 20_000_000,
+        memory_manager=None,
+        ensure_schema: bool = True
+    ):
+        if (summarize_older_turns or max_token_limit) and llm is None:
+            raise ValueError("Token windows and summarization need an llm to count tokens.")
+        self.llm = llm
+        self.window_turns = window_turns
+        self.max_token_limit = max_token_limit or 2000
+        self.use_token_window = max_token_limit is not None
+        self.summarize_older_turns = summarize_older_turns
+        self.session_ttl = session_ttl
+        self.max_sessions = max_sessions
+        self.max_total_chars = max_total_chars
+        self.memory_manager = memory_manager
+        self._sessions: "OrderedDict[str, _SessionEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        if memory_manager is not None and ensure_schema:
+            memory_manager.ensure_session_schema()
+
+    def _new_memory(self):
+        if self.summarize_older_turns:
+            return ConversationSummaryBufferMemory(
+                llm=self.llm, max_token_limit=self.max_token_limit, memory_key="chat_history"
+            )
+        if self.use_token_window:
+            return ConversationTokenBufferMemory(
+                llm=self.llm, max_token_limit=self.max_token_limit, memory_key="chat_history"
+            )
+        return _TrimmedWindowMemory(k=self.window_turns, memory_key="chat_history")
+
+    def get(self, session_id: str, new: bool = False):
+        """
+        Return the memory bound to `session_id`, restoring or creating it as needed.
+        Pass `new=True` for an id the caller just generated: there is nothing to restore.
+        """
+        with self._lock:
+            entry = self._sessions.get(session_id)
+
+        if entry is None:
+            # Restoring may hit Postgres, so it happens outside the lock
+            memory = (None if new else self._restore(session_id)) or self._new_memory()
+            with self._lock:
+                # Another request for the same session may have won the race
+                entry = self._sessions.setdefault(session_id, _SessionEntry(memory))
+
+        with self._lock:
+            entry.last_access = time.monotonic()
+            if session_id in self._sessions:
+                self._sessions.move_to_end(session_id)
+            evicted = self._collect_evictions(keep=session_id)
+
+        self._spill(evicted)
+        return entry.memory
+
+    async def aget(self, session_id: str, new: bool = False):
+        """
+        Async variant of `get`; restoring and spilling may touch Postgres, so it runs in a thread.
+        """
+        return await asyncio.to_thread(self.get, session_id, new)
+
+    def evict_idle(self):
+        """
+        Evict sessions idle for longer than the TTL. `get` does this lazily as well.
+        """
+        with self._lock:
+            evicted = self._collect_evictions()
+        self._spill(evicted)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    @staticmethod
+    def has_history(memory) -> bool:
+        """
+        Whether the memory holds any prior turns (or a summary of them).
+        """
+        return SessionMemoryStore._memory_size(memory) > 0
+
+    # ---- Eviction ------------------------------------------------------------
+
+    @staticmethod
+    def _memory_size(memory) -> int:
+        size = sum(len(m.content) for m in memory.chat_memory.messages)
+        return size + len(getattr(memory, "moving_summary_buffer", "") or "")
+
+    def _collect_evictions(self, keep: Optional[str] = None) -> List[Tuple[str, object]]:
+        # Called with the lock held. The OrderedDict is kept in LRU order (oldest first).
+        evicted = []
+        now = time.monotonic()
+        for session_id in list(self._sessions):
+            if session_id != keep and now - self._sessions[session_id].last_access > self.session_ttl:
+                evicted.append((session_id, self._sessions.pop(session_id).memory))
+
+        total_chars = sum(self._memory_size(e.memory) for e in self._sessions.values())
+        for session_id in list(self._sessions):
+            if len(self._sessions) <= self.max_sessions and total_chars <= self.max_total_chars:
+                break
+            if session_id == keep:
+                continue
+            memory = self._sessions.pop(session_id).memory
+            total_chars -= self._memory_size(memory)
+            evicted.append((session_id, memory))
+        return evicted
+
+    # ---- Postgres spill --------------------------------------------------------
+
+    def _spill(self, evicted: List[Tuple[str, object]]):
+        if self.memory_manager is None:
+            return
+        for session_id, memory in evicted:
+            if not memory.chat_memory.messages and not getattr(memory, "moving_summary_buffer", ""):
+                continue
+            payload = json.dumps({
+                "messages": messages_to_dict(memory.chat_memory.messages),
+                "summary": getattr(memory, "moving_summary_buffer", ""),
+            })
+            self.memory_manager.save_session_history(session_id, payload)
+
+    def _restore(self, session_id: str):
+        if self.memory_manager is None:
+            return None
+        payload = self.memory_manager.load_session_history(session_id)
+        if payload is None:
+            return None
+        data = json.loads(payload)
+        memory = self._new_memory()
+        memory.chat_memory.messages = messages_from_dict(data.get("messages", []))
+        if data.get("summary") and hasattr(memory, "moving_summary_buffer"):
+            memory.moving_summary_buffer = data["summary"]
+        return memory
@@ -0,0 +1,66 @@
+# agent/singleflight.py
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from agent.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """
+    Coalesces concurrent async calls that share a key onto one in-flight computation.
+
+    The first caller for a key starts the computation; callers that arrive while it is running
+    wait for it and get the same result (or the same exception). With `window > 0` a successful
+    result is also handed to callers arriving up to `window` seconds after it finished.
+    The computation runs in its own task, so a caller that goes away (e.g. a client
+    disconnect) does not cancel it for the others.
+    """
+    def __init__(self, window: float = 0.0, max_recent: int = 1024):
+        self.window = window
+        self._inflight: Dict[Hashable, "asyncio.Task"] = {}
+        self._recent = TTLCache(max_entries=max_recent, ttl=window) if window > 0 else None
+        self._metrics = {"calls": 0, "executions": 0, "coalesced": 0, "recent_hits": 0, "errors": 0}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Return `(result, shared)`; `shared` is True when the result came from another caller's run.
+        """
+        self._metrics["calls"] += 1
+        if self._recent is not None:
+            recent = self._recent.get(key)
+            if recent is not None:
+                self._metrics["recent_hits"] += 1
+                return recent, True
+
+        task = self._inflight.get(key)
+        shared = task is not None
+        if shared:
+            self._metrics["coalesced"] += 1
+        else:
+            self._metrics["executions"] += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda finished: self._finished(key, finished))
+        return await asyncio.shield(task), shared
+
+    def _finished(self, key: Hashable, task: "asyncio.Task"):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            self._metrics["errors"] += 1
+            logger.debug("Single-flight call for %r failed: %s", key, task.exception())
+        elif self._recent is not None:
+            self._recent.set(key, task.result())
+
+    def get_metrics(self) -> dict:
+        metrics = dict(self._metrics)
+        metrics["inflight"] = len(self._inflight)
+        metrics["coalesce_rate"] = (
+            (metrics["coalesced"] + metrics["recent_hits"]) / metrics["calls"] if metrics["calls"] else 0.0
+        )
+        return metrics
@@ -0,0 +1,70 @@
+# agent/streaming.py
+
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, Optional
+
+from langchain.callbacks.base import AsyncCallbackHandler
+
+from agent.custom_agent import FinalAnswerStreamer
+
+def format_sse(event: str, data: Any) -> str:
+    """
+    Encode one Server-Sent Event with a JSON payload.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+class AgentEventStream(AsyncCallbackHandler):
+    """
+    Collects agent progress while a ReAct run is in flight.
+
+    Tool starts/ends become progress events, and the tokens of each LLM step are passed
+    through a FinalAnswerStreamer so that only the final answer is forwarded, token by token,
+    while the model is still generating it. Events are consumed with `iter_events`.
+    """
+    def __init__(self, max_preview_chars: int = 300):
+        self.queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+        self.max_preview_chars = max_preview_chars
+        self._answer = FinalAnswerStreamer()
+
+    async def on_llm_start(self, serialized: Dict[str, Any], prompts, **kwargs) -> None:
+        # Each ReAct step is a fresh generation; only the one that answers gets streamed
+        self._answer.reset()
+
+    async def on_chat_model_start(self, serialized: Dict[str, Any], messages, **kwargs) -> None:
+        self._answer.reset()
+
+    async def on_llm_new_token(self, token: str, **kwargs) -> None:
+        text = self._answer.feed(token)
+        if text:
+            self.queue.put_nowait({"event": "token", "data": {"text": text}})
+
+    async def on_tool_start(self, serialized: Dict[str, Any], input_str: str, **kwargs) -> None:
+        self.queue.put_nowait({
+            "event": "tool_start",
+            "data": {"tool": serialized.get("name"), "input": input_str[:self.max_preview_chars]},
+        })
+
+    async def on_tool_end(self, output: str, name: Optional[str] = None, **kwargs) -> None:
+        self.queue.put_nowait({
+            "event": "tool_end",
+            "data": {"tool": name, "output_preview": str(output)[:self.max_preview_chars]},
+        })
+
+    async def on_tool_error(self, error: BaseException, **kwargs) -> None:
+        self.queue.put_nowait({"event": "tool_error", "data": {"error": str(error)}})
+
+    async def iter_events(self, task: "asyncio.Task") -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield queued events until `task` (the agent run) has finished and the queue is drained.
+        """
+        while True:
+            next_event = asyncio.ensure_future(self.queue.get())
+            done, _ = await asyncio.wait({next_event, task}, return_when=asyncio.FIRST_COMPLETED)
+            if next_event in done:
+                yield next_event.result()
+                continue
+            next_event.cancel()
+            while not self.queue.empty():
+                yield self.queue.get_nowait()
+            return
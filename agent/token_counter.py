@@ -0,0 +1,70 @@
+# agent/token_counter.py
+
+import logging
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+class TokenCounter:
+    """
+    Counts and truncates text in model tokens.
+
+    Uses tiktoken when it is installed and its encoding can be loaded (the first load downloads
+    it, which fails offline); otherwise falls back to the usual ~4 characters per token
+    estimate, which is close enough for budgeting English prompts.
+    """
+    def __init__(self, model: str = "gpt-3.5-turbo"):
+        self.model = model
+        try:
+            import tiktoken
+            try:
+                self._encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+        except ImportError:
+            self._encoding = None
+        except Exception as e:
+            logger.warning("Could not load the tiktoken encoding for %s (%s); estimating 4 chars per token",
+                           model, e)
+            self._encoding = None
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return (len(text) + 3) // 4
+
+    def truncate(self, text: str, max_tokens: int, marker: str = " ...[truncated]") -> str:
+        """
+        Keep the beginning of `text` so that it fits in `max_tokens` (marker included).
+        """
+        if self.count(text) <= max_tokens:
+            return text
+        budget = max(0, max_tokens - self.count(marker))
+        if self._encoding is not None:
+            head = self._encoding.decode(self._encoding.encode(text, disallowed_special=())[:budget])
+        else:
+            head = text[:budget * 4]
+        return head + marker
+
+    def split(self, text: str, chunk_tokens: int, overlap_tokens: int = 0) -> List[str]:
+        """
+        Split `text` into consecutive pieces of at most `chunk_tokens` tokens, each starting
+        `overlap_tokens` before the end of the previous one. The last piece reaches the end of
+        the text, so no piece is contained in the one before it.
+        """
+        step = max(1, chunk_tokens - overlap_tokens)
+        if self._encoding is not None:
+            tokens = self._encoding.encode(text, disallowed_special=())
+            return [self._encoding.decode(tokens[i:i + chunk_tokens])
+                    for i in self._starts(len(tokens), chunk_tokens, step)]
+        chunk_chars, step_chars = chunk_tokens * 4, step * 4
+        return [text[i:i + chunk_chars] for i in self._starts(len(text), chunk_chars, step_chars)]
+
+    @staticmethod
+    def _starts(length: int, size: int, step: int) -> range:
+        # Stops at the first window that reaches `length`
+        if not length:
+            return range(0)
+        return range(0, max(length - size, 0) + step, step)
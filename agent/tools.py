@@ -1,51 +1,225 @@
 # agent/tools.py
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.vectorstores import Chroma
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from langchain.docstore.document import Document
 from langchain.tools import BaseTool
-from typing import List
+from typing import Any, ClassVar, List, Optional
+
+from agent.embeddings import EmbeddingProvider, bind_collection_to_provider, get_embedding_provider, normalize_query
+from agent.llm_manager import LLMMetricsHandler
+from agent.metrics import STAGE_LATENCY
+from agent.model_router import SUMMARIZE
+from agent.token_counter import TokenCounter
+from agent.ttl_cache import TTLCache
+from agent.vector_store import CollectionVersion, open_vector_store
 
 class RAGSearchTool(BaseTool):
     """
-    A tool that performs similarity search on a ChromaDB for relevant documents.
+    A tool that performs similarity search on the scenario vector store for relevant documents.
+    The backend (Chroma or the memory-mapped NumPy store) comes from `vector_store_backend`.
+
+    Results are cached by normalized query, `k` and the collection version, so repeated
+    searches within a ReAct run or across users skip embedding and retrieval. Ingestion bumps
+    the version, which retires every cached result for the old contents.
     """
     name = "search_tool"
-    description = "Useful for searching scenario data using Chroma-based RAG."
+    description = "Useful for searching scenario data using vector-store RAG."
+    embedding_function: Any = None
+    vectorstore: Any = None
+    k: int = 3
+    max_chars_per_result: Optional[int] = None
+    result_cache: Any = None
+    collection_version: Any = None
 
-    def __init__(self, collection_name: str = "scenario_collection", persist_directory: str = "chroma_db"):
+    def __init__(self, collection_name: str = "scenario_collection", persist_directory: str = "chroma_db",
+                 embedding_provider: EmbeddingProvider = None, vector_store_backend: str = None,
+                 k: int = 3, max_chars_per_result: Optional[int] = 2000,
+                 cache_size: int = 1024, cache_ttl: Optional[float] = 600.0):
         super().__init__()
-        self.embedding_function = OpenAIEmbeddings()  # or local embedding model
-        self.vectorstore = Chroma(
+        # Must be the same provider the collection was ingested with; checked below
+        self.embedding_function = embedding_provider or get_embedding_provider()
+        self.vectorstore = open_vector_store(
+            backend=vector_store_backend,
             collection_name=collection_name,
             persist_directory=persist_directory,
             embedding_function=self.embedding_function
         )
+        bind_collection_to_provider(self.vectorstore, self.embedding_function)
+        self.k = k
+        self.max_chars_per_result = max_chars_per_result
+        self.result_cache = TTLCache(max_entries=cache_size, ttl=cache_ttl)
+        self.collection_version = CollectionVersion(collection_name, persist_directory)
+
+    def _cache_key(self, query: str):
+        return (normalize_query(query), self.k, self.collection_version.current())
+
+    def _combine(self, docs: List[Document]) -> str:
+        if self.max_chars_per_result:
+            return "\n\n".join([d.page_content[:self.max_chars_per_result] for d in docs])
+        return "\n\n".join([d.page_content for d in docs])
+
+    def get_cache_stats(self) -> dict:
+        return self.result_cache.get_stats()
 
     def _run(self, query: str) -> str:
-        docs: List[Document] = self.vectorstore.similarity_search(query, k=3)
-        combined = "\n\n".join([d.page_content for d in docs])
+        key = self._cache_key(query)
+        cached = self.result_cache.get(key)
+        if cached is not None:
+            return cached
+        with STAGE_LATENCY.time(stage="rag_embed"):
+            query_embedding = self.embedding_function.embed_query(query)
+        with STAGE_LATENCY.time(stage="rag_search"):
+            docs: List[Document] = self.vectorstore.similarity_search_by_vector(query_embedding, k=self.k)
+        combined = self._combine(docs)
+        self.result_cache.set(key, combined)
         return combined
 
     async def _arun(self, query: str) -> str:
-        # Not implementing async version for this demo
-        raise NotImplementedError("RAGSearchTool does not support async")
+        key = self._cache_key(query)
+        cached = self.result_cache.get(key)
+        if cached is not None:
+            return cached
+        # The embedding round-trip is the slow, network-bound part, so it is awaited natively.
+        # The vector store lookup itself is local and runs in a worker thread to keep the loop free.
+        with STAGE_LATENCY.time(stage="rag_embed"):
+            query_embedding = await self.embedding_function.aembed_query(query)
+        with STAGE_LATENCY.time(stage="rag_search"):
+            docs: List[Document] = await asyncio.to_thread(
+                self.vectorstore.similarity_search_by_vector, query_embedding, k=self.k
+            )
+        combined = self._combine(docs)
+        self.result_cache.set(key, combined)
+        return combined
 
 class SummarizeTool(BaseTool):
     """
     A tool that can be used to summarize text using the same LLM or a different chain.
+
+    Inputs up to `map_reduce_threshold_tokens` are summarized with a single call. Longer ones
+    are split into `chunk_tokens`-token chunks that are summarized concurrently (at most
+    `max_parallel_chunks` at a time), and the partial summaries are combined in groups that fit
+    in one chunk, level by level, until a single summary remains. Chunk summaries are cached by
+    content hash, so inputs that share chunks (the same document re-observed or extended)
+    reuse the earlier work.
     """
     name = "summarize_tool"
     description = "Useful for summarizing long text into a concise form."
+    # Model profile to request from LLMManager.get_llm
+    llm_profile: ClassVar[str] = SUMMARIZE
+    llm: Any = None
+    llm_callbacks: Any = None
+    map_reduce_threshold_tokens: int = 3000
+    chunk_tokens: int = 2000
+    chunk_overlap_tokens: int = 100
+    max_parallel_chunks: int = 4
+    token_counter: Any = None
+    chunk_cache: Any = None
 
-    def __init__(self, llm):
+    def __init__(self, llm, map_reduce_threshold_tokens: int = 3000, chunk_tokens: int = 2000,
+                 chunk_overlap_tokens: int = 100, max_parallel_chunks: int = 4,
+                 chunk_cache_size: int = 1024, chunk_cache_ttl: Optional[float] = 3600.0,
+                 token_counter: Optional[TokenCounter] = None):
         super().__init__()
         self.llm = llm
+        self.llm_callbacks = [LLMMetricsHandler("summarize_tool")]
+        self.map_reduce_threshold_tokens = map_reduce_threshold_tokens
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap_tokens = chunk_overlap_tokens
+        self.max_parallel_chunks = max_parallel_chunks
+        self.token_counter = token_counter or TokenCounter()
+        self.chunk_cache = TTLCache(max_entries=chunk_cache_size, ttl=chunk_cache_ttl)
+
+    @staticmethod
+    def _summary_prompt(text: str) -> str:
+        return f"Please provide a concise summary of the following text:\n{text}"
+
+    @staticmethod
+    def _chunk_prompt(text: str) -> str:
+        return (
+            "The following is one part of a longer text. Summarize it concisely, keeping names, "
+            f"numbers and other concrete details:\n{text}"
+        )
+
+    @staticmethod
+    def _combine_prompt(summaries: List[str]) -> str:
+        joined = "\n\n".join(f"- {summary.strip()}" for summary in summaries)
+        return f"Combine these summaries of consecutive parts of one text into a single concise summary:\n{joined}"
+
+    def _chunk_key(self, chunk: str) -> str:
+        return hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+
+    def _combine_groups(self, summaries: List[str]) -> List[List[str]]:
+        """
+        Consecutive groups of summaries whose combined size fits in one chunk (at least two per group).
+        """
+        groups, current, current_tokens = [], [], 0
+        for summary in summaries:
+            tokens = self.token_counter.count(summary)
+            if len(current) >= 2 and current_tokens + tokens > self.chunk_tokens:
+                groups.append(current)
+                current, current_tokens = [], 0
+            current.append(summary)
+            current_tokens += tokens
+        if len(current) == 1 and groups:
+            groups[-1].append(current[0])
+        elif current:
+            groups.append(current)
+        return groups
+
+    def _needs_map_reduce(self, text: str) -> bool:
+        return self.token_counter.count(text) > self.map_reduce_threshold_tokens
 
     def _run(self, text: str) -> str:
-        # In a real system, you'd create a SummarizationChain or a direct LLM call
-        prompt = f"Please provide a concise summary of the following text:\n{text}"
-        summary = self.llm.predict(prompt=prompt)
-        return summary
+        if not self._needs_map_reduce(text):
+            return self.llm.predict(self._summary_prompt(text), callbacks=self.llm_callbacks)
+
+        def summarize_chunk(chunk: str) -> str:
+            key = self._chunk_key(chunk)
+            summary = self.chunk_cache.get(key)
+            if summary is None:
+                summary = self.llm.predict(self._chunk_prompt(chunk), callbacks=self.llm_callbacks)
+                self.chunk_cache.set(key, summary)
+            return summary
+
+        def combine(group: List[str]) -> str:
+            return self.llm.predict(self._combine_prompt(group), callbacks=self.llm_callbacks)
+
+        chunks = self.token_counter.split(text, self.chunk_tokens, self.chunk_overlap_tokens)
+        with ThreadPoolExecutor(max_workers=self.max_parallel_chunks) as pool:
+            with STAGE_LATENCY.time(stage="summarize_map"):
+                summaries = list(pool.map(summarize_chunk, chunks))
+            with STAGE_LATENCY.time(stage="summarize_reduce"):
+                while len(summaries) > 1:
+                    summaries = list(pool.map(combine, self._combine_groups(summaries)))
+        return summaries[0]
 
     async def _arun(self, text: str) -> str:
-        raise NotImplementedError("SummarizeTool does not support async")
+        if not self._needs_map_reduce(text):
+            return await self.llm.apredict(self._summary_prompt(text), callbacks=self.llm_callbacks)
+
+        semaphore = asyncio.Semaphore(self.max_parallel_chunks)
+
+        async def summarize_chunk(chunk: str) -> str:
+            key = self._chunk_key(chunk)
+            summary = self.chunk_cache.get(key)
+            if summary is None:
+                async with semaphore:
+                    summary = await self.llm.apredict(self._chunk_prompt(chunk), callbacks=self.llm_callbacks)
+                self.chunk_cache.set(key, summary)
+            return summary
+
+        async def combine(group: List[str]) -> str:
+            async with semaphore:
+                return await self.llm.apredict(self._combine_prompt(group), callbacks=self.llm_callbacks)
+
+        chunks = self.token_counter.split(text, self.chunk_tokens, self.chunk_overlap_tokens)
+        with STAGE_LATENCY.time(stage="summarize_map"):
+            summaries = await asyncio.gather(*(summarize_chunk(chunk) for chunk in chunks))
+        with STAGE_LATENCY.time(stage="summarize_reduce"):
+            while len(summaries) > 1:
+                summaries = await asyncio.gather(*(combine(group) for group in self._combine_groups(summaries)))
+        return summaries[0]
+
+    def get_cache_stats(self) -> dict:
+        return self.chunk_cache.get_stats()
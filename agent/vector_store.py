@@ -0,0 +1,579 @@
+# agent/vector_store.py
+
+"""
+Vector store backends behind one small interface, used by RAGSearchTool and ingest_scenarios.
+
+- ChromaVectorStore: the existing Chroma collection.
+- NumpyVectorStore: an in-process store that keeps normalized float32 embeddings in a
+  memory-mapped file and answers top-k queries with matrix products and argpartition,
+  optionally pruned by an IVF (k-means cluster) index for large collections.
+
+Both expose: upsert, delete, existing_ids, count, reset, persist, optimize,
+similarity_search, similarity_search_by_vector, similarity_search_by_vectors,
+and a `metadata` dict / `set_metadata` for collection-level attributes.
+
+CollectionVersion tracks a version token per collection that ingestion bumps whenever the
+contents change, so caches built on top of a collection know when to drop their entries.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from langchain.docstore.document import Document
+
+class ChromaVectorStore:
+    """
+    Adapter over LangChain's Chroma wrapper.
+    """
+    def __init__(self, collection_name: str, persist_directory: str, embedding_function):
+        from langchain.vectorstores import Chroma
+        self._chroma_cls = Chroma
+        self.collection_name = collection_name
+        self.persist_directory = persist_directory
+        self.embedding_function = embedding_function
+        self._open()
+
+    def _open(self):
+        self.store = self._chroma_cls(
+            collection_name=self.collection_name,
+            persist_directory=self.persist_directory,
+            embedding_function=self.embedding_function
+        )
+
+    @property
+    def metadata(self) -> dict:
+        # hnsw:* keys are index settings that Chroma does not allow to be modified
+        metadata = self.store._collection.metadata or {}
+        return {k: v for k, v in metadata.items() if not k.startswith("hnsw:")}
+
+    def set_metadata(self, metadata: dict):
+        self.store._collection.modify(metadata=metadata)
+
+    def count(self) -> int:
+        return self.store._collection.count()
+
+    def existing_ids(self, ids: List[str]) -> set:
+        if not ids:
+            return set()
+        return set(self.store._collection.get(ids=ids, include=[])["ids"])
+
+    def upsert(self, ids: List[str], embeddings, documents: List[str], metadatas: List[dict]):
+        self.store._collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def delete(self, ids: List[str]):
+        self.store.delete(ids=ids)
+
+    def reset(self):
+        self.store.delete_collection()
+        self._open()
+
+    def persist(self):
+        self.store.persist()
+
+    def optimize(self):
+        # Chroma maintains its HNSW index itself
+        pass
+
+    def similarity_search(self, query: str, k: int = 4) -> List[Document]:
+        return self.store.similarity_search(query, k=k)
+
+    def similarity_search_by_vector(self, embedding, k: int = 4) -> List[Document]:
+        return self.store.similarity_search_by_vector(embedding, k=k)
+
+    def similarity_search_by_vectors(self, embeddings, k: int = 4) -> List[List[Document]]:
+        results = self.store._collection.query(
+            query_embeddings=[list(map(float, e)) for e in embeddings],
+            n_results=k,
+            include=["documents", "metadatas"]
+        )
+        return [
+            [Document(page_content=doc, metadata=meta or {}) for doc, meta in zip(docs, metas)]
+            for docs, metas in zip(results["documents"], results["metadatas"])
+        ]
+
+class NumpyVectorStore:
+    """
+    In-process vector store over a memory-mapped float32 matrix.
+
+    Files in `persist_directory`, all prefixed by the collection name:
+      .vectors.f32     row-major (capacity x dimension) unit-length embeddings
+      .records.sqlite3 id -> row, document text, metadata and a tombstone flag
+      .meta.json       dimension, used rows, capacity and collection metadata
+      .ivf.npz         optional cluster centroids and row assignments
+
+    Exact search scores every live row with one matrix product. Once `optimize()` has built
+    the IVF index and the collection holds at least `ivf_min_size` rows, each query only
+    scores the rows listed under its `nprobe` closest clusters. Deleted rows are tombstoned
+    until `optimize()` compacts them away.
+
+    Ingestion writes from another process, so reads check the collection's CollectionVersion
+    and reload the files (meta, live rows, mapping, IVF index) once it has been bumped.
+    """
+    def __init__(self, collection_name: str, persist_directory: str, embedding_function=None,
+                 nprobe: int = 8, ivf_min_size: int = 50_000):
+        self.collection_name = collection_name
+        self.persist_directory = persist_directory
+        self.embedding_function = embedding_function
+        self.nprobe = nprobe
+        self.ivf_min_size = ivf_min_size
+        os.makedirs(persist_directory, exist_ok=True)
+        base = os.path.join(persist_directory, collection_name)
+        self._vectors_path = f"{base}.vectors.f32"
+        self._meta_path = f"{base}.meta.json"
+        self._db_path = f"{base}.records.sqlite3"
+        self._ivf_path = f"{base}.ivf.npz"
+        self._lock = threading.RLock()
+        # Read on every search (a few bytes), so results never lag the version callers cache under
+        self._version = CollectionVersion(collection_name, persist_directory, check_interval=0.0)
+        self._load()
+
+    # ---- Storage ---------------------------------------------------------------
+
+    def _load(self):
+        self._loaded_version = self._version.current()
+        self._meta = {"dimension": None, "size": 0, "capacity": 0, "metadata": {}}
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, 'r', encoding='utf-8') as f:
+                self._meta.update(json.load(f))
+
+        self._db = sqlite3.connect(self._db_path, check_same_thread=False)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS records (
+                id TEXT PRIMARY KEY,
+                row INTEGER NOT NULL UNIQUE,
+                document TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                deleted INTEGER NOT NULL DEFAULT 0
+            );
+            """
+        )
+        self._db.commit()
+
+        self._vectors = None
+        self._alive = np.zeros(self._meta["capacity"], dtype=bool)
+        if self._meta["dimension"]:
+            self._map_vectors()
+            live_rows = [row for (row,) in self._db.execute("SELECT row FROM records WHERE deleted = 0;")]
+            self._alive[live_rows] = True
+
+        self._centroids = None
+        self._assignments = None
+        if os.path.exists(self._ivf_path):
+            ivf = np.load(self._ivf_path)
+            self._centroids = ivf["centroids"]
+            self._assignments = np.full(self._meta["capacity"], -1, dtype=np.int32)
+            self._assignments[:len(ivf["assignments"])] = ivf["assignments"]
+        self._ivf_lists = None
+
+    def _refresh(self):
+        """
+        Reload from disk if another process has changed the collection since it was loaded.
+        """
+        if self._version.current() == self._loaded_version:
+            return
+        with self._lock:
+            if self._version.current() != self._loaded_version:
+                self._db.close()
+                self._load()
+
+    def _map_vectors(self):
+        shape = (self._meta["capacity"], self._meta["dimension"])
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=shape)
+
+    def _ensure_capacity(self, needed: int):
+        capacity = self._meta["capacity"]
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, 1024)
+        if self._vectors is not None:
+            self._vectors.flush()
+        # Growing the file in place keeps existing rows where they are; only the mapping changes
+        with open(self._vectors_path, 'ab') as f:
+            f.truncate(new_capacity * self._meta["dimension"] * 4)
+        self._meta["capacity"] = new_capacity
+        self._map_vectors()
+        alive = np.zeros(new_capacity, dtype=bool)
+        alive[:capacity] = self._alive
+        self._alive = alive
+        if self._assignments is not None:
+            assignments = np.full(new_capacity, -1, dtype=np.int32)
+            assignments[:capacity] = self._assignments
+            self._assignments = assignments
+
+    def _save_meta(self):
+        tmp_path = f"{self._meta_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._meta, f)
+        os.replace(tmp_path, self._meta_path)
+
+    def _rows_for_ids(self, ids: List[str]) -> Dict[str, int]:
+        found = {}
+        # SQLite limits the number of bound parameters per statement
+        for start in range(0, len(ids), 500):
+            part = ids[start:start + 500]
+            placeholders = ",".join("?" * len(part))
+            for id_, row in self._db.execute(f"SELECT id, row FROM records WHERE id IN ({placeholders});", part):
+                found[id_] = row
+        return found
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        matrix = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    # ---- Collection interface --------------------------------------------------
+
+    @property
+    def metadata(self) -> dict:
+        return dict(self._meta["metadata"])
+
+    def set_metadata(self, metadata: dict):
+        with self._lock:
+            self._meta["metadata"] = dict(metadata)
+            self._save_meta()
+
+    def count(self) -> int:
+        self._refresh()
+        return int(self._alive.sum())
+
+    def existing_ids(self, ids: List[str]) -> set:
+        with self._lock:
+            rows = self._rows_for_ids(list(ids))
+            return {id_ for id_, row in rows.items() if self._alive[row]}
+
+    def upsert(self, ids: List[str], embeddings, documents: List[str], metadatas: Optional[List[dict]] = None):
+        vectors = self._normalize(embeddings)
+        metadatas = metadatas or [{} for _ in ids]
+        with self._lock:
+            if not self._meta["dimension"]:
+                self._meta["dimension"] = int(vectors.shape[1])
+            if vectors.shape[1] != self._meta["dimension"]:
+                raise ValueError(
+                    f"Embedding dimension {vectors.shape[1]} does not match the collection's "
+                    f"{self._meta['dimension']}"
+                )
+            existing = self._rows_for_ids(list(ids))
+            rows = []
+            for id_ in ids:
+                row = existing.get(id_)
+                if row is None:
+                    row = self._meta["size"]
+                    self._meta["size"] += 1
+                    existing[id_] = row
+                rows.append(row)
+            self._ensure_capacity(self._meta["size"])
+
+            rows = np.asarray(rows, dtype=np.intp)
+            self._vectors[rows] = vectors
+            self._alive[rows] = True
+            if self._centroids is not None:
+                self._assignments[rows] = np.argmax(vectors @ self._centroids.T, axis=1)
+                self._ivf_lists = None
+
+            self._db.executemany(
+                """
+                INSERT INTO records (id, row, document, metadata, deleted) VALUES (?, ?, ?, ?, 0)
+                ON CONFLICT (id) DO UPDATE SET document = excluded.document,
+                                               metadata = excluded.metadata,
+                                               deleted = 0;
+                """,
+                [(id_, int(row), doc, json.dumps(meta)) for id_, row, doc, meta in zip(ids, rows, documents, metadatas)]
+            )
+            self._db.commit()
+            self._save_meta()
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None) -> List[str]:
+        """
+        Chroma-compatible convenience: embed `texts` with the store's embedding function and upsert them.
+        """
+        texts = list(texts)
+        if ids is None:
+            ids = [uuid.uuid4().hex for _ in texts]
+        self.upsert(ids, self.embedding_function.embed_documents(texts), texts, metadatas)
+        return ids
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            rows = list(self._rows_for_ids(list(ids)).values())
+            if not rows:
+                return
+            self._alive[rows] = False
+            self._vectors[rows] = 0.0
+            self._db.executemany("UPDATE records SET deleted = 1 WHERE row = ?;", [(r,) for r in rows])
+            self._db.commit()
+
+    def reset(self):
+        with self._lock:
+            self._db.close()
+            self._vectors = None
+            for path in (self._vectors_path, self._meta_path, self._db_path, self._ivf_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._load()
+
+    def persist(self):
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+            self._save_meta()
+
+    # ---- IVF index ---------------------------------------------------------------
+
+    def optimize(self, n_clusters: Optional[int] = None, iterations: int = 10, sample_size: int = 100_000,
+                 seed: int = 0, compact_threshold: float = 0.1):
+        """
+        Reclaim deleted rows once they make up `compact_threshold` of the used rows, then build
+        the IVF index with spherical k-means when the collection is large enough to benefit.
+        Centroids are trained on a sample; every live row is then assigned to its nearest centroid.
+        """
+        with self._lock:
+            n = self._meta["size"]
+            if n and n - int(self._alive[:n].sum()) >= max(1, compact_threshold * n):
+                self._compact()
+                n = self._meta["size"]
+            live_rows = np.flatnonzero(self._alive[:n])
+            if len(live_rows) < self.ivf_min_size:
+                return
+            n_clusters = n_clusters or int(np.sqrt(len(live_rows)))
+            rng = np.random.default_rng(seed)
+            sample = self._vectors[rng.choice(live_rows, size=min(sample_size, len(live_rows)), replace=False)]
+            centroids = sample[rng.choice(len(sample), size=n_clusters, replace=False)].copy()
+            for _ in range(iterations):
+                labels = np.argmax(sample @ centroids.T, axis=1)
+                for c in range(n_clusters):
+                    members = sample[labels == c]
+                    if len(members):
+                        centroids[c] = members.sum(axis=0)
+                centroids = self._normalize(centroids)
+
+            assignments = np.full(self._meta["capacity"], -1, dtype=np.int32)
+            for start in range(0, n, 65536):
+                block = np.asarray(self._vectors[start:min(start + 65536, n)])
+                assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+            self._centroids = centroids
+            self._assignments = assignments
+            self._ivf_lists = None
+            np.savez(self._ivf_path, centroids=centroids, assignments=assignments[:n])
+
+    def _compact(self):
+        """
+        Rewrite the vectors file and the records table with only the live rows, in row order.
+
+        Both files are built next to the originals and swapped in with os.replace, so a process
+        still holding the old ones keeps reading a consistent snapshot until the version bump
+        makes it reload. Caller holds the lock.
+        """
+        n = self._meta["size"]
+        dimension = self._meta["dimension"]
+        live_rows = np.flatnonzero(self._alive[:n])
+        capacity = max(len(live_rows), 1024)
+
+        tmp_vectors_path = f"{self._vectors_path}.tmp"
+        with open(tmp_vectors_path, 'wb') as f:
+            f.truncate(capacity * dimension * 4)
+        vectors = np.memmap(tmp_vectors_path, dtype=np.float32, mode="r+", shape=(capacity, dimension))
+        for start in range(0, len(live_rows), 65536):
+            block = live_rows[start:start + 65536]
+            vectors[start:start + len(block)] = self._vectors[block]
+        vectors.flush()
+        del vectors
+
+        tmp_db_path = f"{self._db_path}.tmp"
+        if os.path.exists(tmp_db_path):
+            os.remove(tmp_db_path)
+        db = sqlite3.connect(tmp_db_path)
+        db.execute(
+            """
+            CREATE TABLE records (
+                id TEXT PRIMARY KEY,
+                row INTEGER NOT NULL UNIQUE,
+                document TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                deleted INTEGER NOT NULL DEFAULT 0
+            );
+            """
+        )
+        # Live rows keep their relative order, so each one's new row is its rank among them
+        db.executemany(
+            "INSERT INTO records (id, row, document, metadata, deleted) VALUES (?, ?, ?, ?, 0);",
+            (
+                (id_, int(np.searchsorted(live_rows, row)), doc, meta)
+                for id_, row, doc, meta in self._db.execute(
+                    "SELECT id, row, document, metadata FROM records WHERE deleted = 0 ORDER BY row;"
+                )
+            )
+        )
+        db.commit()
+        db.close()
+
+        if self._assignments is not None:
+            np.savez(self._ivf_path, centroids=self._centroids, assignments=self._assignments[live_rows])
+
+        self._db.close()
+        self._vectors = None
+        os.replace(tmp_vectors_path, self._vectors_path)
+        os.replace(tmp_db_path, self._db_path)
+        self._meta["size"] = len(live_rows)
+        self._meta["capacity"] = capacity
+        self._save_meta()
+        # Row numbers have changed under every reader's cached results
+        self._version.bump()
+        self._load()
+
+    # ---- Search ----------------------------------------------------------------
+
+    def _documents_for_rows(self, rows: List[int]) -> List[Document]:
+        if not rows:
+            return []
+        placeholders = ",".join("?" * len(rows))
+        with self._lock:
+            found = {
+                row: Document(page_content=doc, metadata=json.loads(meta))
+                for row, doc, meta in self._db.execute(
+                    f"SELECT row, document, metadata FROM records WHERE row IN ({placeholders});",
+                    [int(r) for r in rows]
+                )
+            }
+        return [found[r] for r in rows if r in found]
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        """
+        Indices of the k best scores in descending order; argpartition avoids a full sort.
+        """
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.empty(0, dtype=np.intp)
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+
+    def _inverted_lists(self, n: int) -> List[np.ndarray]:
+        """
+        Row numbers per cluster, sorted by row; rebuilt after the assignments change. Caller holds the lock.
+        """
+        if self._ivf_lists is None:
+            assignments = self._assignments[:n]
+            order = np.argsort(assignments, kind="stable")
+            # Unassigned rows (-1) sort first and belong to no list
+            order = order[int((assignments < 0).sum()):]
+            bounds = np.concatenate(([0], np.cumsum(np.bincount(assignments[order], minlength=len(self._centroids)))))
+            self._ivf_lists = [order[bounds[c]:bounds[c + 1]] for c in range(len(self._centroids))]
+        return self._ivf_lists
+
+    def _search_rows(self, queries: np.ndarray, k: int) -> List[List[int]]:
+        self._refresh()
+        with self._lock:
+            n = self._meta["size"]
+            if not n:
+                return [[] for _ in queries]
+            vectors = self._vectors[:n]
+            alive = self._alive[:n].copy()
+            centroids = self._centroids
+            lists = self._inverted_lists(n) if centroids is not None else None
+
+        if centroids is not None and alive.sum() >= self.ivf_min_size:
+            results = []
+            probes = np.argsort(-(queries @ centroids.T), axis=1)[:, :self.nprobe]
+            for query, probe in zip(queries, probes):
+                # Only the probed clusters' rows are touched; deleted ones are dropped here
+                candidates = np.concatenate([lists[c] for c in probe])
+                candidates = candidates[alive[candidates]]
+                scores = vectors[candidates] @ query
+                results.append(candidates[self._top_k(scores, k)].tolist())
+            return results
+
+        # Exact search: one (n x d) @ (d x m) product scores every row for every query
+        scores = np.asarray(vectors @ queries.T)
+        scores[~alive] = -np.inf
+        k = min(k, int(alive.sum()))
+        if k <= 0:
+            return [[] for _ in queries]
+        top = np.argpartition(-scores, k - 1, axis=0)[:k]
+        results = []
+        for j in range(queries.shape[0]):
+            candidates = top[:, j]
+            results.append(candidates[np.argsort(-scores[candidates, j])].tolist())
+        return results
+
+    def similarity_search_by_vectors(self, embeddings, k: int = 4) -> List[List[Document]]:
+        """
+        Batched search: all queries are scored against the collection in one matrix product.
+        """
+        queries = self._normalize(embeddings)
+        if self._meta["dimension"] and queries.shape[1] != self._meta["dimension"]:
+            raise ValueError(
+                f"Query dimension {queries.shape[1]} does not match the collection's {self._meta['dimension']}"
+            )
+        return [self._documents_for_rows(rows) for rows in self._search_rows(queries, k)]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4) -> List[Document]:
+        return self.similarity_search_by_vectors([embedding], k=k)[0]
+
+    def similarity_search(self, query: str, k: int = 4) -> List[Document]:
+        return self.similarity_search_by_vector(self.embedding_function.embed_query(query), k=k)
+
+VECTOR_STORE_BACKENDS = {
+    "chroma": ChromaVectorStore,
+    "numpy": NumpyVectorStore,
+}
+
+def open_vector_store(backend: Optional[str] = None, collection_name: str = "scenario_collection",
+                      persist_directory: str = "chroma_db", embedding_function=None, **kwargs):
+    """
+    Open a collection with the configured backend. `backend` defaults to the
+    VECTOR_STORE_BACKEND environment variable ("chroma" or "numpy"), falling back to "chroma".
+    """
+    backend = backend or os.getenv("VECTOR_STORE_BACKEND", "chroma")
+    if backend not in VECTOR_STORE_BACKENDS:
+        raise ValueError(f"Unknown vector store backend '{backend}'. Choose one of: {', '.join(VECTOR_STORE_BACKENDS)}")
+    return VECTOR_STORE_BACKENDS[backend](
+        collection_name=collection_name,
+        persist_directory=persist_directory,
+        embedding_function=embedding_function,
+        **kwargs
+    )
+
+class CollectionVersion:
+    """
+    A version token stored next to the collection as `<collection_name>.version`.
+
+    Ingestion runs in a separate process, so the token lives in a file rather than in the
+    store's own metadata. `current()` re-reads it at most every `check_interval` seconds.
+    """
+    def __init__(self, collection_name: str = "scenario_collection", persist_directory: str = "chroma_db",
+                 check_interval: float = 1.0):
+        self.path = os.path.join(persist_directory, f"{collection_name}.version")
+        self.check_interval = check_interval
+        self._version = None
+        self._checked_at = 0.0
+
+    def current(self) -> str:
+        now = time.monotonic()
+        if self._version is None or now - self._checked_at > self.check_interval:
+            self._checked_at = now
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._version = f.read().strip() or "0"
+            except FileNotFoundError:
+                self._version = "0"
+        return self._version
+
+    def bump(self) -> str:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        version = uuid.uuid4().hex
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(version)
+        os.replace(tmp_path, self.path)
+        self._version, self._checked_at = version, time.monotonic()
+        return version
@@ -1,6 +1,33 @@
 # agent/xml_generator.py
+import os
+import threading
+from typing import IO, Dict, Iterable, List, Tuple, Union
+
 import lxml.etree as ET
 
+from agent.metrics import STAGE_LATENCY
+
+# Compiled schemas shared by every XMLGenerator in the process, keyed by (path, mtime)
+_SCHEMA_CACHE: Dict[Tuple[str, float], ET.XMLSchema] = {}
+_SCHEMA_LOCK = threading.Lock()
+
+def load_schema(xsd_path: str) -> ET.XMLSchema:
+    """
+    Return the compiled XMLSchema for `xsd_path`, parsing it only when the file is new or has changed.
+    """
+    path = os.path.abspath(xsd_path)
+    key = (path, os.path.getmtime(path))
+    with _SCHEMA_LOCK:
+        schema = _SCHEMA_CACHE.get(key)
+        if schema is None:
+            with open(path, 'rb') as f:
+                schema = ET.XMLSchema(ET.parse(f))
+            # Drop compilations of older versions of the same file
+            for stale in [k for k in _SCHEMA_CACHE if k[0] == path]:
+                del _SCHEMA_CACHE[stale]
+            _SCHEMA_CACHE[key] = schema
+        return schema
+
 class XMLGenerator:
     def __init__(self, xsd_path: str = "agent/schemas/scenario.xsd"):
         self.xsd_path = xsd_path
@@ -10,19 +37,12 @@ class XMLGenerator:
 
     def _load_xsd(self):
         try:
-            with open(self.xsd_path, 'rb') as f:
-                xmlschema_doc = ET.parse(f)
-                self.schema = ET.XMLSchema(xmlschema_doc)
+            self.schema = load_schema(self.xsd_path)
         except Exception as e:
             print(f"Warning: Unable to load or parse XSD. Validation might be disabled. Error: {e}")
             self.schema = None
 
-    def build_xml(self, scenario_data: str, user_requirements: str, additional_metadata: str = "") -> str:
-        """
-        Builds a multi-layer XML with potential attributes and multiple elements.
-        scenario_data might come from RAG, user_requirements is the user request,
-        and additional_metadata can be any extra info (like a summary or historical data).
-        """
+    def _build_tree(self, scenario_data: str, user_requirements: str, additional_metadata: str = ""):
         root = ET.Element("ScenarioOutput", attrib={"version": "1.0"})
 
         scenario_elem = ET.SubElement(root, "ScenarioContext")
@@ -34,25 +54,87 @@ class XMLGenerator:
         if additional_metadata:
             meta_elem = ET.SubElement(root, "AdditionalMetadata")
             meta_elem.text = additional_metadata
+        return root
 
-        # Convert to string
-        xml_string = ET.tostring(root, pretty_print=True, encoding="UTF-8").decode("UTF-8")
+    def build_xml(self, scenario_data: str, user_requirements: str, additional_metadata: str = "") -> str:
+        """
+        Builds a multi-layer XML with potential attributes and multiple elements.
+        scenario_data might come from RAG, user_requirements is the user request,
+        and additional_metadata can be any extra info (like a summary or historical data).
+        The tree is validated in memory before it is serialized, so it is never re-parsed.
+        """
+        with STAGE_LATENCY.time(stage="xml_build"):
+            root = self._build_tree(scenario_data, user_requirements, additional_metadata)
 
         # Validate against XSD if available
         if self.schema:
-            is_valid, error_str = self.validate_xml(xml_string)
+            with STAGE_LATENCY.time(stage="xml_validate"):
+                is_valid, error_str = self.validate_xml(root)
             if not is_valid:
                 raise ValueError(f"Generated XML is invalid against the XSD schema. Error: {error_str}")
 
-        return xml_string
+        # Convert to string
+        with STAGE_LATENCY.time(stage="xml_serialize"):
+            return ET.tostring(root, pretty_print=True, encoding="UTF-8").decode("UTF-8")
+
+    def build_many(self, documents: Iterable[dict]) -> List[str]:
+        """
+        Build one XML string per dict of `build_xml` keyword arguments, in order.
+        Raises ValueError for the first invalid document, naming its position.
+        """
+        results = []
+        for i, document in enumerate(documents):
+            try:
+                results.append(self.build_xml(**document))
+            except ValueError as e:
+                raise ValueError(f"Document {i}: {e}") from e
+        return results
+
+    def write_xml_stream(
+        self,
+        output: Union[str, IO[bytes]],
+        scenario_chunks: Union[str, Iterable[str]],
+        user_requirements: str,
+        additional_metadata: str = ""
+    ):
+        """
+        Write the same document as `build_xml` incrementally to a path or binary file object.
+        `scenario_chunks` may be any iterable of text pieces (e.g. a generator over retrieved
+        documents), so very large contexts are never held in memory as one tree or string.
+        The writer always emits the structure the XSD describes, so no validation pass is needed.
+        """
+        if isinstance(scenario_chunks, str):
+            scenario_chunks = [scenario_chunks]
+        with ET.xmlfile(output, encoding="UTF-8") as xf:
+            xf.write_declaration()
+            with xf.element("ScenarioOutput", attrib={"version": "1.0"}):
+                xf.write("\n  ")
+                with xf.element("ScenarioContext"):
+                    for chunk in scenario_chunks:
+                        xf.write(chunk)
+                xf.write("\n  ")
+                with xf.element("UserRequirements"):
+                    xf.write(user_requirements)
+                if additional_metadata:
+                    xf.write("\n  ")
+                    with xf.element("AdditionalMetadata"):
+                        xf.write(additional_metadata)
+                xf.write("\n")
+
+    @staticmethod
+    def scenario_context(xml: str) -> str:
+        """
+        The ScenarioContext text of a document built by `build_xml`, i.e. the agent's answer.
+        """
+        return ET.fromstring(xml.encode("utf-8")).findtext("ScenarioContext", default="")
 
-    def validate_xml(self, xml_string: str):
+    def validate_xml(self, xml: Union[str, ET._Element]):
         """
-        Validates the given XML string against the loaded XSD.
+        Validates the given XML string or element tree against the loaded XSD.
         Returns (bool, error_msg).
         """
         try:
-            xml_doc = ET.fromstring(xml_string.encode("utf-8"))
+            xml_doc = ET.fromstring(xml.encode("utf-8")) if isinstance(xml, str) else xml
             self.schema.assertValid(xml_doc)
             return True, ""
         except ET.DocumentInvalid as e:
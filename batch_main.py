@@ -0,0 +1,93 @@
+# batch_main.py
+
+"""
+Generate scenario XML for many queries at once (the CLI counterpart of POST /chat/batch).
+
+Reads one query per line from --input (or stdin) and writes one NDJSON result per line to
+--output (or stdout) as items complete, followed by a summary line.
+
+    python batch_main.py --input queries.txt --output results.ndjson --concurrency 8
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+
+from agent.answer_cache import AnswerCache
+from agent.batch import ScenarioBatchProcessor
+from agent.custom_agent import LLM_PROFILE as REACT_LLM_PROFILE
+from agent.llm_manager import LLMManager
+from agent.memory_manager import MemoryManager
+from agent.review_manager import ReviewManager
+from agent.review_queue import ReviewQueue
+from agent.tools import RAGSearchTool, SummarizeTool
+from agent.xml_generator import XMLGenerator
+
+async def run_batch(processor: ScenarioBatchProcessor, queries, output, concurrency: int):
+    runner = processor.runner(concurrency=concurrency)
+    async for item in runner.run(queries):
+        output.write(json.dumps(item) + "\n")
+        output.flush()
+    output.write(json.dumps({"summary": runner.stats}) + "\n")
+    return runner.stats
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--input", default=None, help="File with one query per line (default: stdin)")
+    parser.add_argument("--output", default=None, help="NDJSON output file (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input, 'r', encoding='utf-8') as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        queries = [line.strip() for line in sys.stdin if line.strip()]
+
+    llm_manager = LLMManager(
+        use_azure_openai=True,
+        azure_openai_deployment_name="your_azure_deployment_name",
+        azure_openai_api_key="your_azure_api_key"
+    )
+    memory_manager = MemoryManager(
+        pg_host="localhost",
+        pg_port=5432,
+        pg_database="mydb",
+        pg_user="myuser",
+        pg_password="mypassword",
+        write_behind=True
+    )
+    search_tool = RAGSearchTool()
+    tools = [search_tool, SummarizeTool(llm_manager.get_llm(cached=True, profile=SummarizeTool.llm_profile))]
+    review_queue = ReviewQueue(
+        ReviewManager(llm_manager.get_llm(cached=True, profile=ReviewManager.llm_profile)),
+        memory_manager=memory_manager
+    )
+    processor = ScenarioBatchProcessor(
+        llm_manager.get_llm(profile=REACT_LLM_PROFILE),
+        tools,
+        XMLGenerator(xsd_path="agent/schemas/scenario.xsd"),
+        memory_manager,
+        review_queue=review_queue,
+        answer_cache=AnswerCache(memory_manager, search_tool.collection_version),
+        agent_options={"multi_action": True, "max_iterations": 6, "max_execution_time": 90.0}
+    )
+
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        stats = asyncio.run(run_batch(processor, queries, output, args.concurrency))
+        print(
+            f"Processed {stats['total']} queries ({stats['unique']} unique): "
+            f"{stats['ok']} ok, {stats['errors']} errors in {stats['elapsed_ms'] / 1000.0:.1f}s",
+            file=sys.stderr
+        )
+    finally:
+        if args.output:
+            output.close()
+        # Reviews left in the queue are picked up by the next run or the server
+        review_queue.close()
+        memory_manager.close()
+
+if __name__ == "__main__":
+    main()
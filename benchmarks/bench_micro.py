@@ -0,0 +1,125 @@
+# benchmarks/bench_micro.py
+
+"""
+Micro-benchmarks for the hot paths that do not involve the network.
+
+- parse_*: ReAct output parsing (SimpleOutputParser / MultiActionOutputParser), ops/s
+- build_xml_*: XMLGenerator.build_xml (build + in-memory XSD validation) per context size
+- ingest: synthetic scenario ingestion into the NumPy store with the local embeddings,
+  optionally with simulated embedding latency (see benchmarks.fakes)
+
+    python -m benchmarks.bench_micro --embed-latency 0.02
+    python -m benchmarks.bench_micro --only parse build_xml --compare benchmarks/results/bench_micro-....json
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.common import report_comparison, save_results, summarize_latencies, write_synthetic_scenarios
+
+XSD_PATH = os.path.join(os.path.dirname(__file__), "..", "agent", "schemas", "scenario.xsd")
+
+def _time_repeated(fn, min_seconds: float) -> dict:
+    """
+    Call `fn` until `min_seconds` have passed; return ops/s and per-call latency percentiles.
+    """
+    latencies = []
+    deadline = time.perf_counter() + min_seconds
+    while time.perf_counter() < deadline or len(latencies) < 5:
+        started = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - started) * 1000.0)
+    summary = summarize_latencies(latencies)
+    summary["ops_per_s"] = round(1000.0 * len(latencies) / sum(latencies), 1)
+    return summary
+
+def bench_parse(args) -> dict:
+    from agent.custom_agent import MultiActionOutputParser, SimpleOutputParser
+
+    rng = random.Random(0)
+    thought = " ".join(rng.choice(["check", "the", "junction", "lane", "signal"]) for _ in range(40))
+    action = f"Thought: {thought}\nAction: search_tool\nAction Input: urban junction at night"
+    multi = "\n".join(
+        f"Thought: {thought}\nAction: search_tool\nAction Input: query {i}" for i in range(4)
+    )
+    final = f"Thought: I now know the final answer.\nFinal Answer: {thought * 20}"
+
+    simple, multi_parser = SimpleOutputParser(), MultiActionOutputParser()
+    return {
+        "parse_simple_action": _time_repeated(lambda: simple.parse(action), args.min_seconds),
+        "parse_simple_final": _time_repeated(lambda: simple.parse(final), args.min_seconds),
+        "parse_multi_actions": _time_repeated(lambda: multi_parser.parse(multi), args.min_seconds),
+    }
+
+def bench_build_xml(args) -> dict:
+    from agent.xml_generator import XMLGenerator
+
+    generator = XMLGenerator(XSD_PATH)
+    rng = random.Random(0)
+    words = ["scenario", "vehicle", "junction", "<pedestrian>", "signal", "R&D", "lane", "weather"]
+    results = {}
+    for size_kb in args.xml_sizes_kb:
+        context = " ".join(rng.choice(words) for _ in range(size_kb * 128))[:size_kb * 1024]
+        results[f"build_xml_{size_kb}kb"] = _time_repeated(
+            lambda: generator.build_xml(context, "benchmark request", "bench"), args.min_seconds
+        )
+    return results
+
+def bench_ingest(args) -> dict:
+    from ingest_scenarios import ingest_scenarios
+    from benchmarks.fakes import FakeEmbeddingProvider
+
+    workdir = tempfile.mkdtemp(prefix="bench_ingest_")
+    try:
+        scenario_dir = os.path.join(workdir, "scenarios")
+        write_synthetic_scenarios(scenario_dir, n_files=args.n_files)
+        started = time.perf_counter()
+        report = ingest_scenarios(
+            scenario_dir=scenario_dir,
+            persist_directory=os.path.join(workdir, "store"),
+            embedding_provider=FakeEmbeddingProvider(latency=args.embed_latency),
+            vector_store_backend="numpy",
+            progress_interval=3600.0
+        )
+        elapsed = time.perf_counter() - started
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "ingest": {
+            "chunks": report["chunks_embedded"],
+            "chunks_per_s": round(report["chunks_embedded"] / elapsed, 1),
+            "elapsed_ms": round(elapsed * 1000.0, 1),
+        }
+    }
+
+BENCHMARKS = {"parse": bench_parse, "build_xml": bench_build_xml, "ingest": bench_ingest}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument("--min-seconds", type=float, default=1.0, help="Minimum run time per case")
+    parser.add_argument("--xml-sizes-kb", type=int, nargs="+", default=[4, 64, 1024])
+    parser.add_argument("--n-files", type=int, default=200, help="Synthetic scenario files to ingest")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="Seconds per fake embedding batch")
+    parser.add_argument("--output", default=None, help="Result file (default: benchmarks/results/)")
+    parser.add_argument("--compare", default=None, help="Earlier result file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change counted as a regression")
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.only:
+        results.update(BENCHMARKS[name](args))
+    for case, metrics in results.items():
+        print(f"{case:<24} " + "  ".join(f"{k}={v:g}" for k, v in metrics.items()))
+
+    path = save_results("bench_micro", results, vars(args), args.output)
+    print(f"Results written to {path}")
+    sys.exit(report_comparison(results, args.compare, args.threshold))
+
+if __name__ == "__main__":
+    main()
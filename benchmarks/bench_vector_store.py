@@ -0,0 +1,128 @@
+# benchmarks/bench_vector_store.py
+
+"""
+Compare recall and latency of the vector store backends on the same data.
+
+Builds a synthetic corpus (or uses the files in --scenario-dir), embeds it once with the
+local hashing provider, loads the identical vectors into Chroma, the exact NumPy store and
+the IVF-pruned NumPy store, and measures each against brute-force ground truth.
+
+    python -m benchmarks.bench_vector_store --n-docs 20000 --n-queries 200 --k 5
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from agent.embeddings import LocalHashingEmbeddingProvider
+from agent.vector_store import ChromaVectorStore, NumpyVectorStore
+
+def _synthetic_corpus(n_docs: int, seed: int = 0):
+    rng = random.Random(seed)
+    vocabulary = [f"term{i}" for i in range(5000)]
+    topics = [rng.sample(vocabulary, 40) for _ in range(200)]
+    docs = []
+    for _ in range(n_docs):
+        topic = rng.choice(topics)
+        words = [rng.choice(topic) if rng.random() < 0.7 else rng.choice(vocabulary) for _ in range(120)]
+        docs.append(" ".join(words))
+    return docs
+
+def _corpus_from_dir(scenario_dir: str):
+    docs = []
+    for filename in sorted(os.listdir(scenario_dir)):
+        if filename.endswith((".txt", ".md")):
+            with open(os.path.join(scenario_dir, filename), 'r', encoding='utf-8') as f:
+                text = f.read()
+            docs.extend(text[i:i + 800] for i in range(0, len(text), 700))
+    return docs
+
+def _measure(search, queries, k):
+    latencies, results = [], []
+    for query in queries:
+        started = time.perf_counter()
+        docs = search(query, k)
+        latencies.append((time.perf_counter() - started) * 1000.0)
+        results.append([d.metadata["id"] for d in docs])
+    return latencies, results
+
+def _recall(results, truth):
+    hits = sum(len(set(r) & set(t)) for r, t in zip(results, truth))
+    return hits / sum(len(t) for t in truth)
+
+def _report(name, latencies, results, truth, build_seconds):
+    latencies = sorted(latencies)
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    print(
+        f"{name:<14} recall@k={_recall(results, truth):.3f}  p50={statistics.median(latencies):.2f}ms  "
+        f"p95={p95:.2f}ms  build={build_seconds:.1f}s"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--n-docs", type=int, default=20000)
+    parser.add_argument("--n-queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dimension", type=int, default=512)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--scenario-dir", default=None, help="Use real scenario files instead of synthetic text")
+    parser.add_argument("--skip-chroma", action="store_true")
+    args = parser.parse_args()
+
+    docs = _corpus_from_dir(args.scenario_dir) if args.scenario_dir else _synthetic_corpus(args.n_docs)
+    ids = [f"doc-{i}" for i in range(len(docs))]
+    metadatas = [{"id": i} for i in ids]
+    provider = LocalHashingEmbeddingProvider(dimension=args.dimension)
+
+    started = time.perf_counter()
+    vectors = np.vstack([provider.encode(docs[i:i + 1024]) for i in range(0, len(docs), 1024)])
+    print(f"Embedded {len(docs)} documents in {time.perf_counter() - started:.1f}s")
+
+    rng = random.Random(1)
+    query_texts = [" ".join(rng.sample(docs[rng.randrange(len(docs))].split(), 12)) for _ in range(args.n_queries)]
+    query_vectors = provider.encode(query_texts)
+
+    # Brute-force ground truth
+    scores = vectors @ query_vectors.T
+    truth = [[ids[j] for j in np.argsort(-scores[:, q])[:args.k]] for q in range(len(query_texts))]
+
+    with tempfile.TemporaryDirectory() as workdir:
+        stores = []
+        for name, kwargs in (("numpy-exact", {"ivf_min_size": len(docs) + 1}),
+                             ("numpy-ivf", {"ivf_min_size": 0, "nprobe": args.nprobe})):
+            started = time.perf_counter()
+            store = NumpyVectorStore(name, workdir, provider, **kwargs)
+            for i in range(0, len(docs), 4096):
+                store.upsert(ids[i:i + 4096], vectors[i:i + 4096], docs[i:i + 4096], metadatas[i:i + 4096])
+            store.optimize()
+            store.persist()
+            stores.append((name, store, time.perf_counter() - started))
+
+        if not args.skip_chroma:
+            started = time.perf_counter()
+            chroma = ChromaVectorStore("bench", os.path.join(workdir, "chroma"), provider)
+            for i in range(0, len(docs), 4096):
+                chroma.upsert(ids[i:i + 4096], vectors[i:i + 4096].tolist(), docs[i:i + 4096], metadatas[i:i + 4096])
+            stores.append(("chroma", chroma, time.perf_counter() - started))
+
+        print(f"\n{len(docs)} docs, {len(query_texts)} queries, k={args.k}, dimension={args.dimension}")
+        for name, store, build_seconds in stores:
+            latencies, results = _measure(
+                lambda q, k: store.similarity_search_by_vector(q, k=k), list(query_vectors), args.k
+            )
+            _report(name, latencies, results, truth, build_seconds)
+
+        for name, store, _ in stores:
+            if isinstance(store, NumpyVectorStore):
+                started = time.perf_counter()
+                store.similarity_search_by_vectors(query_vectors, k=args.k)
+                per_query = (time.perf_counter() - started) * 1000.0 / len(query_texts)
+                print(f"{name:<14} batched multi-query search: {per_query:.3f}ms/query")
+
+if __name__ == "__main__":
+    main()
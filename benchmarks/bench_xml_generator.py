@@ -0,0 +1,98 @@
+# benchmarks/bench_xml_generator.py
+
+"""
+Measure per-document time and peak memory of the XMLGenerator build paths.
+
+Compares the previous approach (XSD re-parsed per generator, serialize then re-parse to
+validate) with the current one (cached schema, in-memory validation), the bulk `build_many`
+API and the incremental `write_xml_stream` writer. Each variant runs in a forked process so
+peak RSS growth (which includes libxml2's allocations) is measured in isolation;
+tracemalloc reports the Python-side peak.
+
+    python -m benchmarks.bench_xml_generator --context-kb 2048 --n-docs 20
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+import tracemalloc
+
+import lxml.etree as ET
+
+from agent.xml_generator import XMLGenerator
+
+XSD_PATH = os.path.join(os.path.dirname(__file__), "..", "agent", "schemas", "scenario.xsd")
+
+def _context_chunks(size_kb: int, seed: int = 0):
+    rng = random.Random(seed)
+    words = ["scenario", "vehicle", "junction", "<pedestrian>", "signal", "R&D", "lane", "weather"]
+    for _ in range(size_kb):
+        yield " ".join(rng.choice(words) for _ in range(120))[:1024]
+
+def _legacy_build(scenario_data, user_requirements, additional_metadata=""):
+    # Previous behaviour: fresh XSD parse per generator, serialize, then re-parse to validate
+    with open(XSD_PATH, 'rb') as f:
+        schema = ET.XMLSchema(ET.parse(f))
+    root = XMLGenerator._build_tree(None, scenario_data, user_requirements, additional_metadata)
+    xml_string = ET.tostring(root, pretty_print=True, encoding="UTF-8").decode("UTF-8")
+    schema.assertValid(ET.fromstring(xml_string.encode("utf-8")))
+    return xml_string
+
+def _run_variant(name, args, results):
+    chunks = list(_context_chunks(args.context_kb))
+    context = "".join(chunks)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    started = time.perf_counter()
+
+    if name == "legacy":
+        for _ in range(args.n_docs):
+            _legacy_build(context, "benchmark request", "bench")
+    elif name == "build_xml":
+        for _ in range(args.n_docs):
+            XMLGenerator(XSD_PATH).build_xml(context, "benchmark request", "bench")
+    elif name == "build_many":
+        documents = ({"scenario_data": context, "user_requirements": "benchmark request",
+                      "additional_metadata": "bench"} for _ in range(args.n_docs))
+        XMLGenerator(XSD_PATH).build_many(documents)
+    elif name == "stream":
+        generator = XMLGenerator(XSD_PATH)
+        with tempfile.TemporaryDirectory() as workdir:
+            for i in range(args.n_docs):
+                generator.write_xml_stream(
+                    os.path.join(workdir, f"doc-{i}.xml"), iter(chunks),
+                    "benchmark request", "bench"
+                )
+
+    elapsed = time.perf_counter() - started
+    _, python_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+    results.put((name, elapsed * 1000.0 / args.n_docs, python_peak / 2**20, rss_growth / 1024.0))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--context-kb", type=int, default=1024, help="Size of each ScenarioContext in KiB")
+    parser.add_argument("--n-docs", type=int, default=20)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    print(f"{args.n_docs} documents, {args.context_kb} KiB context each")
+    print(f"{'variant':<12} {'ms/doc':>10} {'py peak MiB':>12} {'RSS +MiB':>10}")
+    for name in ("legacy", "build_xml", "build_many", "stream"):
+        process = context.Process(target=_run_variant, args=(name, args, results))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            print(f"{name:<12} failed (exit code {process.exitcode})")
+            continue
+        variant, ms_per_doc, python_peak, rss_growth = results.get()
+        print(f"{variant:<12} {ms_per_doc:>10.2f} {python_peak:>12.1f} {rss_growth:>10.1f}")
+
+if __name__ == "__main__":
+    main()
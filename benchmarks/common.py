@@ -0,0 +1,139 @@
+# benchmarks/common.py
+
+"""
+Shared helpers for the benchmarks: latency summaries, result files and regression checks.
+
+Results are written to benchmarks/results/<name>-<timestamp>.json together with the
+environment they were measured in. Passing an earlier file as the baseline flags every
+metric that moved in the wrong direction by more than the threshold.
+"""
+
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+from typing import Dict, List, Optional
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# Metric name suffixes where a larger value is better; everything else is a cost
+HIGHER_IS_BETTER = ("_per_s", "rps", "hit_rate")
+# Sample sizes and single worst samples are too noisy to compare
+NOT_COMPARED = {"count", "max_ms"}
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """
+    Linear-interpolated percentile (q in [0, 100]) of an already sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+def summarize_latencies(latencies_ms: List[float]) -> Dict[str, float]:
+    values = sorted(latencies_ms)
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values), 3) if values else 0.0,
+        "p50_ms": round(percentile(values, 50), 3),
+        "p95_ms": round(percentile(values, 95), 3),
+        "p99_ms": round(percentile(values, 99), 3),
+        "max_ms": round(values[-1], 3) if values else 0.0,
+    }
+
+_SCENARIO_WORDS = (
+    "ego vehicle target pedestrian cyclist junction roundabout highway urban rural lane merge "
+    "overtake brake accelerate signal crossing rain fog night dawn speed distance sensor camera "
+    "radar lidar occlusion parked truck bus emergency stop yield turn left right straight"
+).split()
+
+def write_synthetic_scenarios(directory: str, n_files: int = 50, words_per_file: int = 2000, seed: int = 0):
+    """
+    Write `n_files` scenario-like .txt files for ingestion (deterministic for a given seed).
+    """
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    for i in range(n_files):
+        words = [rng.choice(_SCENARIO_WORDS) for _ in range(words_per_file)]
+        lines = [" ".join(words[j:j + 15]) + "." for j in range(0, len(words), 15)]
+        with open(os.path.join(directory, f"scenario_{i:04d}.txt"), 'w', encoding='utf-8') as f:
+            f.write(f"Scenario {i}\n" + "\n".join(lines))
+
+def scenario_query(i: int, seed: int = 0) -> str:
+    rng = random.Random(seed * 1_000_003 + i)
+    return f"Generate scenario {i}: " + " ".join(rng.sample(_SCENARIO_WORDS, 8))
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(RESULTS_DIR)
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+def environment() -> dict:
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "git_revision": _git_revision(),
+    }
+
+def save_results(name: str, results: dict, config: dict, output: Optional[str] = None) -> str:
+    """
+    Write {"name", "timestamp", "environment", "config", "results"} and return the path.
+    `results` maps a case name to a flat dict of numeric metrics.
+    """
+    timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{name}-{timestamp}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(
+            {"name": name, "timestamp": timestamp, "environment": environment(), "config": config,
+             "results": results},
+            f, indent=2
+        )
+    return output
+
+def compare_results(current: dict, baseline_path: str, threshold: float = 0.10) -> List[str]:
+    """
+    Compare `current` results with a saved run and return one line per regression larger than
+    `threshold` (relative). Cases or metrics missing from either side are ignored.
+    """
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)["results"]
+    regressions = []
+    for case, metrics in current.items():
+        for metric, value in metrics.items():
+            if metric in NOT_COMPARED:
+                continue
+            before = baseline.get(case, {}).get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(before, (int, float)) or before == 0:
+                continue
+            change = (value - before) / abs(before)
+            worse = -change if metric.endswith(HIGHER_IS_BETTER) else change
+            if worse > threshold:
+                regressions.append(f"{case}.{metric}: {before:g} -> {value:g} ({change:+.1%})")
+    return regressions
+
+def report_comparison(current: dict, baseline_path: Optional[str], threshold: float) -> int:
+    """
+    Print the regressions against `baseline_path` (if given) and return a process exit code.
+    """
+    if not baseline_path:
+        return 0
+    regressions = compare_results(current, baseline_path, threshold)
+    if not regressions:
+        print(f"No regressions above {threshold:.0%} against {baseline_path}")
+        return 0
+    print(f"Regressions above {threshold:.0%} against {baseline_path}:")
+    for line in regressions:
+        print(f"  {line}")
+    return 1
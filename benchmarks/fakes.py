@@ -0,0 +1,227 @@
+# benchmarks/fakes.py
+
+"""
+Deterministic local stand-ins for the external services, used by the offline benchmarks.
+
+- FakeLLM: a LangChain LLM with configurable latency and output length that answers ReAct
+  prompts with valid Action / Final Answer text (and plain text for summaries and reviews).
+- FakeLLMManager: LLMManager serving FakeLLM, with the real response cache in front of it.
+- FakeEmbeddingProvider: the local hashing embeddings plus a simulated network delay.
+- SQLiteMemoryManager: the MemoryManager interface backed by SQLite instead of Postgres.
+"""
+
+import asyncio
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, List, Mapping, Optional, Tuple
+
+from langchain.llms.base import LLM
+
+from agent.embeddings import LocalHashingEmbeddingProvider, normalize_query
+from agent.llm_manager import LLMManager
+from agent.memory_manager import MemoryManager
+
+_VOCABULARY = (
+    "scenario vehicle junction pedestrian signal lane weather ego target braking "
+    "overtake merge highway urban rain night sensor camera radar speed distance"
+).split()
+
+class FakeLLM(LLM):
+    """
+    Sleeps `latency` seconds per call, then answers. ReAct prompts get `tool_steps` search
+    actions before a Final Answer of `output_tokens` words; other prompts get plain text.
+    On the async path with a callback manager, the answer is streamed word by word
+    (`token_interval` seconds apart).
+    """
+    latency: float = 0.05
+    output_tokens: int = 200
+    tool_steps: int = 1
+    token_interval: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-bench"
+
+    @property
+    def _identifying_params(self) -> Mapping[str, Any]:
+        return {"latency": self.latency, "output_tokens": self.output_tokens, "tool_steps": self.tool_steps}
+
+    def _filler(self, seed: str) -> str:
+        rng = random.Random(seed)
+        return " ".join(rng.choice(_VOCABULARY) for _ in range(self.output_tokens))
+
+    def _respond(self, prompt: str) -> str:
+        if "\nQuestion:" not in prompt:
+            return self._filler(prompt[-200:])
+        scratchpad = prompt.rsplit("\nQuestion:", 1)[1]
+        question = scratchpad.split("\n", 1)[0].strip()
+        if scratchpad.count("\nObservation") < self.tool_steps:
+            return f" I should look this up.\nAction: search_tool\nAction Input: {question}"
+        return f" I now know the final answer.\nFinal Answer: {self._filler(question)}"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> str:
+        time.sleep(self.latency)
+        return self._respond(prompt)
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> str:
+        await asyncio.sleep(self.latency)
+        text = self._respond(prompt)
+        if run_manager is not None:
+            for word in text.split(" "):
+                if self.token_interval:
+                    await asyncio.sleep(self.token_interval)
+                await run_manager.on_llm_new_token(word + " ")
+        return text
+
+class FakeLLMManager(LLMManager):
+    """
+    LLMManager whose client is a FakeLLM. Accepts (and ignores) the Azure/Ollama arguments.
+    """
+    def __init__(self, *args, latency: float = 0.05, output_tokens: int = 200, tool_steps: int = 1,
+                 token_interval: float = 0.0, **kwargs):
+        self.fake_options = dict(
+            latency=latency, output_tokens=output_tokens, tool_steps=tool_steps, token_interval=token_interval
+        )
+        super().__init__(*args, **kwargs)
+
+    def _initialize_llm(self):
+        self.llm = FakeLLM(**self.fake_options)
+        self.model_params = {"provider": "fake", **self.fake_options}
+
+class FakeEmbeddingProvider(LocalHashingEmbeddingProvider):
+    """
+    Local hashing embeddings with `latency` seconds of simulated round-trip per batch.
+    Vectors (and the provider name) are those of the local provider, so collections built
+    with either are interchangeable.
+    """
+    def __init__(self, dimension: int = 512, latency: float = 0.0, query_cache_size: int = 2048):
+        super().__init__(dimension=dimension, query_cache_size=query_cache_size)
+        self.latency = latency
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return super()._embed_batch(texts)
+
+    async def _aembed_batch(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return super()._embed_batch(texts)
+
+class SQLiteMemoryManager(MemoryManager):
+    """
+    MemoryManager backed by a single SQLite database (in memory by default), with an optional
+    simulated per-query `latency`. Connection and write-behind arguments are accepted and ignored;
+    similarity lookup of answers is not available.
+    """
+    def __init__(self, *args, db_path: str = ":memory:", latency: float = 0.0, **kwargs):
+        from langchain.memory import ConversationBufferMemory
+        self.short_term_memory = ConversationBufferMemory(memory_key="chat_history")
+        self.write_behind = False
+        self.trigram_enabled = False
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS long_term_memory (memory_key TEXT PRIMARY KEY, memory_value TEXT);
+            CREATE TABLE IF NOT EXISTS answer_memory (
+                key_hash BLOB PRIMARY KEY, user_query TEXT, normalized_query TEXT, answer_xml TEXT,
+                collection_version TEXT, updated_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS feedback (user_query TEXT, feedback_text TEXT);
+            CREATE TABLE IF NOT EXISTS session_memory (session_id TEXT PRIMARY KEY, history TEXT, updated_at REAL);
+            """
+        )
+        self.queries = 0
+
+    def _execute(self, sql: str, params=(), many: bool = False, fetch: bool = False):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.queries += 1
+            cursor = self._db.executemany(sql, params) if many else self._db.execute(sql, params)
+            row = cursor.fetchone() if fetch else None
+            self._db.commit()
+            return row
+
+    def add_long_term_memory(self, key: str, value: str):
+        self.add_long_term_memories([(key, value)])
+
+    def add_long_term_memories(self, items: List[Tuple[str, str]]):
+        self._execute(
+            """
+            INSERT INTO long_term_memory (memory_key, memory_value) VALUES (?, ?)
+            ON CONFLICT (memory_key) DO UPDATE SET memory_value = excluded.memory_value;
+            """,
+            list(dict(items).items()),
+            many=True
+        )
+
+    def retrieve_long_term_memory(self, key: str) -> Optional[str]:
+        row = self._execute("SELECT memory_value FROM long_term_memory WHERE memory_key = ?;", (key,), fetch=True)
+        return row[0] if row else None
+
+    def store_feedback(self, user_query: str, feedback_text: str):
+        self._execute("INSERT INTO feedback (user_query, feedback_text) VALUES (?, ?);", (user_query, feedback_text))
+
+    def save_session_history(self, session_id: str, history_json: str):
+        self._execute(
+            """
+            INSERT INTO session_memory (session_id, history, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT (session_id) DO UPDATE SET history = excluded.history, updated_at = excluded.updated_at;
+            """,
+            (session_id, history_json, time.time())
+        )
+
+    def load_session_history(self, session_id: str) -> Optional[str]:
+        row = self._execute("SELECT history FROM session_memory WHERE session_id = ?;", (session_id,), fetch=True)
+        return row[0] if row else None
+
+    def ensure_answer_schema(self):
+        pass
+
+    def ensure_session_schema(self):
+        pass
+
+    def store_answers(self, items: List[Tuple[str, str]], collection_version: str):
+        now = time.time()
+        self._execute(
+            """
+            INSERT INTO answer_memory
+                (key_hash, user_query, normalized_query, answer_xml, collection_version, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (key_hash) DO UPDATE SET
+                user_query = excluded.user_query, normalized_query = excluded.normalized_query,
+                answer_xml = excluded.answer_xml, collection_version = excluded.collection_version,
+                updated_at = excluded.updated_at;
+            """,
+            [(self.answer_key_hash(query), query, normalize_query(query), value, collection_version, now)
+             for query, value in dict(items).items()],
+            many=True
+        )
+
+    def lookup_answer(self, query: str, collection_version: str,
+                      similarity_threshold: Optional[float] = None) -> Optional[dict]:
+        row = self._execute(
+            """
+            SELECT user_query, answer_xml FROM answer_memory WHERE key_hash = ? AND collection_version = ?;
+            """,
+            (self.answer_key_hash(query), collection_version),
+            fetch=True
+        )
+        if row:
+            return {"query": row[0], "xml": row[1], "match": "exact", "score": 1.0}
+        return None
+
+    def flush(self):
+        pass
+
+    def get_metrics(self) -> dict:
+        return {"queue_depth": 0, "queries": self.queries}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
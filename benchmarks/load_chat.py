@@ -0,0 +1,194 @@
+# benchmarks/load_chat.py
+
+"""
+Load-test POST /chat at fixed concurrency levels and report latency percentiles and throughput.
+
+By default the whole service runs in-process and offline: synthetic scenario files are
+ingested with the local embeddings into the NumPy store, and the server is imported with
+FakeLLMManager and SQLiteMemoryManager (see benchmarks.fakes) in place of Azure OpenAI and
+Postgres. Each level sends `--requests` distinct queries (plus `--duplicate-ratio` repeats)
+from `concurrency` concurrent clients. With --url, a running server is driven instead.
+
+    python -m benchmarks.load_chat --concurrency 1 4 16 --requests 100 --llm-latency 0.2
+    python -m benchmarks.load_chat --compare benchmarks/results/load_chat-20240101-120000.json
+"""
+
+import argparse
+import asyncio
+import functools
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.common import (
+    report_comparison, save_results, scenario_query, summarize_latencies, write_synthetic_scenarios
+)
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _prepare_offline_server(args, workdir: str):
+    """
+    Ingest a synthetic corpus into `workdir`, then import the server against local stand-ins.
+    Returns (server module, ingest_report).
+    """
+    from ingest_scenarios import ingest_scenarios
+    import agent.llm_manager
+    import agent.memory_manager
+    import agent.tools
+    from benchmarks.fakes import FakeEmbeddingProvider, FakeLLMManager, SQLiteMemoryManager
+
+    scenario_dir = os.path.join(workdir, "scenarios")
+    write_synthetic_scenarios(scenario_dir, n_files=args.n_files)
+    # The server resolves its schema, vector store and SQLite files relative to the working directory
+    os.makedirs(os.path.join(workdir, "agent"))
+    os.symlink(os.path.join(REPO_DIR, "agent", "schemas"), os.path.join(workdir, "agent", "schemas"))
+    os.chdir(workdir)
+    os.environ["EMBEDDING_PROVIDER"] = "local"
+    os.environ["VECTOR_STORE_BACKEND"] = "numpy"
+
+    ingest_report = ingest_scenarios(
+        scenario_dir=scenario_dir,
+        persist_directory="chroma_db",
+        embedding_provider=FakeEmbeddingProvider(latency=args.embed_latency),
+        vector_store_backend="numpy",
+        progress_interval=3600.0
+    )
+
+    # Swapped in before `server` imports them
+    agent.llm_manager.LLMManager = functools.partial(
+        FakeLLMManager, latency=args.llm_latency, output_tokens=args.output_tokens,
+        tool_steps=args.tool_steps, token_interval=args.token_interval, cache_path=None
+    )
+    agent.memory_manager.MemoryManager = functools.partial(SQLiteMemoryManager, latency=args.db_latency)
+    agent.tools.get_embedding_provider = lambda: FakeEmbeddingProvider(latency=args.embed_latency)
+    import server
+
+    return server, ingest_report
+
+async def _run_level(client: httpx.AsyncClient, queries, concurrency: int) -> dict:
+    pending = list(enumerate(queries))
+    latencies, errors, reused, coalesced = [], 0, 0, 0
+
+    async def worker():
+        nonlocal errors, reused, coalesced
+        while pending:
+            _, query = pending.pop()
+            started = time.perf_counter()
+            try:
+                response = await client.post("/chat", json={"query": query})
+                body = response.json()
+                ok = response.status_code == 200 and "error" not in body
+            except Exception:
+                ok, body = False, {}
+            latencies.append((time.perf_counter() - started) * 1000.0)
+            if not ok:
+                errors += 1
+            reused += "reused" in body
+            coalesced += bool(body.get("coalesced"))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    summary = summarize_latencies(latencies)
+    summary.update({
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "errors": errors,
+        "reused": reused,
+        "coalesced": coalesced,
+    })
+    return summary
+
+def _queries_for_level(args, offset: int):
+    """
+    `requests` distinct queries, then `duplicate_ratio` of them repeated, shuffled together.
+    Offsets keep queries distinct across levels so stored answers from one level are not reused.
+    """
+    rng = random.Random(offset)
+    queries = [scenario_query(offset + i) for i in range(args.requests)]
+    queries += [rng.choice(queries) for _ in range(int(args.requests * args.duplicate_ratio))]
+    rng.shuffle(queries)
+    return queries
+
+async def _drive(args, app=None) -> dict:
+    transport = httpx.ASGITransport(app=app) if app is not None else None
+    results = {}
+    async with httpx.AsyncClient(
+        transport=transport, base_url=args.url or "http://bench", timeout=args.timeout
+    ) as client:
+        if args.warmup:
+            await _run_level(client, [scenario_query(10_000_000 + i) for i in range(args.warmup)], 1)
+        for level, concurrency in enumerate(args.concurrency):
+            queries = _queries_for_level(args, (level + 1) * 1_000_000)
+            results[f"c{concurrency}"] = summary = await _run_level(client, queries, concurrency)
+            print(
+                f"concurrency={concurrency:<4} n={summary['count']:<5} p50={summary['p50_ms']:.1f}ms  "
+                f"p95={summary['p95_ms']:.1f}ms  p99={summary['p99_ms']:.1f}ms  rps={summary['rps']:.1f}  "
+                f"errors={summary['errors']}  reused={summary['reused']}  coalesced={summary['coalesced']}"
+            )
+    return results
+
+async def _drive_offline(args, server) -> dict:
+    """
+    Run the app's lifespan (background warm-up, then resource shutdown) around the load,
+    starting once the worker reports ready.
+    """
+    async with server.app.router.lifespan_context(server.app):
+        deadline = time.monotonic() + args.timeout
+        while not server.lifecycle.ready:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Server not ready: {server.lifecycle.status()['errors']}")
+            await asyncio.sleep(0.05)
+        results = {"startup": {"cold_start_ms": round(server.lifecycle.cold_start_seconds * 1000.0, 1)}}
+        print(f"Server ready after {results['startup']['cold_start_ms']:.0f}ms")
+        results.update(await _drive(args, server.app))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=100, help="Distinct queries per concurrency level")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.0,
+                        help="Extra repeated queries per level, as a fraction of --requests")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--url", default=None, help="Drive a running server instead of the offline one")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds per fake LLM call")
+    parser.add_argument("--output-tokens", type=int, default=200, help="Words per fake final answer")
+    parser.add_argument("--tool-steps", type=int, default=1, help="Search actions before the final answer")
+    parser.add_argument("--token-interval", type=float, default=0.0, help="Seconds between streamed tokens")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="Seconds per fake embedding batch")
+    parser.add_argument("--db-latency", type=float, default=0.0, help="Seconds per fake database query")
+    parser.add_argument("--n-files", type=int, default=50, help="Synthetic scenario files to ingest")
+    parser.add_argument("--output", default=None, help="Result file (default: benchmarks/results/)")
+    parser.add_argument("--compare", default=None, help="Earlier result file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change counted as a regression")
+    args = parser.parse_args()
+
+    results = {}
+    if args.url:
+        results.update(asyncio.run(_drive(args)))
+    else:
+        cwd = os.getcwd()
+        workdir = tempfile.mkdtemp(prefix="load_chat_")
+        try:
+            server, ingest_report = _prepare_offline_server(args, workdir)
+            results["ingest"] = {
+                "chunks": ingest_report["chunks_embedded"],
+                "chunks_per_s": round(ingest_report["chunks_per_second"], 1),
+            }
+            results.update(asyncio.run(_drive_offline(args, server)))
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    path = save_results("load_chat", results, vars(args), args.output)
+    print(f"Results written to {path}")
+    sys.exit(report_comparison(results, args.compare, args.threshold))
+
+if __name__ == "__main__":
+    main()
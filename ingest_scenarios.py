@@ -1,29 +1,452 @@
 # ingest_scenarios.py
+import argparse
+import hashlib
+import io
+import json
 import os
-from langchain.embeddings import OpenAIEmbeddings
+import queue
+import threading
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import lxml.etree as ET
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.vectorstores import Chroma
-
-def ingest_scenarios(scenario_dir="data/scenario_files", persist_directory="chroma_db"):
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=100)
-    embedding_function = OpenAIEmbeddings()
-
-    docs_to_store = []
-    for filename in os.listdir(scenario_dir):
-        if filename.endswith(".txt") or filename.endswith(".md") or filename.endswith(".docx"):
-            with open(os.path.join(scenario_dir, filename), 'r', encoding='utf-8') as f:
-                text = f.read()
-            chunks = text_splitter.split_text(text)
-            for chunk in chunks:
-                docs_to_store.append(chunk)
-
-    store = Chroma.from_texts(
-        docs_to_store,
-        embedding_function,
+
+from agent.embeddings import bind_collection_to_provider, get_embedding_provider
+from agent.vector_store import CollectionVersion, open_vector_store
+
+SUPPORTED_EXTENSIONS = (".txt", ".md", ".docx")
+_WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+# ---- Text extraction (runs in worker processes) -------------------------------
+
+def _extract_plain_text(raw: bytes) -> str:
+    return raw.decode('utf-8')
+
+def _extract_docx_text(raw: bytes) -> str:
+    """
+    A .docx file is a zip archive; the body text lives in word/document.xml as <w:t>
+    runs grouped into <w:p> paragraphs.
+    """
+    with zipfile.ZipFile(io.BytesIO(raw)) as docx:
+        document_xml = docx.read("word/document.xml")
+    parser = ET.XMLParser(resolve_entities=False, huge_tree=True)
+    document = ET.fromstring(document_xml, parser)
+    paragraphs = []
+    for paragraph in document.iter(f"{_WORD_NS}p"):
+        paragraphs.append("".join(t.text or "" for t in paragraph.iter(f"{_WORD_NS}t")))
+    return "\n".join(paragraphs)
+
+EXTRACTORS = {
+    ".txt": _extract_plain_text,
+    ".md": _extract_plain_text,
+    ".docx": _extract_docx_text,
+}
+
+def _parse_file(path: str, filename: str, known_hash, chunk_size: int, chunk_overlap: int):
+    """
+    Hash, extract and split one file. Unchanged files (hash equal to `known_hash`)
+    are returned without being extracted or split.
+    """
+    with open(path, 'rb') as f:
+        raw = f.read()
+    file_hash = _sha256(raw)
+    if file_hash == known_hash:
+        return filename, file_hash, None, None
+
+    text = EXTRACTORS[os.path.splitext(filename)[1].lower()](raw)
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunks = text_splitter.split_text(text)
+    return filename, file_hash, chunks, _chunk_ids(filename, chunks)
+
+# ---- Manifest ------------------------------------------------------------------
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def _manifest_path(persist_directory: str, collection_name: str) -> str:
+    return os.path.join(persist_directory, f"{collection_name}_manifest.json")
+
+def _load_manifest(path: str) -> dict:
+    if not os.path.exists(path):
+        return {"files": {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _save_manifest(path: str, manifest: dict):
+    # Write to a temp file first so an interrupted run never leaves a truncated manifest
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def _chunk_ids(filename: str, chunks):
+    """
+    Stable ids derived from the source file and the chunk content, so an unchanged chunk
+    keeps its id across runs. Repeated identical chunks within a file get an occurrence suffix.
+    """
+    ids = []
+    occurrences = {}
+    for chunk in chunks:
+        digest = _sha256(f"{filename}\x00{chunk}".encode("utf-8"))
+        n = occurrences.get(digest, 0)
+        occurrences[digest] = n + 1
+        ids.append(f"{digest}-{n}")
+    return ids
+
+# ---- Streaming pipeline --------------------------------------------------------
+
+class _IngestPipeline:
+    """
+    Chunks flow from the parser processes through a bounded queue into embedding threads,
+    which batch them into `embed_documents` calls. A single writer thread upserts the
+    embedded batches and applies deletions, and records a file in the manifest once all
+    of its chunks are stored. Because the queues are bounded, a slow stage applies
+    backpressure instead of letting the corpus accumulate in memory.
+    """
+    def __init__(self, store, embedding_function, manifest: dict, manifest_path: str, report: dict,
+                 embed_batch_size: int, embed_concurrency: int, queue_size: int, progress_interval: float):
+        self.store = store
+        self.embedding_function = embedding_function
+        self.manifest = manifest
+        self.manifest_path = manifest_path
+        self.report = report
+        self.embed_batch_size = embed_batch_size
+        self.embed_concurrency = embed_concurrency
+        self.progress_interval = progress_interval
+
+        self.chunk_queue = queue.Queue(maxsize=queue_size)
+        self.write_queue = queue.Queue(maxsize=max(2, queue_size // embed_batch_size))
+        self.abort = threading.Event()
+        self.errors = []
+        self._lock = threading.Lock()
+        self._pending_files = {}
+        self._last_manifest_save = time.monotonic()
+        self._last_progress = time.monotonic()
+        self._started = time.monotonic()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.embed_concurrency):
+            self._threads.append(threading.Thread(target=self._guard, args=(self._embed_loop,), name=f"embed-{i}"))
+        self._writer = threading.Thread(target=self._guard, args=(self._write_loop,), name="vector-writer")
+        for t in self._threads + [self._writer]:
+            t.daemon = True
+            t.start()
+
+    def _guard(self, target):
+        try:
+            target()
+        except BaseException as e:
+            self.errors.append(e)
+            self.abort.set()
+
+    def _put(self, q: queue.Queue, item):
+        while not self.abort.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+        raise RuntimeError("Ingestion aborted") from (self.errors[0] if self.errors else None)
+
+    def _get(self, q: queue.Queue, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.abort.is_set():
+            wait_for = 0.5 if deadline is None else min(0.5, deadline - time.monotonic())
+            if wait_for <= 0:
+                raise queue.Empty
+            try:
+                return q.get(timeout=wait_for)
+            except queue.Empty:
+                continue
+        raise RuntimeError("Ingestion aborted")
+
+    # Main thread -------------------------------------------------------------
+
+    def submit_file(self, filename: str, file_hash: str, chunks, ids, stale_ids, to_embed):
+        entry = {"file_hash": file_hash, "chunk_ids": ids, "chars": sum(len(c) for c in chunks)}
+        if stale_ids:
+            self._put(self.write_queue, ("delete", sorted(stale_ids)))
+        with self._lock:
+            if not to_embed:
+                self._commit_file(filename, entry)
+                return
+            self._pending_files[filename] = {"remaining": len(to_embed), "entry": entry}
+        for chunk_id, chunk in to_embed:
+            self._put(self.chunk_queue, (filename, chunk_id, chunk))
+
+    def delete_file(self, filename: str):
+        removed_ids = self.manifest["files"].get(filename, {}).get("chunk_ids", [])
+        if removed_ids:
+            self._put(self.write_queue, ("delete", removed_ids))
+        with self._lock:
+            self.manifest["files"].pop(filename, None)
+
+    def finish(self):
+        for _ in range(self.embed_concurrency):
+            self._put(self.chunk_queue, None)
+        for t in self._threads:
+            t.join()
+        self._put(self.write_queue, None)
+        self._writer.join()
+        if self.errors:
+            raise self.errors[0]
+
+    # Worker threads ----------------------------------------------------------
+
+    def _embed_loop(self):
+        while True:
+            item = self._get(self.chunk_queue)
+            if item is None:
+                return
+            batch = [item]
+            done = False
+            while len(batch) < self.embed_batch_size:
+                try:
+                    item = self._get(self.chunk_queue, timeout=0.05)
+                except queue.Empty:
+                    break
+                if item is None:
+                    done = True
+                    break
+                batch.append(item)
+            embeddings = self.embedding_function.embed_documents([chunk for _, _, chunk in batch])
+            self._put(self.write_queue, ("upsert", batch, embeddings))
+            if done:
+                return
+
+    def _write_loop(self):
+        while True:
+            op = self._get(self.write_queue)
+            if op is None:
+                self._report_progress(force=True)
+                return
+            if op[0] == "delete":
+                self.store.delete(ids=op[1])
+                continue
+
+            _, batch, embeddings = op
+            self.store.upsert(
+                ids=[chunk_id for _, chunk_id, _ in batch],
+                embeddings=embeddings,
+                documents=[chunk for _, _, chunk in batch],
+                metadatas=[{"source": filename} for filename, _, _ in batch],
+            )
+            with self._lock:
+                self.report["chunks_embedded"] += len(batch)
+                self.report["chars_embedded"] += sum(len(chunk) for _, _, chunk in batch)
+                for filename, _, _ in batch:
+                    pending = self._pending_files[filename]
+                    pending["remaining"] -= 1
+                    if pending["remaining"] == 0:
+                        self._commit_file(filename, self._pending_files.pop(filename)["entry"])
+            self._report_progress()
+
+    def _commit_file(self, filename: str, entry: dict):
+        # Called with the lock held. The manifest is saved periodically so that an
+        # interrupted run resumes from the last fully stored files.
+        self.manifest["files"][filename] = entry
+        now = time.monotonic()
+        if now - self._last_manifest_save > 5.0:
+            _save_manifest(self.manifest_path, self.manifest)
+            self._last_manifest_save = now
+
+    def _report_progress(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_progress < self.progress_interval:
+            return
+        self._last_progress = now
+        elapsed = now - self._started
+        embedded = self.report["chunks_embedded"]
+        rate = embedded / elapsed if elapsed > 0 else 0.0
+        print(
+            f"[ingest] {self.report['files_processed']} files processed, {embedded} chunks embedded, "
+            f"{rate:.1f} chunks/s, queue depth {self.chunk_queue.qsize()}"
+        )
+
+def _run_parsers(pipeline, store, scenario_dir, filenames, known_files, report,
+                 workers, chunk_size, chunk_overlap):
+    """
+    Parse files in a process pool and feed the changed chunks into the pipeline.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        remaining_files = iter(filenames)
+        in_flight = set()
+
+        def submit_next():
+            filename = next(remaining_files, None)
+            if filename is not None:
+                known_hash = known_files.get(filename, {}).get("file_hash")
+                in_flight.add(pool.submit(
+                    _parse_file, os.path.join(scenario_dir, filename), filename,
+                    known_hash, chunk_size, chunk_overlap
+                ))
+
+        # Only a couple of files per worker are parsed ahead of the embedding stage
+        for _ in range(workers * 2):
+            submit_next()
+
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                filename, file_hash, chunks, ids = future.result()
+                submit_next()
+                report["files_processed"] += 1
+                entry = known_files.get(filename)
+
+                if chunks is None:
+                    report["files_unchanged"] += 1
+                    report["chunks_reused"] += len(entry["chunk_ids"])
+                    report["chars_skipped"] += entry.get("chars", 0)
+                    continue
+
+                old_ids = set(entry["chunk_ids"]) if entry else set()
+                stale_ids = old_ids.difference(ids)
+                candidates = [(i, c) for i, c in zip(ids, chunks) if i not in old_ids]
+                # Chunks stored by an interrupted earlier run are already in the collection
+                stored = store.existing_ids([i for i, _ in candidates])
+                to_embed = [(i, c) for i, c in candidates if i not in stored]
+
+                reused = [c for i, c in zip(ids, chunks) if i in old_ids or i in stored]
+                report["chunks_reused"] += len(reused)
+                report["chars_skipped"] += sum(len(c) for c in reused)
+                report["chunks_removed"] += len(stale_ids)
+                report["files_changed" if entry else "files_added"] += 1
+
+                pipeline.submit_file(filename, file_hash, chunks, ids, stale_ids, to_embed)
+
+def ingest_scenarios(scenario_dir="data/scenario_files", persist_directory="chroma_db",
+                     collection_name="scenario_collection", workers=None, embed_batch_size=64,
+                     embed_concurrency=4, queue_size=1024, chunk_size=800, chunk_overlap=100,
+                     progress_interval=5.0, embedding_provider=None, vector_store_backend=None):
+    """
+    Incrementally sync the scenario files into the vector store collection.
+
+    A manifest of per-file and per-chunk content hashes is kept next to the collection.
+    Unchanged files are skipped without being re-split, only new or edited chunks are
+    embedded and upserted (under stable ids), and chunks belonging to edited or deleted
+    files are removed. Returns a report of the work done and skipped.
+
+    Files are extracted and split in a pool of `workers` processes and streamed through
+    bounded queues into `embed_concurrency` embedding threads that send batches of
+    `embed_batch_size` chunks, so memory stays bounded regardless of corpus size.
+    An interrupted run can simply be restarted: fully stored files are in the manifest,
+    and chunks already upserted for partially stored files are not embedded again.
+
+    `embedding_provider` is a provider name or instance (see agent.embeddings); it must be
+    the same one RAGSearchTool uses, and is recorded on the collection to enforce that.
+    `vector_store_backend` selects "chroma" or "numpy" (see agent.vector_store).
+    """
+    if embedding_provider is None or isinstance(embedding_provider, str):
+        embedding_function = get_embedding_provider(embedding_provider)
+    else:
+        embedding_function = embedding_provider
+
+    os.makedirs(persist_directory, exist_ok=True)
+    manifest_path = _manifest_path(persist_directory, collection_name)
+    manifest = _load_manifest(manifest_path)
+
+    store = open_vector_store(
+        backend=vector_store_backend,
+        collection_name=collection_name,
         persist_directory=persist_directory,
-        collection_name="scenario_collection",
+        embedding_function=embedding_function,
+    )
+    reset_collection = "format" not in manifest and store.count() > 0
+    if reset_collection:
+        # The collection was filled by the old append-only ingestion, which left duplicates
+        # under random ids. Start over once so the manifest matches what is stored.
+        store.reset()
+    bind_collection_to_provider(store, embedding_function)
+
+    # Mark the collection as manifest-managed right away, so an interrupted first run resumes
+    manifest["format"] = 2
+    _save_manifest(manifest_path, manifest)
+
+    report = {
+        "files_processed": 0,
+        "files_unchanged": 0,
+        "files_changed": 0,
+        "files_added": 0,
+        "files_deleted": 0,
+        "chunks_embedded": 0,
+        "chunks_reused": 0,
+        "chunks_removed": 0,
+        "chars_embedded": 0,
+        "chars_skipped": 0,
+    }
+    started = time.monotonic()
+
+    filenames = sorted(f for f in os.listdir(scenario_dir) if f.lower().endswith(SUPPORTED_EXTENSIONS))
+    known_files = dict(manifest["files"])
+
+    pipeline = _IngestPipeline(
+        store, embedding_function, manifest, manifest_path, report,
+        embed_batch_size=embed_batch_size,
+        embed_concurrency=embed_concurrency,
+        queue_size=queue_size,
+        progress_interval=progress_interval,
     )
+    pipeline.start()
+
+    workers = workers or os.cpu_count() or 1
+    try:
+        _run_parsers(pipeline, store, scenario_dir, filenames, known_files, report,
+                     workers, chunk_size, chunk_overlap)
+    except BaseException:
+        pipeline.abort.set()
+        raise
+
+    for filename in sorted(set(known_files) - set(filenames)):
+        report["files_deleted"] += 1
+        report["chunks_removed"] += len(known_files[filename]["chunk_ids"])
+        pipeline.delete_file(filename)
+
+    pipeline.finish()
+    # Builds the IVF index for large NumPy collections; a no-op for Chroma
+    store.optimize()
     store.persist()
+    _save_manifest(manifest_path, manifest)
+    if report["chunks_embedded"] or report["chunks_removed"] or reset_collection:
+        # Invalidates retrieval results cached against the previous contents
+        report["collection_version"] = CollectionVersion(collection_name, persist_directory).bump()
+
+    elapsed = time.monotonic() - started
+    report["elapsed_seconds"] = elapsed
+    report["chunks_per_second"] = report["chunks_embedded"] / elapsed if elapsed > 0 else 0.0
+    total_chunks = report["chunks_embedded"] + report["chunks_reused"]
+    skipped_pct = 100.0 * report["chunks_reused"] / total_chunks if total_chunks else 0.0
+    print(
+        f"Ingestion complete: {report['files_added']} added, {report['files_changed']} changed, "
+        f"{report['files_unchanged']} unchanged, {report['files_deleted']} deleted files.\n"
+        f"Embedded {report['chunks_embedded']} chunks ({report['chars_embedded']} chars), "
+        f"reused {report['chunks_reused']} ({skipped_pct:.1f}% of embedding work skipped), "
+        f"removed {report['chunks_removed']} stale chunks.\n"
+        f"Took {elapsed:.1f}s ({report['chunks_per_second']:.1f} chunks/s)."
+    )
+    return report
 
 if __name__ == "__main__":
-    ingest_scenarios()
+    parser = argparse.ArgumentParser(description="Ingest scenario files into the vector store.")
+    parser.add_argument("--scenario-dir", default="data/scenario_files")
+    parser.add_argument("--persist-directory", default="chroma_db")
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: CPU count)")
+    parser.add_argument("--embed-batch-size", type=int, default=64)
+    parser.add_argument("--embed-concurrency", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=1024, help="Max chunks buffered before embedding")
+    parser.add_argument("--embedding-provider", default=None,
+                        help="openai or local (default: EMBEDDING_PROVIDER env var, else openai)")
+    parser.add_argument("--vector-store", default=None,
+                        help="chroma or numpy (default: VECTOR_STORE_BACKEND env var, else chroma)")
+    args = parser.parse_args()
+    ingest_scenarios(
+        scenario_dir=args.scenario_dir,
+        persist_directory=args.persist_directory,
+        workers=args.workers,
+        embed_batch_size=args.embed_batch_size,
+        embed_concurrency=args.embed_concurrency,
+        queue_size=args.queue_size,
+        embedding_provider=args.embedding_provider,
+        vector_store_backend=args.vector_store,
+    )
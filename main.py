@@ -1,20 +1,30 @@
 # main.py
 
+import logging
+import uuid
+
+from agent.answer_cache import AnswerCache
 from agent.llm_manager import LLMManager
 from agent.memory_manager import MemoryManager
+from agent.metrics import configure_logging
 from agent.tools import RAGSearchTool, SummarizeTool
-from agent.custom_agent import build_react_agent
+from agent.custom_agent import LLM_PROFILE as REACT_LLM_PROFILE, build_react_agent
 from agent.review_manager import ReviewManager
+from agent.review_queue import ReviewQueue
 from agent.xml_generator import XMLGenerator
 
+logger = logging.getLogger(__name__)
+
 def main():
+    configure_logging()
+
     # 1. LLM Setup
     llm_manager = LLMManager(
         use_azure_openai=True,
         azure_openai_deployment_name="your_azure_deployment_name",
         azure_openai_api_key="your_azure_api_key"
     )
-    llm = llm_manager.get_llm()
+    llm = llm_manager.get_llm(profile=REACT_LLM_PROFILE)
 
     # 2. Memory (Postgres for long-term + conversation buffer)
     memory_manager = MemoryManager(
@@ -28,24 +38,40 @@ def main():
 
     # 3. Tools for ReAct
     search_tool = RAGSearchTool(collection_name="scenario_collection", persist_directory="chroma_db")
-    summarize_tool = SummarizeTool(llm)
+    # Summaries and reviews are deterministic enough to be served from the response cache
+    summarize_tool = SummarizeTool(llm_manager.get_llm(cached=True, profile=SummarizeTool.llm_profile))
     tools = [search_tool, summarize_tool]
 
     # 4. Build ReAct agent with our prompt-engineered system instructions
-    react_agent = build_react_agent(llm, tools, short_term_memory)
+    # Independent tool calls of one turn run concurrently, bounded per call and per request
+    react_agent = build_react_agent(
+        llm, tools, short_term_memory,
+        multi_action=True, tool_timeout=30.0, max_iterations=6, max_execution_time=90.0
+    )
 
     # 5. Review Manager for self-critique
-    review_manager = ReviewManager(llm)
+    review_manager = ReviewManager(llm_manager.get_llm(cached=True, profile=ReviewManager.llm_profile))
+    review_queue = ReviewQueue(review_manager, memory_manager=memory_manager, workers=1)
 
     # 6. XML Generator with XSD validation
     xml_generator = XMLGenerator(xsd_path="agent/schemas/scenario.xsd")
 
+    # Stored answers are reused while the scenario collection is unchanged
+    answer_cache = AnswerCache(memory_manager, search_tool.collection_version)
+
     # 7. Example flow
     user_query = input("Enter your request: ")
+    reused = answer_cache.lookup(user_query)
+    if reused is not None:
+        print(f"\n=== Reused answer ({reused['match']} match for: {reused['query']}) ===")
+        print(reused["xml"])
+        review_queue.close()
+        memory_manager.close()
+        return
+
     intermediate_response = react_agent(user_query)
 
-    print("\n[DEBUG] ReAct agent intermediate response:")
-    print(intermediate_response)
+    logger.info("ReAct agent intermediate response:\n%s", intermediate_response)
 
     try:
         # Generate final XML from the intermediate data & user query
@@ -60,15 +86,12 @@ def main():
         print(xml_output)
 
         # Store final XML in long-term memory
-        memory_manager.add_long_term_memory(key=user_query, value=xml_output)
-
-        # Self-review step
-        review_text = review_manager.generate_review(user_query, xml_output)
-        print("\n=== Agent's Self-Review ===")
-        print(review_text)
+        answer_cache.store(user_query, xml_output)
 
-        # Optionally store the self-review
-        memory_manager.add_long_term_memory(key=f"{user_query}_review", value=review_text)
+        # Self-review runs in the background (and is stored in long-term memory)
+        # while the user is typing feedback
+        request_id = uuid.uuid4().hex
+        review_queue.enqueue(request_id, user_query, xml_output)
 
         # Collect user feedback
         feedback = input("\nPlease provide any feedback (or press Enter to skip): ")
@@ -76,8 +99,18 @@ def main():
             memory_manager.store_feedback(user_query, feedback)
             print("Feedback recorded. Thank you!")
 
+        review_job = review_queue.wait(request_id, timeout=120)
+        print("\n=== Agent's Self-Review ===")
+        if review_job is not None and review_job["status"] == "done":
+            print(review_job["review"])
+        else:
+            print(f"Review not available yet; it stays queued as {request_id}.")
+
     except ValueError as e:
         print(f"Error generating or validating XML: {e}")
+    finally:
+        review_queue.close()
+        memory_manager.close()
 
 if __name__ == "__main__":
     main()
@@ -1,78 +1,436 @@
 # server.py
 
-from fastapi import FastAPI
-from pydantic import BaseModel
+import asyncio
+import json
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Optional
 import uvicorn
 
+from agent.answer_cache import AnswerCache
+from agent.batch import ScenarioBatchProcessor
+from agent.embeddings import normalize_query
+from agent.lifecycle import LazyResource, ServiceLifecycle
 from agent.llm_manager import LLMManager
 from agent.memory_manager import MemoryManager
+from agent.metrics import HTTP_LATENCY, REGISTRY, configure_logging, new_trace_id, trace_id_var
+from agent.session_memory import SessionMemoryStore
+from agent.singleflight import SingleFlight
+from agent.token_counter import TokenCounter
 from agent.tools import RAGSearchTool, SummarizeTool
-from agent.custom_agent import build_react_agent
+from agent.custom_agent import LLM_PROFILE as REACT_LLM_PROFILE, build_async_react_agent
 from agent.review_manager import ReviewManager
+from agent.review_queue import ReviewQueue
+from agent.streaming import AgentEventStream, format_sse
 from agent.xml_generator import XMLGenerator
 
-app = FastAPI()
+IMPORTED_AT = time.monotonic()
+configure_logging()
 
-# Initialize global objects (in real-world, handle them more elegantly)
-llm_manager = LLMManager(
+# Service objects are created per worker process, on first use or during the background
+# warm-up, never at import: nothing (Postgres pool, Chroma, review workers) is opened
+# before uvicorn/gunicorn fork their workers, and a dependency that is down only makes
+# /readyz fail instead of crashing the import.
+llm_manager = LazyResource("llm_manager", lambda: LLMManager(
     use_azure_openai=True,
     azure_openai_deployment_name="your_deployment_name",
-    azure_openai_api_key="your_azure_api_key"
-)
-llm = llm_manager.get_llm()
+    azure_openai_api_key="your_azure_api_key",
+    streaming=True,  # lets /chat/stream forward tokens; /chat still gets whole responses
+    # With a backend pool (LLM_BACKENDS), slow requests are duplicated on another replica
+    scheduler_options={"hedge_percentile": 95.0, "max_hedge_ratio": 0.05}
+))
 
-memory_manager = MemoryManager(
+memory_manager = LazyResource("memory_manager", lambda: MemoryManager(
     pg_host="localhost",
     pg_port=5432,
     pg_database="mydb",
     pg_user="myuser",
-    pg_password="mypassword"
+    pg_password="mypassword",
+    pool_min_size=2,
+    pool_max_size=20,
+    write_behind=True
+), close=lambda manager: manager.close())
+
+# One bounded conversation window per session; idle sessions spill to Postgres
+session_store = LazyResource("session_store", lambda: SessionMemoryStore(
+    window_turns=5,
+    session_ttl=1800,
+    max_sessions=1000,
+    memory_manager=memory_manager.get()
+))
+
+search_tool = LazyResource("search_tool", RAGSearchTool)
+# Summaries and reviews are deterministic enough to be served from the response cache
+summarize_tool = LazyResource("summarize_tool", lambda: SummarizeTool(
+    llm_manager.get().get_llm(cached=True, profile=SummarizeTool.llm_profile)
+))
+
+# Independent retrievals/summaries requested in one LLM turn run concurrently;
+# each request is capped in LLM turns and wall-clock time
+agent_options = dict(
+    multi_action=True,
+    max_parallel_tools=4,
+    tool_timeout=30.0,
+    max_iterations=6,
+    max_execution_time=90.0
 )
-short_term_memory = memory_manager.get_short_term_memory()
 
-search_tool = RAGSearchTool()
-summarize_tool = SummarizeTool(llm)
-tools = [search_tool, summarize_tool]
+# Self-reviews are generated in the background and fetched via /review/{request_id}
+review_queue = LazyResource("review_queue", lambda: ReviewQueue(
+    ReviewManager(llm_manager.get().get_llm(cached=True, profile=ReviewManager.llm_profile)),
+    memory_manager=memory_manager.get(),
+    db_path="review_queue.sqlite3",
+    workers=2,
+    batch_size=8
+), close=lambda queue: queue.close())
+xml_gen = LazyResource("xml_generator", lambda: XMLGenerator(xsd_path="agent/schemas/scenario.xsd"))
+
+# Repeat questions are answered from long-term memory while the scenario collection is unchanged.
+# Only exact repeats are reused unless ANSWER_SIMILARITY_THRESHOLD (e.g. 0.85) opts in to
+# serving the answer of a merely similar question.
+ANSWER_SIMILARITY_THRESHOLD = os.getenv("ANSWER_SIMILARITY_THRESHOLD")
+answer_cache = LazyResource("answer_cache", lambda: AnswerCache(
+    memory_manager.get(),
+    search_tool.get().collection_version,
+    similarity_threshold=float(ANSWER_SIMILARITY_THRESHOLD) if ANSWER_SIMILARITY_THRESHOLD else None
+))
+
+batch_processor = LazyResource("batch_processor", lambda: ScenarioBatchProcessor(
+    llm_manager.get().get_llm(profile=REACT_LLM_PROFILE),
+    [search_tool.get(), summarize_tool.get()], xml_gen.get(), memory_manager.get(),
+    review_queue=review_queue.get(), answer_cache=answer_cache.get(), agent_options=agent_options
+))
+BATCH_DEFAULT_CONCURRENCY = 8
+BATCH_MAX_CONCURRENCY = 32
+
+# Identical /chat requests arriving together share one agent run, XML build and memory write.
+# Results also serve duplicates that arrive within the window after the run finished.
+chat_flight = SingleFlight(window=float(os.getenv("CHAT_COALESCE_WINDOW", "2.0")))
+
+async def _agent_inputs():
+    llm = (await llm_manager.aget()).get_llm(profile=REACT_LLM_PROFILE)
+    return llm, [await search_tool.aget(), await summarize_tool.aget()]
 
-react_agent = build_react_agent(llm, tools, short_term_memory)
-review_manager = ReviewManager(llm)
-xml_gen = XMLGenerator(xsd_path="agent/schemas/scenario.xsd")
+def _warm_search():
+    tool = search_tool.get()
+    # Loads the collection and the embedding path (tokenizer tables, NumPy matrices) once
+    vector = tool.embedding_function.embed_query("warm-up")
+    if tool.vectorstore.count() > 0:
+        tool.vectorstore.similarity_search_by_vector(vector, k=1)
+
+lifecycle = ServiceLifecycle(
+    steps=[
+        ("xml_schema", xml_gen.get),
+        ("vector_store", _warm_search),
+        ("tokenizer", lambda: TokenCounter().count("warm-up")),
+        ("llm", lambda: summarize_tool.get()),
+        ("memory", lambda: session_store.get()),
+        ("answer_cache", answer_cache.get),
+        ("review_queue", review_queue.get),
+        ("batch_processor", batch_processor.get),
+    ],
+    started_at=IMPORTED_AT,
+    retry_interval=float(os.getenv("WARMUP_RETRY_INTERVAL", "5.0"))
+)
+
+def _close_resources():
+    # Let in-flight reviews land, then flush queued write-behind rows before the pool goes away
+    review_queue.close()
+    memory_manager.close()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    lifecycle.start()
+    try:
+        yield
+    finally:
+        await lifecycle.stop()
+        await asyncio.to_thread(_close_resources)
+
+app = FastAPI(lifespan=lifespan)
+
+# Scrape-time views of the existing runtime stats (skipped until the object exists)
+REGISTRY.gauge_callback(
+    "memory_write_behind_queue_depth", "Rows waiting for the next write-behind flush.",
+    lambda: memory_manager.peek().get_metrics()["queue_depth"]
+)
+REGISTRY.gauge_callback(
+    "chat_coalesced_calls", "/chat calls served by another in-flight or recent run.",
+    lambda: chat_flight.get_metrics()["coalesced"] + chat_flight.get_metrics()["recent_hits"]
+)
+REGISTRY.gauge_callback(
+    "answer_reuse_hit_rate", "Share of answer lookups served from stored answers.",
+    lambda: answer_cache.peek().get_stats()["hit_rate"]
+)
+REGISTRY.gauge_callback(
+    "llm_response_cache_hit_rate", "Hit rate of the cached LLM client (summaries, reviews).",
+    lambda: llm_manager.peek().get_cache_stats().get("hit_rate", 0.0)
+)
+REGISTRY.gauge_callback(
+    "review_queue_pending", "Self-review jobs waiting for a worker.",
+    lambda: review_queue.peek().get_stats().get("pending", 0)
+)
+REGISTRY.gauge_callback(
+    "server_ready", "1 once this worker has finished warming up.",
+    lambda: lifecycle.ready
+)
+REGISTRY.gauge_callback(
+    "server_cold_start_seconds", "Time from import until this worker was ready.",
+    lambda: lifecycle.cold_start_seconds
+)
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """
+    Tag the request with a trace id (X-Request-ID if the caller sent one) that appears in
+    every log line written while serving it, and record the request latency per route.
+    For streaming routes the latency is the time until the response starts.
+    """
+    trace_id = request.headers.get("X-Request-ID") or new_trace_id()
+    token = trace_id_var.set(trace_id)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = trace_id
+        return response
+    finally:
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        HTTP_LATENCY.observe(time.perf_counter() - started, route=route, status=str(status))
+        trace_id_var.reset(token)
 
 class UserQuery(BaseModel):
     query: str
+    session_id: Optional[str] = None
 
-@app.post("/chat")
-def chat_endpoint(payload: UserQuery):
-    user_query = payload.query
-    # ReAct agent call
-    intermediate_response = react_agent(user_query)
+def _reuse_info(hit: dict) -> dict:
+    return {"query": hit["query"], "match": hit["match"], "score": hit["score"]}
+
+async def _store_answer(user_query: str, xml_output: str, reusable: bool):
+    # Answers shaped by earlier turns of a session are kept, but never served to other requests
+    if reusable:
+        await (await answer_cache.aget()).astore(user_query, xml_output)
+    else:
+        await (await memory_manager.aget()).aadd_long_term_memory(key=user_query, value=xml_output)
+
+async def _run_chat(user_query: str, session_memory, reusable: bool) -> dict:
+    llm, tools = await _agent_inputs()
+    react_agent = build_async_react_agent(llm, tools, session_memory, **agent_options)
+
+    # ReAct agent call (LLM and tool calls are awaited, no threadpool worker is held)
+    intermediate_response = await react_agent(user_query)
 
     # Build final XML
     try:
-        xml_output = xml_gen.build_xml(
+        xml_output = (await xml_gen.aget()).build_xml(
             scenario_data=intermediate_response,
             user_requirements=user_query,
             additional_metadata="ReAct-based approach used."
         )
-        # Store in DB
-        memory_manager.add_long_term_memory(key=user_query, value=xml_output)
+    except ValueError as e:
+        return {"answer": intermediate_response, "error": str(e)}
 
-        # Self-Review
-        review_text = review_manager.generate_review(user_query, xml_output)
-        memory_manager.add_long_term_memory(key=f"{user_query}_review", value=review_text)
+    # Store in DB
+    await _store_answer(user_query, xml_output, reusable)
 
-        return {"xml": xml_output, "review": review_text}
-    except ValueError as e:
-        return {"error": str(e)}
+    # Self-Review happens off the request path
+    request_id = uuid.uuid4().hex
+    await asyncio.to_thread((await review_queue.aget()).enqueue, request_id, user_query, xml_output)
+
+    return {
+        "answer": intermediate_response,
+        "request_id": request_id,
+        "xml": xml_output,
+        "review_url": f"/review/{request_id}"
+    }
+
+@app.post("/chat")
+async def chat_endpoint(payload: UserQuery):
+    user_query = payload.query
+    session_id = payload.session_id or uuid.uuid4().hex
+
+    # Bind an agent to this session's short-term memory
+    session_memory = await (await session_store.aget()).aget(session_id, new=payload.session_id is None)
+
+    # Without prior turns the answer only depends on the query, so fresh sessions coalesce
+    # with each other; otherwise only with the same session's duplicates
+    context = session_id if SessionMemoryStore.has_history(session_memory) else ""
+
+    if context == "":
+        # Fast path: a stored answer to the same (or a very similar) question
+        hit = await (await answer_cache.aget()).alookup(user_query)
+        if hit is not None:
+            # Record the answer text, as the agent does for the turns it runs
+            answer = XMLGenerator.scenario_context(hit["xml"])
+            session_memory.save_context({"input": user_query}, {"output": answer})
+            return {"session_id": session_id, "xml": hit["xml"], "reused": _reuse_info(hit)}
+
+    result, shared = await chat_flight.do(
+        (normalize_query(user_query), context),
+        lambda: _run_chat(user_query, session_memory, reusable=context == "")
+    )
+    if shared and context == "":
+        # The agent ran on another session's memory; record the turn in this one too
+        session_memory.save_context({"input": user_query}, {"output": result["answer"]})
+
+    response = {"session_id": session_id, "coalesced": shared}
+    response.update({key: value for key, value in result.items() if key != "answer"})
+    return response
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(payload: UserQuery):
+    """
+    Server-Sent Events variant of /chat. Emits `session`, then `tool_start`/`tool_end`
+    progress and `token` events for the final answer while the agent runs, then `xml`
+    once the output is validated, `review_queued` with the request_id to pass to
+    /review/{request_id}, and finally `done` (or `error`).
+    """
+    user_query = payload.query
+    session_id = payload.session_id or uuid.uuid4().hex
+
+    session_memory = await (await session_store.aget()).aget(session_id, new=payload.session_id is None)
+    reusable = not SessionMemoryStore.has_history(session_memory)
+    llm, tools = await _agent_inputs()
+    react_agent = build_async_react_agent(llm, tools, session_memory, **agent_options)
+
+    async def event_stream():
+        yield format_sse("session", {"session_id": session_id})
+
+        events = AgentEventStream()
+        agent_task = asyncio.create_task(react_agent(user_query, callbacks=[events]))
+        try:
+            async for event in events.iter_events(agent_task):
+                yield format_sse(event["event"], event["data"])
+            intermediate_response = agent_task.result()
+        except Exception as e:
+            yield format_sse("error", {"error": str(e)})
+            return
+        finally:
+            # Also reached when the client disconnects mid-stream
+            if not agent_task.done():
+                agent_task.cancel()
+
+        try:
+            xml_output = (await xml_gen.aget()).build_xml(
+                scenario_data=intermediate_response,
+                user_requirements=user_query,
+                additional_metadata="ReAct-based approach used."
+            )
+        except ValueError as e:
+            yield format_sse("error", {"error": str(e)})
+            return
+        yield format_sse("xml", {"xml": xml_output})
+
+        await _store_answer(user_query, xml_output, reusable)
+        request_id = uuid.uuid4().hex
+        await asyncio.to_thread((await review_queue.aget()).enqueue, request_id, user_query, xml_output)
+        yield format_sse("review_queued", {"request_id": request_id, "review_url": f"/review/{request_id}"})
+        yield format_sse("done", {})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/review/{request_id}")
+async def review_endpoint(request_id: str):
+    """
+    Status of a queued self-review: "pending", "running", "done" (with `review`) or "failed".
+    """
+    job = await asyncio.to_thread((await review_queue.aget()).get, request_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown request_id")
+    return job
+
+class BatchQuery(BaseModel):
+    queries: List[str]
+    # Requests with concurrency < 1 are rejected with a 422
+    concurrency: Optional[int] = Field(None, ge=1)
+    stream: bool = False
+
+@app.post("/chat/batch")
+async def chat_batch_endpoint(payload: BatchQuery):
+    """
+    Run many queries through the /chat pipeline. Duplicate queries run once, at most
+    `concurrency` run at a time, and XML rows and review jobs are written in bulk.
+    With `stream=true` the response is NDJSON: one line per item as it completes, then a
+    `summary` line; otherwise all items are returned in input order.
+    """
+    concurrency = BATCH_DEFAULT_CONCURRENCY if payload.concurrency is None else payload.concurrency
+    concurrency = min(concurrency, BATCH_MAX_CONCURRENCY)
+    runner = (await batch_processor.aget()).runner(concurrency=concurrency)
+
+    if payload.stream:
+        async def ndjson_stream():
+            items = runner.run(payload.queries)
+            try:
+                async for item in items:
+                    yield json.dumps(item) + "\n"
+            finally:
+                # On a disconnect this writes the results already sent instead of leaving it to GC
+                await items.aclose()
+            yield json.dumps({"summary": runner.stats}) + "\n"
+
+        return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson")
+
+    items = [item async for item in runner.run(payload.queries)]
+    items.sort(key=lambda item: item["index"])
+    return {"results": items, "summary": runner.stats}
 
 class FeedbackPayload(BaseModel):
     user_query: str
     feedback_text: str
 
 @app.post("/feedback")
-def feedback_endpoint(payload: FeedbackPayload):
-    memory_manager.store_feedback(payload.user_query, payload.feedback_text)
+async def feedback_endpoint(payload: FeedbackPayload):
+    await (await memory_manager.aget()).astore_feedback(payload.user_query, payload.feedback_text)
     return {"status": "Feedback recorded"}
 
+@app.get("/stats")
+async def stats_endpoint():
+    # Reports only what this worker has created so far
+    answers, llms, memory, reviews, summarizer = (answer_cache.peek(), llm_manager.peek(),
+                                                  memory_manager.peek(), review_queue.peek(),
+                                                  summarize_tool.peek())
+    return {
+        "startup": lifecycle.status(),
+        "chat_coalescing": chat_flight.get_metrics(),
+        "answer_reuse": answers.get_stats() if answers else {},
+        "llm_cache": llms.get_cache_stats() if llms else {},
+        "llm_backends": llms.get_backend_stats() if llms else {},
+        "llm_profiles": llms.get_profile_stats() if llms else {},
+        "memory_write_behind": memory.get_metrics() if memory else {},
+        "review_queue": await asyncio.to_thread(reviews.get_stats) if reviews else {},
+        "summarize_chunk_cache": summarizer.get_cache_stats() if summarizer else {},
+    }
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/healthz")
+async def healthz_endpoint():
+    """
+    Liveness: the worker's event loop is serving requests.
+    """
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz_endpoint():
+    """
+    Readiness: 200 once every warm-up step has succeeded in this worker, 503 until then
+    (with the steps done so far, their timings and the last error of each failing one).
+    """
+    status = lifecycle.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Each worker imports the app and builds its own resources
+    uvicorn.run("server:app", host="0.0.0.0", port=8000, workers=int(os.getenv("WEB_CONCURRENCY", "1")))
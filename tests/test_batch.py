@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("langchain")
+
+from agent.batch import BatchRunner
+
+def _runner(written, write_batch_size=50, write_delay=0.0):
+    async def process(query):
+        await asyncio.sleep(0)
+        return {"xml": f"<{query}/>"}
+
+    async def write(results):
+        await asyncio.sleep(write_delay)
+        written.extend(queries[0] for queries, _ in results)
+
+    return BatchRunner(process, write, concurrency=2, write_batch_size=write_batch_size)
+
+def test_duplicates_run_once_and_results_are_written():
+    written = []
+    runner = _runner(written, write_batch_size=2)
+
+    async def consume():
+        return [item async for item in runner.run(["a", "b", "A ", "c"])]
+
+    items = asyncio.run(consume())
+
+    assert sorted(item["index"] for item in items) == [0, 1, 2, 3]
+    assert sum(item["deduplicated"] for item in items) == 1
+    assert sorted(written) == ["a", "b", "c"]
+    assert runner.stats["unique"] == 3
+
+def test_results_already_yielded_are_written_when_the_consumer_stops():
+    written = []
+    runner = _runner(written)
+
+    async def consume():
+        items = runner.run(["a", "b", "c", "d"])
+        seen = []
+        async for item in items:
+            seen.append(item["query"])
+            if len(seen) == 2:
+                break
+        await items.aclose()
+        return seen
+
+    seen = asyncio.run(consume())
+
+    assert set(seen) <= set(written)
+
+def test_write_survives_cancellation_of_the_consumer():
+    written = []
+    runner = _runner(written, write_delay=0.05)
+
+    async def consume(seen):
+        async for item in runner.run(["a", "b"]):
+            seen.append(item["query"])
+
+    async def main():
+        seen = []
+        task = asyncio.ensure_future(consume(seen))
+        while len(seen) < 2:
+            await asyncio.sleep(0)
+        # The stream is now flushing its final write
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0.1)
+        return seen
+
+    seen = asyncio.run(main())
+
+    assert sorted(written) == sorted(seen) == ["a", "b"]
@@ -0,0 +1,93 @@
+import pytest
+
+from agent import llm_cache
+from agent.llm_cache import CachedLLM, LLMResponseCache
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_cache, "time", clock)
+    return clock
+
+def test_entries_expire_after_ttl(tmp_path, clock):
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite3"), ttl=60)
+    cache.set("k", "response")
+
+    clock.now += 59
+    assert cache.get("k") == "response"
+    clock.now += 2
+    assert cache.get("k") is None
+    assert cache.get_stats()["misses"] == 1
+
+def test_disk_tier_serves_entries_evicted_from_memory(tmp_path, clock):
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite3"), max_memory_entries=1)
+    cache.set("a", "1")
+    cache.set("b", "2")
+
+    assert cache.get("a") == "1"
+    assert cache.get("b") == "2"
+    stats = cache.get_stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["memory_entries"]) == (2, 0, 1)
+
+    # A new instance on the same file starts with an empty memory tier
+    reopened = LLMResponseCache(str(tmp_path / "cache.sqlite3"))
+    assert reopened.get("a") == "1"
+
+def test_disk_pruning_drops_expired_then_least_recently_used(tmp_path, clock):
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite3"), max_memory_entries=1,
+                             max_disk_entries=50, ttl=3600)
+    cache.set("old", "expired")
+    clock.now += 3601
+    for i in range(98):
+        cache.set(f"k{i}", str(i))
+        clock.now += 1
+    # Touch an early key so it outlives later ones
+    assert cache.get("k0") == "0"
+    clock.now += 1
+    cache.set("last", "x")  # the 100th write triggers pruning
+
+    keys = {key for (key,) in cache._db.execute("SELECT cache_key FROM llm_cache;")}
+    assert len(keys) == 50
+    assert "old" not in keys
+    assert {"k0", "last", "k97"} <= keys
+    assert "k1" not in keys
+
+def test_memory_only_cache(clock):
+    cache = LLMResponseCache(sqlite_path=None, max_memory_entries=2)
+    for key in ("a", "b", "c"):
+        cache.set(key, key.upper())
+    assert cache.get("a") is None
+    assert cache.get("c") == "C"
+
+class CountingLLM:
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, text, **kwargs):
+        self.calls.append(text)
+        return f"answer to {text}"
+
+def test_cached_llm_ignores_callbacks_in_the_key(clock):
+    llm = CountingLLM()
+    cached = CachedLLM(llm, LLMResponseCache(sqlite_path=None), {"model": "m", "temperature": 0})
+
+    assert cached.predict("q", callbacks=["handler"]) == "answer to q"
+    assert cached.predict("q") == "answer to q"
+    assert cached.predict("q", bypass_cache=True) == "answer to q"
+    assert llm.calls == ["q", "q"]
+
+def test_cached_llm_batch_only_sends_missing_prompts(clock, monkeypatch):
+    monkeypatch.setattr(llm_cache, "_sends_batches", lambda llm: False)
+    llm = CountingLLM()
+    cached = CachedLLM(llm, LLMResponseCache(sqlite_path=None), {"model": "m"})
+    cached.predict("a")
+
+    assert cached.predict_batch(["a", "b", "c"]) == ["answer to a", "answer to b", "answer to c"]
+    assert sorted(llm.calls) == ["a", "b", "c"]
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("langchain")
+
+from agent.model_router import ModelProfile, ProfileStats, RoutedLLM
+from agent.token_counter import TokenCounter
+
+class FakeClient:
+    def __init__(self, name: str, fail: bool = False):
+        self.name = name
+        self.fail = fail
+        self.prompts = []
+
+    def predict(self, text, stop=None, callbacks=None):
+        self.prompts.append(text)
+        if self.fail:
+            raise RuntimeError(f"{self.name} is down")
+        return f"{self.name}: {text}"
+
+    async def apredict(self, text, stop=None, callbacks=None):
+        return self.predict(text, stop=stop, callbacks=callbacks)
+
+def _routed(small_fails=False, large_fails=False, **profile_options):
+    clients = {"small": FakeClient("small", small_fails), "large": FakeClient("large", large_fails)}
+    profile = ModelProfile("summarize", model="small", escalate_to="large", **profile_options)
+    llm = RoutedLLM(profile=profile, clients=clients, stats=ProfileStats(), token_counter=TokenCounter())
+    return llm, clients
+
+def test_prompts_go_to_the_primary_model():
+    llm, clients = _routed()
+    assert llm.predict("hello") == "small: hello"
+    assert clients["large"].prompts == []
+
+def test_long_prompts_escalate():
+    llm, clients = _routed(max_prompt_tokens=5)
+    long_prompt = "word " * 100
+    assert llm.predict(long_prompt) == f"large: {long_prompt}"
+    assert clients["small"].prompts == []
+    assert llm.stats.snapshot()["summarize"]["escalations"] == 1
+
+def test_failed_primary_call_falls_back_once():
+    llm, clients = _routed(small_fails=True)
+    assert llm.predict("hello") == "large: hello"
+
+    stats = llm.stats.snapshot()["summarize"]
+    assert (stats["calls"], stats["escalations"]) == (1, 1)
+    assert stats["models"]["small"]["errors"] == 1
+    assert stats["models"]["large"]["errors"] == 0
+
+def test_fallback_failure_is_raised():
+    llm, _ = _routed(small_fails=True, large_fails=True)
+    with pytest.raises(RuntimeError, match="large is down"):
+        llm.predict("hello")
+
+def test_no_fallback_when_disabled():
+    llm, clients = _routed(small_fails=True, escalate_on_error=False)
+    with pytest.raises(RuntimeError, match="small is down"):
+        llm.predict("hello")
+    assert clients["large"].prompts == []
+
+def test_generate_falls_back_for_the_whole_group_and_keeps_prompt_order():
+    llm, clients = _routed(small_fails=True, max_prompt_tokens=5)
+    prompts = ["a", "word " * 100, "b"]
+
+    result = llm.generate(prompts)
+
+    assert [g[0].text for g in result.generations] == [f"large: {p}" for p in prompts]
+    assert sorted(clients["large"].prompts) == sorted(prompts)
+
+def test_async_calls_fall_back():
+    llm, _ = _routed(small_fails=True)
+
+    async def main():
+        return await asyncio.gather(llm.apredict("x"), llm.apredict("y"))
+
+    assert asyncio.run(main()) == ["large: x", "large: y"]
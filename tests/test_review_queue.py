@@ -0,0 +1,112 @@
+import threading
+
+import pytest
+
+from agent.review_queue import ReviewQueue
+
+class FakeReviewManager:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.batches = []
+
+    def generate_reviews(self, items):
+        self.batches.append(items)
+        if self.fail:
+            raise RuntimeError("review failed")
+        return [f"review of {query}" for query, _ in items]
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "reviews.sqlite3")
+
+def _queue(db_path, review_manager=None, **kwargs):
+    kwargs.setdefault("workers", 0)
+    return ReviewQueue(review_manager or FakeReviewManager(), db_path=db_path, **kwargs)
+
+def _set(queue, request_id, **columns):
+    assignments = ", ".join(f"{column} = ?" for column in columns)
+    queue._db.execute(f"UPDATE review_jobs SET {assignments} WHERE request_id = ?;", (*columns.values(), request_id))
+    queue._db.commit()
+
+def test_worker_reviews_queued_jobs(db_path):
+    queue = _queue(db_path, workers=1, poll_interval=0.05)
+    try:
+        queue.enqueue("r1", "query one", "<xml/>")
+        job = queue.wait("r1", timeout=5)
+        assert job["status"] == "done"
+        assert job["review"] == "review of query one"
+        assert job["attempts"] == 1
+    finally:
+        queue.close()
+
+def test_queues_sharing_a_database_never_claim_the_same_job(db_path):
+    first, second = _queue(db_path, batch_size=3), _queue(db_path, batch_size=3)
+    first.enqueue_many([(f"r{i}", f"q{i}", "<xml/>") for i in range(20)])
+
+    claimed, barrier = [], threading.Barrier(2)
+
+    def drain(queue):
+        barrier.wait()
+        while True:
+            jobs = queue._claim()
+            if not jobs:
+                return
+            claimed.extend(job[0] for job in jobs)
+
+    threads = [threading.Thread(target=drain, args=(q,)) for q in (first, second)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(claimed) == sorted(f"r{i}" for i in range(20))
+    first.close()
+    second.close()
+
+def test_starting_a_queue_leaves_other_owners_running_jobs_alone(db_path):
+    first = _queue(db_path)
+    first.enqueue("r1", "q1", "<xml/>")
+    assert [job[0] for job in first._claim()] == ["r1"]
+
+    second = _queue(db_path)
+    assert second.get("r1")["status"] == "running"
+    assert second._claim() == []
+
+    # Once the first owner's lease runs out, the job is claimed again
+    _set(second, "r1", lease_expires=0)
+    assert [job[0] for job in second._claim()] == ["r1"]
+    assert second.get("r1")["attempts"] == 2
+
+    # The first owner's late result no longer applies to the job
+    first._process([("r1", "q1", "<xml/>", 0)])
+    assert second.get("r1")["status"] == "running"
+    first.close()
+    second.close()
+
+def test_failed_jobs_are_retried_with_backoff_then_marked_failed(db_path):
+    manager = FakeReviewManager(fail=True)
+    queue = _queue(db_path, manager, max_attempts=2)
+    queue.enqueue("r1", "q1", "<xml/>")
+
+    queue._process(queue._claim())
+    job = queue.get("r1")
+    assert (job["status"], job["attempts"], job["error"]) == ("pending", 1, "review failed")
+    # Backing off: not claimable yet
+    assert queue._claim() == []
+
+    _set(queue, "r1", available_at=0)
+    queue._process(queue._claim())
+    assert queue.get("r1")["status"] == "failed"
+    assert len(manager.batches) == 2
+    queue.close()
+
+def test_job_whose_lease_keeps_expiring_is_failed(db_path):
+    queue = _queue(db_path, max_attempts=1)
+    queue.enqueue("r1", "q1", "<xml/>")
+    queue._claim()
+    _set(queue, "r1", lease_expires=0)
+
+    assert queue._claim() == []
+    assert queue.get("r1")["status"] == "failed"
+    assert queue.get("r1")["error"] == "lease expired"
+    queue.close()
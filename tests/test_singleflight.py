@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from agent.singleflight import SingleFlight
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*(flight.do("key", compute) for _ in range(5)))
+
+    results = asyncio.run(main())
+
+    assert [result for result, _ in results] == ["result"] * 5
+    assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+    assert len(calls) == 1
+    metrics = flight.get_metrics()
+    assert (metrics["executions"], metrics["coalesced"], metrics["inflight"]) == (1, 4, 0)
+
+def test_different_keys_run_separately():
+    flight = SingleFlight()
+
+    async def main():
+        return await asyncio.gather(flight.do("a", lambda: asyncio.sleep(0, "A")),
+                                    flight.do("b", lambda: asyncio.sleep(0, "B")))
+
+    assert asyncio.run(main()) == [("A", False), ("B", False)]
+
+def test_waiters_get_the_same_exception_and_it_is_not_remembered():
+    flight = SingleFlight(window=60.0)
+    calls = []
+
+    async def fail():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        results = await asyncio.gather(flight.do("k", fail), flight.do("k", fail), return_exceptions=True)
+        with pytest.raises(ValueError):
+            await flight.do("k", fail)
+        return results
+
+    results = asyncio.run(main())
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert len(calls) == 2
+    assert flight.get_metrics()["errors"] == 2
+
+def test_window_reuses_a_recent_result():
+    flight = SingleFlight(window=60.0)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return len(calls)
+
+    async def main():
+        first = await flight.do("k", compute)
+        second = await flight.do("k", compute)
+        return first, second
+
+    assert asyncio.run(main()) == ((1, False), (1, True))
+    assert flight.get_metrics()["recent_hits"] == 1
+
+def test_cancelled_caller_does_not_cancel_the_shared_run():
+    flight = SingleFlight()
+
+    async def compute():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def main():
+        leaver = asyncio.ensure_future(flight.do("k", compute))
+        stayer = asyncio.ensure_future(flight.do("k", compute))
+        await asyncio.sleep(0)
+        leaver.cancel()
+        return await stayer
+
+    assert asyncio.run(main()) == ("done", True)
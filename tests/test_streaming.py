@@ -0,0 +1,34 @@
+import pytest
+
+pytest.importorskip("langchain")
+
+from agent.custom_agent import FinalAnswerStreamer
+from agent.streaming import format_sse
+
+def _stream(tokens):
+    streamer = FinalAnswerStreamer()
+    return [streamer.feed(token) for token in tokens]
+
+def test_nothing_is_streamed_before_the_marker():
+    assert _stream(["Thought: I", " should search", "\nAction: rag"]) == ["", "", ""]
+
+def test_answer_follows_a_marker_split_across_tokens():
+    out = _stream(["Thought: done\nFinal", " Ans", "wer", ":", " The", " scenario", " is ready."])
+    assert "".join(out) == "The scenario is ready."
+    assert out[:4] == ["", "", "", ""]
+
+def test_text_in_the_same_token_as_the_marker_is_kept():
+    assert "".join(_stream(["Final Answer:  Hello", " world"])) == "Hello world"
+
+def test_leading_whitespace_is_dropped_even_across_tokens():
+    assert _stream(["Final Answer:", " ", "\n", "Hi", " there"]) == ["", "", "", "Hi", " there"]
+
+def test_reset_starts_a_new_generation():
+    streamer = FinalAnswerStreamer()
+    streamer.feed("Final Answer: first")
+    streamer.reset()
+    assert streamer.feed("Thought: again") == ""
+    assert streamer.feed("Final Answer: second") == "second"
+
+def test_format_sse():
+    assert format_sse("token", {"text": "hi"}) == 'event: token\ndata: {"text": "hi"}\n\n'
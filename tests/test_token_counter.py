@@ -0,0 +1,56 @@
+import sys
+import types
+
+import pytest
+
+from agent.token_counter import TokenCounter
+
+def test_falls_back_when_the_encoding_cannot_be_loaded(monkeypatch):
+    def offline(name):
+        raise ConnectionError("cannot download cl100k_base")
+
+    fake = types.SimpleNamespace(encoding_for_model=offline, get_encoding=offline)
+    monkeypatch.setitem(sys.modules, "tiktoken", fake)
+
+    counter = TokenCounter()
+
+    assert counter._encoding is None
+    assert counter.count("x" * 40) == 10
+
+def _char_counter():
+    counter = TokenCounter()
+    counter._encoding = None
+    return counter
+
+def test_split_does_not_emit_a_remainder_inside_the_overlap():
+    text = "".join(chr(ord("a") + i % 26) for i in range(15300))
+
+    chunks = _char_counter().split(text, chunk_tokens=2000, overlap_tokens=100)
+
+    assert [len(c) for c in chunks] == [8000, 7700]
+    assert chunks[0][-400:] == chunks[1][:400]
+    assert chunks[1] == text[7600:]
+
+def test_split_covers_the_text_when_the_remainder_exceeds_the_overlap():
+    text = "x" * 16000
+
+    chunks = _char_counter().split(text, chunk_tokens=2000, overlap_tokens=100)
+
+    assert [len(c) for c in chunks] == [8000, 8000, 800]
+
+def test_split_short_and_empty_text():
+    counter = _char_counter()
+    assert counter.split("short", chunk_tokens=10, overlap_tokens=2) == ["short"]
+    assert counter.split("", chunk_tokens=10) == []
+
+def test_split_with_tiktoken():
+    counter = TokenCounter()
+    if counter._encoding is None:
+        pytest.skip("tiktoken encoding not available")
+    text = " ".join(f"word{i}" for i in range(3000))
+
+    chunks = counter.split(text, chunk_tokens=1000, overlap_tokens=100)
+
+    assert all(counter.count(c) <= 1000 for c in chunks)
+    assert chunks[-1].endswith("word2999")
+    assert not chunks[-2].endswith("word2999")
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("langchain")
+
+from agent.vector_store import CollectionVersion, NumpyVectorStore
+
+def _vectors(n, dimension=16, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dimension)).astype(np.float32)
+
+def _fill(store, n, dimension=16):
+    vectors = _vectors(n, dimension)
+    ids = [f"doc-{i}" for i in range(n)]
+    store.upsert(ids, vectors, [f"text {i}" for i in range(n)], [{"i": i} for i in range(n)])
+    return ids, vectors
+
+def test_delete_hides_rows_from_search(tmp_path):
+    store = NumpyVectorStore("c", str(tmp_path))
+    ids, vectors = _fill(store, 20)
+    store.delete(ids[:5])
+
+    assert store.count() == 15
+    assert store.existing_ids(ids[:7]) == set(ids[5:7])
+    for doc in store.similarity_search_by_vector(vectors[0], k=20):
+        assert doc.metadata["i"] >= 5
+
+def test_optimize_compacts_deleted_rows(tmp_path):
+    store = NumpyVectorStore("c", str(tmp_path))
+    ids, vectors = _fill(store, 20)
+    store.delete(ids[::2])
+    before = CollectionVersion("c", str(tmp_path)).current()
+
+    store.optimize()
+
+    assert store._meta["size"] == 10
+    assert CollectionVersion("c", str(tmp_path)).current() != before
+    assert store.existing_ids(ids) == set(ids[1::2])
+    assert store.similarity_search_by_vector(vectors[3], k=1)[0].page_content == "text 3"
+
+    # A fresh reader sees the compacted files
+    reopened = NumpyVectorStore("c", str(tmp_path))
+    assert reopened.count() == 10
+    assert reopened.similarity_search_by_vector(vectors[7], k=1)[0].metadata == {"i": 7}
+
+    # New rows go after the compacted ones
+    store.upsert(["new"], _vectors(1, seed=1), ["new text"], [{}])
+    assert store._meta["size"] == 11
+    assert store.similarity_search_by_vector(_vectors(1, seed=1)[0], k=1)[0].page_content == "new text"
+
+def test_optimize_leaves_few_deletions_in_place(tmp_path):
+    store = NumpyVectorStore("c", str(tmp_path))
+    ids, _ = _fill(store, 20)
+    store.delete(ids[:1])
+
+    store.optimize(compact_threshold=0.1)
+
+    assert store._meta["size"] == 20
+    assert store.count() == 19
+
+def test_ivf_search_probes_only_its_clusters(tmp_path):
+    store = NumpyVectorStore("c", str(tmp_path), nprobe=2, ivf_min_size=50)
+    ids, vectors = _fill(store, 200)
+    store.delete(ids[:100])
+    store.optimize(n_clusters=8)
+
+    assert store._meta["size"] == 100
+    lists = store._inverted_lists(store._meta["size"])
+    assert sorted(np.concatenate(lists).tolist()) == list(range(100))
+    for i in (100, 150, 199):
+        assert store.similarity_search_by_vector(vectors[i], k=1)[0].metadata == {"i": i}
+
+    store.delete([ids[150]])
+    assert all(doc.metadata["i"] != 150 for doc in store.similarity_search_by_vector(vectors[150], k=10))